@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Reusable client for the Alpaca market data bars endpoint.
+
+Keeps one keep-alive HTTP session with credentials loaded once, requests
+many symbols per call through the comma-separated `symbols` parameter and
+follows `next_page_token` until the range is complete, so long histories
+are no longer cut off at `limit=10000` bars.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+
+ALPACA_BARS_URL = "https://data.alpaca.markets/v2/stocks/bars"
+
+BAR_COLUMNS = {
+    'o': 'open',
+    'h': 'high',
+    'l': 'low',
+    'c': 'close',
+    'v': 'volume',
+    't': 'timestamp'
+}
+
+
+@lru_cache(maxsize=None)
+def load_credentials(config_path='config.json'):
+    """Load Alpaca key/secret from config.json once per process."""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    return config['ALPACA_KEY'], config['ALPACA_SECRET']
+
+
+def format_time(value, default):
+    """
+    Format a datetime or ISO-8601 string (with or without UTC offset) as the
+    UTC timestamp Alpaca expects.
+    """
+    ts = pd.Timestamp(default if value is None else value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC')
+    return ts.strftime("%Y-%m-%dT%H:%M:00Z")
+
+
+class AlpacaBarsClient:
+    """
+    Pooled, paginated, multi-symbol client for /v2/stocks/bars.
+
+    Args:
+        config_path (str): Path to config.json with ALPACA_KEY / ALPACA_SECRET
+        feed (str): Data feed ('sip' or 'iex')
+        adjustment (str): Corporate action adjustment ('raw', 'split', 'dividend', 'all')
+        batch_size (int): Maximum symbols per request
+        max_retries (int): Retries on HTTP 429 / 5xx responses
+    """
+
+    def __init__(self, config_path='config.json', feed='sip', adjustment='all',
+                 batch_size=100, max_retries=5):
+        self.feed = feed
+        self.adjustment = adjustment
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+        key, secret = load_credentials(config_path)
+        self.session = requests.Session()
+        self.session.headers.update({
+            "accept": "application/json",
+            "APCA-API-KEY-ID": key,
+            "APCA-API-SECRET-KEY": secret
+        })
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+
+    def _get(self, params):
+        """GET one page, backing off on rate limiting and server errors."""
+        for attempt in range(self.max_retries + 1):
+            response = self.session.get(ALPACA_BARS_URL, params=params, timeout=30)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code in (429, 500, 502, 503, 504) and attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After')
+                time.sleep(float(retry_after) if retry_after else 2 ** attempt)
+                continue
+            raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+
+    def get_bars(self, symbols, start_time=None, end_time=None, timeframe='1Day'):
+        """
+        Fetch bars for many symbols, following pagination to the end of the range.
+
+        Args:
+            symbols (list): Stock symbols
+            start_time (datetime or str, optional): Start time (default: one year ago)
+            end_time (datetime or str, optional): End time (default: now)
+            timeframe (str): Alpaca timeframe ('1Min', '1Hour', '1Day', ...)
+
+        Returns:
+            dict: symbol -> DataFrame with columns [open, high, low, close, volume, timestamp];
+                  symbols without bars are omitted
+        """
+        start = format_time(start_time, datetime.now() - timedelta(days=365))
+        end = format_time(end_time, datetime.now())
+        symbols = list(dict.fromkeys(symbols))
+
+        raw_bars = {}
+        for i in range(0, len(symbols), self.batch_size):
+            batch = symbols[i:i + self.batch_size]
+            params = {
+                "symbols": ",".join(batch),
+                "timeframe": timeframe,
+                "start": start,
+                "end": end,
+                "limit": 10000,
+                "adjustment": self.adjustment,
+                "feed": self.feed,
+                "sort": "asc"
+            }
+            while True:
+                data = self._get(params)
+                for symbol, bars in (data.get('bars') or {}).items():
+                    raw_bars.setdefault(symbol, []).extend(bars)
+                page_token = data.get('next_page_token')
+                if not page_token:
+                    break
+                params["page_token"] = page_token
+
+        frames = {}
+        for symbol, bars in raw_bars.items():
+            if not bars:
+                continue
+            df = pd.DataFrame(bars).rename(columns=BAR_COLUMNS)
+            df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+            frames[symbol] = df[['open', 'high', 'low', 'close', 'volume', 'timestamp']]
+        return frames
+
+
+_default_client = None
+
+
+def get_default_client():
+    """Return the process-wide AlpacaBarsClient."""
+    global _default_client
+    if _default_client is None:
+        _default_client = AlpacaBarsClient()
+    return _default_client
@@ -9,10 +9,8 @@ matplotlib.use('Agg')  # Use non-interactive backend to prevent windows from ope
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import requests
 import json
 from datetime import datetime, timedelta
-import time
 from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
@@ -25,6 +23,7 @@ from plotly.subplots import make_subplots
 # Import your existing Alpaca functions
 from getBars import getBars
 from helperMethods import getTradingDays, calculateDrift
+from bar_providers import get_provider
 
 def load_config():
     """Load Alpaca configuration from config.json"""
@@ -37,6 +36,10 @@ def getDailyBarAttributes(ticker, start_time=None, end_time=None):
     Fetches daily bar attributes for a given stock ticker from the Alpaca API.
     Based on the user's proven Alpaca data fetching methods.
     
+    Uses the Alpaca bar provider (pooled session, cached credentials,
+    full pagination) unless BAR_PROVIDER selects another source; see
+    bar_providers.py.
+    
     Args:
         ticker (str): The stock ticker symbol to retrieve bar data for.
         start_time (datetime or str, optional): The start time for the bar data.
@@ -45,81 +48,28 @@ def getDailyBarAttributes(ticker, start_time=None, end_time=None):
     Returns:
         pandas.DataFrame: DataFrame with columns [open, high, low, close, volume, timestamp]
     """
-    config = load_config()
+    bars = fetch_bar_attributes([ticker], start_time, end_time)
     
-    url = "https://data.alpaca.markets/v2/stocks/bars"
+    if ticker not in bars:
+        raise Exception(f"No bar data available for {ticker}")
     
-    # Handle start_time
+    return bars[ticker]
+
+def fetch_bar_attributes(tickers, start_time=None, end_time=None):
+    """
+    Fetch daily bars for several tickers in as few provider requests as possible.
+    
+    Returns:
+        dict: ticker -> DataFrame with columns [open, high, low, close, volume, timestamp]
+    """
     if start_time is None:
         start_time = datetime.now() - timedelta(days=365)
-    elif isinstance(start_time, str):
-        time_part, offset = start_time.rsplit('-', 1)
-        if ':' in offset:
-            hours, minutes = map(int, offset.split(':'))
-            offset_minutes = hours * 60 + minutes
-        else:
-            offset_minutes = int(offset) * 60
-        start_time = datetime.fromisoformat(time_part)
-        start_time = start_time + timedelta(minutes=offset_minutes)
-
-    # Handle end_time
     if end_time is None:
         end_time = datetime.now()
-    elif isinstance(end_time, str):
-        time_part, offset = end_time.rsplit('-', 1)
-        if ':' in offset:
-            hours, minutes = map(int, offset.split(':'))
-            offset_minutes = hours * 60 + minutes
-        else:
-            offset_minutes = int(offset) * 60
-        end_time = datetime.fromisoformat(time_part)
-        end_time = end_time + timedelta(minutes=offset_minutes)
-    
-    params = {
-        "symbols": ticker,
-        "timeframe": "1Day",
-        "start": start_time.strftime("%Y-%m-%dT%H:%M:00Z"),
-        "end": end_time.strftime("%Y-%m-%dT%H:%M:00Z"),
-        "limit": 10000,
-        "adjustment": "all",
-        "feed": "sip",
-        "sort": "asc"
-    }
-    
-    headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": config['ALPACA_KEY'],
-        "APCA-API-SECRET-KEY": config['ALPACA_SECRET']
-    }
-    
-    response = requests.get(url, headers=headers, params=params)
-    
-    if response.status_code != 200:
-        raise Exception(f"API request failed with status {response.status_code}: {response.text}")
-    
-    data = response.json()
-    
-    if not data.get('bars') or not data['bars'].get(ticker) or len(data['bars'][ticker]) == 0:
-        raise Exception(f"No bar data available for {ticker}")
-    
-    # Convert to DataFrame
-    bars = data['bars'][ticker]
-    df = pd.DataFrame(bars)
-    
-    # Rename columns to match previous format
-    df = df.rename(columns={
-        'o': 'open',
-        'h': 'high',
-        'l': 'low',
-        'c': 'close',
-        'v': 'volume',
-        't': 'timestamp'
-    })
-    
-    # Reorder columns to match previous format
-    df = df[['open', 'high', 'low', 'close', 'volume', 'timestamp']]
-    
-    return df
+    bars = get_provider(default='alpaca').fetch_many(tickers, start_time, end_time)
+    return {ticker: df.rename_axis('timestamp').reset_index()[
+                ['open', 'high', 'low', 'close', 'volume', 'timestamp']]
+            for ticker, df in bars.items()}
 
 class NonlinearBetaAnalyzer:
     """
@@ -147,32 +97,25 @@ class NonlinearBetaAnalyzer:
         
         print(f"Fetching data for {len(stock_symbols)} stocks and market index...")
         
-        # Fetch market data (SPY as proxy)
-        print("Fetching market data (SPY)...")
+        # Market (SPY as proxy) and stocks in as few paginated requests as possible
         try:
-            self.market_data = getDailyBarAttributes('SPY', start_date, end_date)
-            print(f"✓ Market data: {len(self.market_data)} days")
+            bars = fetch_bar_attributes(['SPY'] + list(stock_symbols), start_date, end_date)
         except Exception as e:
-            print(f"Error fetching market data: {e}")
+            print(f"Error fetching data: {e}")
             return
         
-        # Fetch stock data
+        if 'SPY' not in bars:
+            print("Error fetching market data: No bar data available for SPY")
+            return
+        self.market_data = bars['SPY']
+        print(f"✓ Market data: {len(self.market_data)} days")
+        
         for symbol in stock_symbols:
-            try:
-                print(f"Fetching data for {symbol}...")
-                stock_data = getDailyBarAttributes(symbol, start_date, end_date)
-                
-                if not stock_data.empty:
-                    self.stock_data[symbol] = stock_data
-                    print(f"✓ {symbol}: {len(stock_data)} days of data")
-                else:
-                    print(f"✗ {symbol}: No data available")
-                    
-                # Add small delay to avoid rate limiting
-                time.sleep(0.1)
-                
-            except Exception as e:
-                print(f"✗ {symbol}: Error fetching data - {e}")
+            if symbol in bars and not bars[symbol].empty:
+                self.stock_data[symbol] = bars[symbol]
+                print(f"✓ {symbol}: {len(bars[symbol])} days of data")
+            else:
+                print(f"✗ {symbol}: No data available")
         
         print(f"Data collection complete. Market: {len(self.market_data)} days")
         
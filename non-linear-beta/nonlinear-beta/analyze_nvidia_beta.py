@@ -4,8 +4,9 @@ Analyze why NVIDIA's beta is only 1.7 - investigate different periods.
 """
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 import pandas as pd
+from rolling_beta import MomentPrefixSums
 
 def analyze_nvidia_beta_periods():
     """Analyze NVIDIA beta across different time periods."""
@@ -14,8 +15,8 @@ def analyze_nvidia_beta_periods():
     print("="*50)
     
     # Get full period data
-    nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-    spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+    nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+    spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
     
     print(f"NVIDIA price journey:")
     print(f"2015: ${nvda['Close'].iloc[0]:.2f}")
@@ -45,32 +46,23 @@ def analyze_nvidia_beta_periods():
     print(f"{'Period':<25} {'Beta':<6} {'Corr':<6} {'NVDA Vol':<9} {'SPY Vol':<8} {'Days':<5}")
     print("-" * 80)
     
+    # Moments are accumulated once over the full download; every period is
+    # then two prefix-sum lookups instead of a fresh download (rolling_beta.py)
+    prefix = MomentPrefixSums.from_closes({'NVDA': nvda['Close']}, spy['Close'])
+    
     for start, end, label in periods:
         try:
-            nvda_period = yf.download('NVDA', start=start, end=end, progress=False, auto_adjust=False)
-            spy_period = yf.download('SPY', start=start, end=end, progress=False, auto_adjust=False)
+            moments = prefix.moments(start, end)
+            days = int(moments.n[0, 0])
             
-            if len(nvda_period) > 50:
-                nvda_ret = nvda_period['Close'].pct_change().dropna().values
-                spy_ret = spy_period['Close'].pct_change().dropna().values
-                
-                min_len = min(len(nvda_ret), len(spy_ret))
-                nvda_ret = nvda_ret[:min_len]
-                spy_ret = spy_ret[:min_len]
+            if days > 50:
+                beta = moments.beta()[0, 0]
+                corr = moments.correlation()[0, 0]
                 
-                # Remove any NaN values
-                mask = ~(np.isnan(nvda_ret) | np.isnan(spy_ret))
-                nvda_clean = nvda_ret[mask]
-                spy_clean = spy_ret[mask]
+                nvda_vol = np.sqrt(moments.stock_variance(ddof=0)[0, 0]) * np.sqrt(252) * 100
+                spy_vol = np.sqrt(moments.market_variance(ddof=0)[0, 0]) * np.sqrt(252) * 100
                 
-                if len(nvda_clean) > 50:
-                    beta = np.cov(nvda_clean, spy_clean)[0,1] / np.var(spy_clean)
-                    corr = np.corrcoef(nvda_clean, spy_clean)[0,1]
-                    
-                    nvda_vol = np.std(nvda_clean) * np.sqrt(252) * 100
-                    spy_vol = np.std(spy_clean) * np.sqrt(252) * 100
-                    
-                    print(f"{label:<25} {beta:<6.2f} {corr:<6.3f} {nvda_vol:<9.0f}% {spy_vol:<8.0f}% {len(nvda_clean):<5}")
+                print(f"{label:<25} {beta:<6.2f} {corr:<6.3f} {nvda_vol:<9.0f}% {spy_vol:<8.0f}% {days:<5}")
                 
         except Exception as e:
             print(f"{label:<25} Error: {str(e)[:30]}")
@@ -91,7 +83,7 @@ def analyze_nvidia_beta_periods():
     # Compare with a different market index
     print(f"\nCOMPARING TO NASDAQ (tech-heavy index):")
     try:
-        qqq = yf.download('QQQ', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+        qqq = download('QQQ', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
         nvda_ret_full = nvda['Close'].pct_change().dropna().values
         qqq_ret = qqq['Close'].pct_change().dropna().values
         
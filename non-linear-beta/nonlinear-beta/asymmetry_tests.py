@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Time-series significance of beta asymmetry for every stock at once.
+
+Each stock gets the piecewise-linear (Henriksson-Merton style) regression
+
+    r_stock = alpha + beta+ * max(r_market, 0) + beta- * min(r_market, 0) + e
+
+i.e. the market return plus its interaction with the down-market dummy,
+with one intercept shared by both regimes. The regressors depend only on
+the date, so every stock's 3 x 3 normal equations are masked matrix
+products over the same design (one GEMM for X'X, one for X'y) and all
+systems are solved as one stacked batch.
+
+Standard errors are Newey-West HAC: the lag-l autocovariance terms of the
+scores are again one GEMM per lag for the whole block. The Wald statistic
+of beta+ = beta- is chi-squared with one degree of freedom, and
+Benjamini-Hochberg q-values control the false discovery rate across the
+universe.
+
+Usage:
+    python asymmetry_tests.py                  # stocks of returns_matrix.bin
+    python asymmetry_tests.py path/to/matrix   # another returns matrix
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from beta_engine import BLOCK_SIZE, MIN_OBSERVATIONS, MIN_REGIME_DAYS
+from returns_matrix import DEFAULT_MATRIX_PATH, open_returns_matrix
+
+ASYMMETRY_RESULTS_PATH = 'sp500_asymmetry_tests.csv'
+
+# Coefficients of the piecewise regression, in design-column order
+COEFFICIENTS = ('alpha', 'positive_beta', 'negative_beta')
+
+
+def newey_west_lags(n_observations):
+    """Newey-West (1994) rule-of-thumb bandwidth: floor(4 * (T / 100) ** (2 / 9))."""
+    return int(np.floor(4 * (n_observations / 100.0) ** (2.0 / 9.0)))
+
+
+def _design(market):
+    """Dates x 3 design [1, max(x, 0), min(x, 0)] with zero rows where the market is missing."""
+    valid = np.isfinite(market)
+    x = np.where(valid, market, 0.0)
+    design = np.column_stack([valid.astype(np.float64), np.maximum(x, 0.0), np.minimum(x, 0.0)])
+    return design, valid
+
+
+def piecewise_regression(returns, market, mask=None, lags=None, min_observations=MIN_OBSERVATIONS,
+                         min_regime_days=MIN_REGIME_DAYS, small_sample=True, block_size=BLOCK_SIZE):
+    """
+    Piecewise regression with HAC standard errors for every column of returns.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        lags (int, optional): Newey-West lags (default: newey_west_lags(dates))
+        min_observations (int): Minimum common dates for a fit
+        min_regime_days (int): Each regime needs more than this many days
+        small_sample (bool): Scale the covariance by n / (n - 3)
+        block_size (int): Symbols processed per block
+
+    Returns:
+        dict: Arrays of length n_symbols: 'alpha', 'positive_beta', 'negative_beta',
+              their HAC standard errors ('alpha_se', ...), 'beta_difference',
+              'difference_se', 'wald_statistic', 'p_value' (NaN where the fit is
+              undefined), 'data_points', 'positive_days', 'negative_days'
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    n_dates, n_symbols = returns.shape
+    if lags is None:
+        lags = newey_west_lags(n_dates)
+
+    design, market_valid = _design(market)
+    outer = (design[:, :, None] * design[:, None, :]).reshape(n_dates, 9)
+    lagged_outer = [(design[l:, :, None] * design[:-l, None, :]).reshape(n_dates - l, 9)
+                    for l in range(1, lags + 1)]
+    regimes = np.column_stack([market_valid, market > 0, market < 0]).astype(np.float64)
+
+    coef = np.full((n_symbols, 3), np.nan)
+    covariance = np.full((n_symbols, 3, 3), np.nan)
+    counts = np.zeros((n_symbols, 3))
+
+    for lo in range(0, n_symbols, block_size):
+        hi = min(lo + block_size, n_symbols)
+        block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+        valid = np.isfinite(block) & market_valid[:, None]
+        if mask is not None:
+            valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+        weights = valid.astype(np.float64)
+        y = np.where(valid, block, 0.0)
+
+        # Stacked normal equations: X'X and X'y of every stock
+        xtx = (weights.T @ outer).reshape(-1, 3, 3)
+        xty = y.T @ design
+        n = weights.T @ regimes
+        counts[lo:hi] = n
+
+        ok = ((n[:, 0] >= min_observations) & (n[:, 1] > min_regime_days)
+              & (n[:, 2] > min_regime_days))
+        ok &= np.abs(np.linalg.det(np.where(ok[:, None, None], xtx, np.eye(3)))) > 0
+        if not ok.any():
+            continue
+        xtx_inv = np.linalg.inv(np.where(ok[:, None, None], xtx, np.eye(3)))
+        beta = np.einsum('sij,sj->si', xtx_inv, xty)
+
+        # Newey-West meat from the residual scores
+        residuals = np.where(valid, y - design @ beta.T, 0.0)
+        meat = ((residuals * residuals).T @ outer).reshape(-1, 3, 3)
+        for l in range(1, lags + 1):
+            weight = 1.0 - l / (lags + 1.0)
+            cross = ((residuals[l:] * residuals[:-l]).T @ lagged_outer[l - 1]).reshape(-1, 3, 3)
+            meat += weight * (cross + cross.transpose(0, 2, 1))
+
+        cov = xtx_inv @ meat @ xtx_inv
+        if small_sample:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cov *= (n[:, 0] / (n[:, 0] - 3))[:, None, None]
+
+        coef[lo:hi][ok] = beta[ok]
+        covariance[lo:hi][ok] = cov[ok]
+
+    standard_errors = np.sqrt(np.maximum(np.diagonal(covariance, axis1=1, axis2=2), 0.0))
+    difference = coef[:, 1] - coef[:, 2]
+    difference_variance = covariance[:, 1, 1] + covariance[:, 2, 2] - 2.0 * covariance[:, 1, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wald = np.where(difference_variance > 0, difference * difference / difference_variance, np.nan)
+    p_value = stats.chi2.sf(wald, 1)
+
+    results = {name: coef[:, i] for i, name in enumerate(COEFFICIENTS)}
+    results.update({f'{name}_se': standard_errors[:, i] for i, name in enumerate(COEFFICIENTS)})
+    results.update({
+        'beta_difference': difference,
+        'difference_se': np.sqrt(np.maximum(difference_variance, 0.0)),
+        'wald_statistic': wald,
+        'p_value': p_value,
+        'data_points': counts[:, 0].astype(np.int64),
+        'positive_days': counts[:, 1].astype(np.int64),
+        'negative_days': counts[:, 2].astype(np.int64)
+    })
+    return results
+
+
+def benjamini_hochberg(p_values, alpha=0.05):
+    """
+    Benjamini-Hochberg adjusted p-values (q-values) and rejections.
+
+    Args:
+        p_values (numpy.ndarray): P-values; NaN entries are ignored
+        alpha (float): False discovery rate
+
+    Returns:
+        tuple: (q_values, reject) arrays, NaN / False where the p-value is NaN
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q_values = np.full(p_values.shape, np.nan)
+    tested = np.flatnonzero(np.isfinite(p_values))
+    m = len(tested)
+    if m == 0:
+        return q_values, np.zeros(p_values.shape, dtype=bool)
+
+    order = tested[np.argsort(p_values[tested], kind='mergesort')]
+    ranked = p_values[order] * m / np.arange(1, m + 1)
+    # q_(i) = min over j >= i of p_(j) * m / j
+    q_values[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    reject = np.zeros(p_values.shape, dtype=bool)
+    reject[tested] = q_values[tested] <= alpha
+    return q_values, reject
+
+
+def asymmetry_tests_from_matrix(matrix, symbols=None, alpha=0.05, **kwargs):
+    """
+    Piecewise-regression asymmetry tests for the stocks of a ReturnsMatrix.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix with a market column
+        symbols (list, optional): Stocks to test (default: all stocks)
+        alpha (float): False discovery rate for the 'significant' column
+        **kwargs: Passed to piecewise_regression
+
+    Returns:
+        pandas.DataFrame: One row per stock with the piecewise_regression
+            columns plus 'q_value' and 'significant'
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    results = piecewise_regression(returns, market, mask=mask, **kwargs)
+    q_values, reject = benjamini_hochberg(results['p_value'], alpha)
+    results['q_value'] = q_values
+    results['significant'] = reject
+    return pd.DataFrame(results, index=pd.Index(symbols, name='symbol'))
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MATRIX_PATH
+    matrix = open_returns_matrix(path)
+    if matrix is None:
+        return
+
+    start = time.perf_counter()
+    df = asymmetry_tests_from_matrix(matrix)
+    elapsed = time.perf_counter() - start
+
+    tested = df['p_value'].notna()
+    print(f"Tested {tested.sum()} of {len(df)} stocks in {elapsed:.2f}s "
+          f"({newey_west_lags(len(matrix.dates))} Newey-West lags)")
+    print(f"Significant at 5% (unadjusted): {(df['p_value'] < 0.05).sum()}")
+    print(f"Significant at 5% FDR (Benjamini-Hochberg): {df['significant'].sum()}")
+
+    df.to_csv(ASYMMETRY_RESULTS_PATH)
+    print(f"Results saved to '{ASYMMETRY_RESULTS_PATH}'")
+
+
+if __name__ == "__main__":
+    main()
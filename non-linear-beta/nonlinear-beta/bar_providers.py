@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Pluggable bar providers.
+
+Every script gets its bars through a provider rather than calling yfinance
+or Alpaca directly, so the data source can be switched without touching the
+analysis code:
+
+    BAR_PROVIDER=synthetic python sp500_optimized_analysis.py
+
+Providers:
+    yfinance   Yahoo Finance via yf.download (default)
+    alpaca     Alpaca market data via alpaca_client.AlpacaBarsClient
+    synthetic  Seeded, offline OHLCV panels with known asymmetric betas
+
+All providers return bars as a DataFrame indexed by date with columns
+[open, high, low, close, volume], or None when a symbol has no data.
+"""
+
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_PROVIDER = 'yfinance'
+
+# Symbols the synthetic provider treats as the market itself
+MARKET_SYMBOLS = ('SPY', '^GSPC', '^SPX', 'VOO', 'IVV')
+
+# yfinance interval -> Alpaca timeframe
+ALPACA_TIMEFRAMES = {
+    '1m': '1Min',
+    '5m': '5Min',
+    '15m': '15Min',
+    '30m': '30Min',
+    '60m': '1Hour',
+    '1d': '1Day'
+}
+
+
+class BarProvider:
+    """
+    Interface for a source of historical bars.
+
+    Subclasses implement fetch(); fetch_many() defaults to one fetch per
+    symbol and should be overridden when the source supports multi-symbol
+    requests.
+    """
+
+    name = None
+
+    def fetch(self, symbol, start_date, end_date, interval='1d', adjusted=True):
+        """
+        Fetch bars for one symbol over [start_date, end_date).
+
+        Args:
+            symbol (str): Stock symbol
+            start_date (str): Start date in 'YYYY-MM-DD' format
+            end_date (str): End date in 'YYYY-MM-DD' format (exclusive)
+            interval (str): yfinance-style interval ('1d', '5m', ...)
+            adjusted (bool): Use split/dividend adjusted closes
+
+        Returns:
+            pandas.DataFrame: Bars with columns [open, high, low, close, volume], or None
+        """
+        raise NotImplementedError
+
+    def fetch_many(self, symbols, start_date, end_date, interval='1d', adjusted=True):
+        """
+        Fetch bars for several symbols sharing the same date range.
+
+        Returns:
+            dict: symbol -> bars for every symbol that returned data
+        """
+        bars = {}
+        for symbol in dict.fromkeys(symbols):
+            df = self.fetch(symbol, start_date, end_date, interval, adjusted)
+            if df is not None and len(df) > 0:
+                bars[symbol] = df
+        return bars
+
+
+class YFinanceProvider(BarProvider):
+    """Yahoo Finance bars through yf.download."""
+
+    name = 'yfinance'
+
+    def fetch(self, symbol, start_date, end_date, interval='1d', adjusted=True):
+        import yfinance as yf
+        from getBars import _clean_bars
+
+        # Ensure we download only one symbol to avoid multi-index
+        df = yf.download(
+            symbol,
+            start=start_date,
+            end=end_date,
+            interval=interval,
+            progress=False,
+            auto_adjust=False,
+            threads=False  # Prevent multi-threading issues
+        )
+        return _clean_bars(df, symbol, adjusted)
+
+    def fetch_many(self, symbols, start_date, end_date, interval='1d', adjusted=True):
+        import yfinance as yf
+        from getBars import _split_wide_frame
+
+        symbols = list(dict.fromkeys(symbols))
+        df = yf.download(
+            symbols,
+            start=start_date,
+            end=end_date,
+            interval=interval,
+            progress=False,
+            auto_adjust=False,
+            group_by='ticker',
+            threads=True
+        )
+        return _split_wide_frame(df, symbols, adjusted)
+
+
+class AlpacaProvider(BarProvider):
+    """
+    Alpaca market data bars through the shared AlpacaBarsClient.
+
+    Daily bars are indexed by their New York session date so they line up
+    with the other providers; intraday bars keep their UTC timestamps.
+    """
+
+    name = 'alpaca'
+
+    def __init__(self, config_path='config.json'):
+        self.config_path = config_path
+        self._clients = {}
+
+    def _client(self, adjusted):
+        from alpaca_client import AlpacaBarsClient, get_default_client
+
+        if adjusted and self.config_path == 'config.json':
+            return get_default_client()
+        key = 'all' if adjusted else 'raw'
+        if key not in self._clients:
+            self._clients[key] = AlpacaBarsClient(self.config_path, adjustment=key)
+        return self._clients[key]
+
+    def fetch(self, symbol, start_date, end_date, interval='1d', adjusted=True):
+        return self.fetch_many([symbol], start_date, end_date, interval, adjusted).get(symbol)
+
+    def fetch_many(self, symbols, start_date, end_date, interval='1d', adjusted=True):
+        timeframe = ALPACA_TIMEFRAMES.get(interval)
+        if timeframe is None:
+            print(f"Interval {interval} is not supported by the Alpaca provider")
+            return {}
+
+        frames = self._client(adjusted).get_bars(list(symbols), start_date, end_date, timeframe)
+        bars = {}
+        for symbol, df in frames.items():
+            index = pd.DatetimeIndex(df['timestamp'])
+            if interval == '1d':
+                index = index.tz_convert('America/New_York').tz_localize(None).normalize()
+            df = df.drop(columns='timestamp')
+            df.index = index
+            bars[symbol] = df
+        return bars
+
+
+class SyntheticProvider(BarProvider):
+    """
+    Deterministic synthetic daily bars for offline benchmarking and testing.
+
+    One market factor (GARCH(1,1) volatility, fat-tailed shocks) and a set
+    of sector factors are simulated over a fixed business-day calendar.
+    Each symbol gets its own parameters, seeded by the provider seed and
+    the symbol name, so the same symbol always produces the same history
+    whatever date range or batch it is requested in:
+
+        r = alpha + beta_up * max(m, 0) + beta_down * min(m, 0)
+            + loading * sector + idio_vol * e
+
+    Benchmark symbols (SPY, ^GSPC, ...) return the market factor itself.
+    true_betas() exposes the parameters, so estimators can be checked
+    against the values they should recover.
+
+    Args:
+        seed (int): Seed for the whole universe
+        beta_mean (float): Mean of the up-market beta
+        beta_std (float): Cross-sectional dispersion of the up-market beta
+        asymmetry_std (float): Dispersion of beta_down / beta_up around 1
+        n_sectors (int): Number of sector factors
+        listing_rate (float): Fraction of symbols listed after the calendar start
+        missing_rate (float): Probability that any single bar is missing
+        betas (dict, optional): symbol -> (beta_up, beta_down) overrides
+        calendar_start (str): First session of the simulated calendar
+        calendar_end (str): Last session of the simulated calendar
+        listing_end (str): Latest listing date for symbols listed late
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, seed=0, beta_mean=1.0, beta_std=0.35, asymmetry_std=0.25, n_sectors=11,
+                 listing_rate=0.15, missing_rate=0.001, betas=None,
+                 calendar_start='2000-01-03', calendar_end='2030-12-31', listing_end='2022-12-30'):
+        self.seed = seed
+        self.beta_mean = beta_mean
+        self.beta_std = beta_std
+        self.asymmetry_std = asymmetry_std
+        self.n_sectors = n_sectors
+        self.listing_rate = listing_rate
+        self.missing_rate = missing_rate
+        self.betas = dict(betas or {})
+        self.calendar = pd.bdate_range(calendar_start, calendar_end)
+        self.listing_end = int(self.calendar.searchsorted(pd.Timestamp(listing_end)))
+        self._market = None
+        self._sectors = None
+
+    def _rng(self, *keys):
+        return np.random.default_rng([self.seed] + [zlib.crc32(str(k).encode()) for k in keys])
+
+    def _factors(self):
+        """Simulate the market and sector factor returns once per provider."""
+        if self._market is None:
+            n = len(self.calendar)
+            rng = self._rng('__market__')
+            shocks = rng.standard_t(5, n) / np.sqrt(5 / 3)
+            long_run_var, alpha, beta = 0.011 ** 2, 0.09, 0.89
+            omega = long_run_var * (1 - alpha - beta)
+            market = np.empty(n)
+            var = long_run_var
+            for t in range(n):
+                market[t] = 0.0003 + np.sqrt(var) * shocks[t]
+                var = omega + alpha * (market[t] - 0.0003) ** 2 + beta * var
+            self._market = market
+            self._sectors = self._rng('__sectors__').normal(0.0, 0.006, (self.n_sectors, n))
+        return self._market, self._sectors
+
+    def parameters(self, symbol):
+        """
+        Simulation parameters for a symbol.
+
+        Returns:
+            dict: beta_up, beta_down, alpha, idio_vol, sector, loading, size,
+                  listing_date, price
+        """
+        rng = self._rng(symbol, 'params')
+        beta_up = max(0.05, rng.normal(self.beta_mean, self.beta_std))
+        beta_down = max(0.05, beta_up * rng.normal(1.0, self.asymmetry_std))
+        size = float(np.exp(rng.normal(23.0, 1.5)))  # market cap, median ~$10B
+        listing = 0
+        if rng.random() < self.listing_rate:
+            listing = int(rng.integers(0, max(1, self.listing_end)))
+        if symbol in self.betas:
+            beta_up, beta_down = self.betas[symbol]
+        if symbol in MARKET_SYMBOLS:
+            beta_up, beta_down, listing = 1.0, 1.0, 0
+        return {
+            'beta_up': float(beta_up),
+            'beta_down': float(beta_down),
+            'alpha': float(rng.normal(0.0, 0.0002)),
+            'idio_vol': float(0.015 * (size / 1e10) ** -0.15 * rng.uniform(0.7, 1.3)),
+            'sector': zlib.crc32(symbol.encode()) % self.n_sectors,
+            'loading': float(rng.uniform(0.3, 1.0)),
+            'size': size,
+            'listing_date': self.calendar[listing],
+            'price': float(rng.uniform(10.0, 400.0))
+        }
+
+    def true_betas(self, symbols):
+        """
+        Known parameters for symbols, for checking estimators.
+
+        Returns:
+            pandas.DataFrame: One row per symbol with columns
+                [beta_up, beta_down, alpha, idio_vol, sector, size, listing_date]
+        """
+        rows = {symbol: self.parameters(symbol) for symbol in dict.fromkeys(symbols)}
+        df = pd.DataFrame.from_dict(rows, orient='index')
+        return df[['beta_up', 'beta_down', 'alpha', 'idio_vol', 'sector', 'size', 'listing_date']]
+
+    def fetch(self, symbol, start_date, end_date, interval='1d', adjusted=True):
+        if interval != '1d':
+            print(f"Interval {interval} is not supported by the synthetic provider")
+            return None
+
+        start = np.searchsorted(self.calendar, pd.Timestamp(start_date).tz_localize(None).normalize())
+        end = np.searchsorted(self.calendar, pd.Timestamp(end_date).tz_localize(None).normalize())
+        p = self.parameters(symbol)
+        start = max(start, self.calendar.get_loc(p['listing_date']))
+        if start >= end:
+            return None
+
+        market, sectors = self._factors()
+        n = len(self.calendar)
+        rng = self._rng(symbol, 'path')
+        if symbol in MARKET_SYMBOLS:
+            returns = market
+            noise = rng.normal(0.0, 0.002, (3, n))
+        else:
+            idio = rng.standard_t(5, n) / np.sqrt(5 / 3)
+            returns = (p['alpha'] + p['beta_up'] * np.maximum(market, 0)
+                       + p['beta_down'] * np.minimum(market, 0)
+                       + p['loading'] * sectors[p['sector']] + p['idio_vol'] * idio)
+            noise = rng.normal(0.0, 0.004, (3, n))
+        volume_noise = rng.normal(0.0, 0.4, n)
+        keep = rng.random(n) >= self.missing_rate
+
+        # Prices compound from the listing date; rows before it never leave this method
+        listing = self.calendar.get_loc(p['listing_date'])
+        log_returns = np.log1p(np.clip(returns, -0.95, None))
+        log_returns[:listing + 1] = 0.0
+        close = p['price'] * np.exp(np.cumsum(log_returns))
+        prev_close = np.concatenate([[close[0]], close[:-1]])
+        open_ = prev_close * np.exp(noise[0])
+        high = np.maximum(open_, close) * np.exp(np.abs(noise[1]))
+        low = np.minimum(open_, close) * np.exp(-np.abs(noise[2]))
+        volume = np.round(p['size'] / p['price'] * 0.004 * np.exp(volume_noise + 20 * np.abs(returns)))
+
+        rows = slice(start, end)
+        keep = keep[rows]
+        if symbol in MARKET_SYMBOLS:
+            keep[:] = True
+        df = pd.DataFrame({
+            'open': open_[rows],
+            'high': high[rows],
+            'low': low[rows],
+            'close': close[rows],
+            'volume': volume[rows]
+        }, index=self.calendar[rows])[keep]
+        return df if len(df) > 0 else None
+
+
+PROVIDERS = {
+    'yfinance': YFinanceProvider,
+    'alpaca': AlpacaProvider,
+    'synthetic': SyntheticProvider
+}
+
+_instances = {}
+_active_provider = None
+
+
+def get_provider(name=None, default=DEFAULT_PROVIDER):
+    """
+    Resolve the bar provider to use.
+
+    Resolution order: an explicit name, a provider installed with
+    set_provider(), the BAR_PROVIDER environment variable, then `default`.
+
+    Args:
+        name (str, optional): Provider name ('yfinance', 'alpaca', 'synthetic')
+        default (str): Provider used when nothing else selects one
+
+    Returns:
+        BarProvider: The provider instance (one per name per process)
+    """
+    if name is None and _active_provider is not None:
+        return _active_provider
+    name = name or os.environ.get('BAR_PROVIDER') or default
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown bar provider '{name}'. Available: {sorted(PROVIDERS)}")
+    if name not in _instances:
+        _instances[name] = PROVIDERS[name]()
+    return _instances[name]
+
+
+def set_provider(provider):
+    """
+    Install a provider for the whole process, e.g. a SyntheticProvider with
+    a specific seed. Pass None to go back to BAR_PROVIDER / the default.
+    """
+    global _active_provider
+    _active_provider = provider
+
+
+def download(symbol, start=None, end=None, interval='1d', auto_adjust=None, **kwargs):
+    """
+    yf.download-compatible entry point for the one-off investigation scripts.
+
+    With the yfinance provider this is yf.download itself (auto_adjust is
+    only forwarded when given, so yfinance's own default still applies);
+    other providers return their bars with yfinance column names (Open,
+    High, Low, Close, Adj Close, Volume) so the scripts run unchanged.
+    """
+    provider = get_provider()
+    if provider.name == 'yfinance':
+        import yfinance as yf
+        if auto_adjust is not None:
+            kwargs['auto_adjust'] = auto_adjust
+        return yf.download(symbol, start=start, end=end, interval=interval, **kwargs)
+
+    adjusted = True if auto_adjust is None else auto_adjust
+    df = provider.fetch(symbol, start, end, interval, adjusted)
+    if df is None:
+        return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'])
+    df = df.rename(columns={'open': 'Open', 'high': 'High', 'low': 'Low',
+                            'close': 'Close', 'volume': 'Volume'})
+    df['Adj Close'] = df['Close']
+    return df[['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']]
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+"""
+Local on-disk bar store used as a read-through cache by getBars.
+
+Bars are kept as one compressed Parquet file per symbol, partitioned by
+interval:
+
+    bar_store/
+        1d/
+            AAPL.parquet
+            SPY.parquet
+        5m/
+            ...
+
+Each file also records the date range that has been requested from the
+provider (the "coverage"), so that a symbol listed in 2019 is not
+re-downloaded on every run just because a 2015 start date was asked for.
+Data and coverage live in the same file and are replaced atomically.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Next to this module unless BAR_STORE_DIR says otherwise, so every script
+# reads the same store whatever directory it is run from
+DEFAULT_STORE_DIR = os.environ.get(
+    'BAR_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bar_store'))
+
+COVERAGE_START_KEY = b'coverage_start'
+COVERAGE_END_KEY = b'coverage_end'
+
+
+def _to_timestamp(value):
+    """Convert a date string / datetime to a naive, day-normalized Timestamp."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return ts.normalize()
+
+
+def _slice_index(df, start, end):
+    """Return rows of df with start <= index < end (end exclusive, like yfinance)."""
+    index = df.index
+    if getattr(index, 'tz', None) is not None:
+        start = start.tz_localize(index.tz) if start is not None else None
+        end = end.tz_localize(index.tz) if end is not None else None
+    keep = np.ones(len(index), dtype=bool)
+    if start is not None:
+        keep &= index >= start
+    if end is not None:
+        keep &= index < end
+    return df[keep]
+
+
+class BarStore:
+    """
+    Columnar, compressed bar store partitioned by symbol and interval.
+
+    Args:
+        root (str): Directory holding the store (default: $BAR_STORE_DIR or bar_store/
+            next to this module)
+        compression (str): Parquet compression codec
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, compression='zstd'):
+        self.root = root
+        self.compression = compression
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def path_for(self, symbol, interval):
+        """Path of the Parquet file holding bars for symbol/interval."""
+        safe_symbol = symbol.replace('/', '_')
+        return os.path.join(self.root, interval, f"{safe_symbol}.parquet")
+
+    def lock_for(self, symbol, interval):
+        """Per-file lock so concurrent writers of the same symbol do not interleave."""
+        key = (symbol, interval)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def coverage(self, symbol, interval):
+        """
+        Date range already requested from the provider for symbol/interval.
+
+        Returns:
+            tuple: (start, end) Timestamps with end exclusive, or None if nothing is stored
+        """
+        path = self.path_for(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+        except Exception as e:
+            print(f"Error reading bar store metadata for {symbol}: {e}")
+            return None
+        if COVERAGE_START_KEY not in metadata or COVERAGE_END_KEY not in metadata:
+            return None
+        return (pd.Timestamp(metadata[COVERAGE_START_KEY].decode()),
+                pd.Timestamp(metadata[COVERAGE_END_KEY].decode()))
+
+    def covers(self, symbol, interval, start_date, end_date):
+        """True if [start_date, end_date) lies inside the stored coverage."""
+        coverage = self.coverage(symbol, interval)
+        if coverage is None:
+            return False
+        start, end = _to_timestamp(start_date), _to_timestamp(end_date)
+        return coverage[0] <= start and end <= coverage[1]
+
+    def missing_ranges(self, symbol, interval, start_date, end_date):
+        """
+        Parts of [start_date, end_date) that still have to be downloaded.
+
+        Gaps are chosen so that, once filled, the coverage stays a single
+        contiguous range: a request entirely after the stored range yields
+        one gap from the end of the coverage to end_date.
+
+        Returns:
+            list: (start, end) Timestamp pairs, end exclusive; empty if fully covered
+        """
+        start, end = _to_timestamp(start_date), _to_timestamp(end_date)
+        if start >= end:
+            return []
+        coverage = self.coverage(symbol, interval)
+        if coverage is None:
+            return [(start, end)]
+
+        cov_start, cov_end = coverage
+        gaps = []
+        if start < cov_start:
+            gaps.append((start, cov_start))
+        if end > cov_end:
+            gaps.append((cov_end, end))
+        return gaps
+
+    def read(self, symbol, interval, start_date=None, end_date=None, columns=None):
+        """
+        Read stored bars, memory-mapping the file.
+
+        Args:
+            symbol (str): Stock symbol
+            interval (str): yfinance interval ('1d', '5m', ...)
+            start_date (str, optional): Inclusive start date
+            end_date (str, optional): Exclusive end date
+            columns (list, optional): Subset of columns to load
+
+        Returns:
+            pandas.DataFrame: Stored bars, or None if the symbol is not in the store
+        """
+        path = self.path_for(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path, columns=columns, memory_map=True)
+        except Exception as e:
+            print(f"Error reading {symbol} from bar store: {e}")
+            return None
+
+        start = _to_timestamp(start_date) if start_date is not None else None
+        end = _to_timestamp(end_date) if end_date is not None else None
+        if start is not None or end is not None:
+            df = _slice_index(df, start, end)
+        return df
+
+    def write(self, symbol, interval, df, start_date, end_date):
+        """
+        Replace stored bars for symbol/interval and record their coverage.
+
+        The file is written next to its final location and moved into place
+        with os.replace, so readers never see a partially written file.
+
+        Args:
+            symbol (str): Stock symbol
+            interval (str): yfinance interval
+            df (pandas.DataFrame): Bars indexed by timestamp
+            start_date (str or Timestamp): Start of the covered range
+            end_date (str or Timestamp): Exclusive end of the covered range
+        """
+        path = self.path_for(symbol, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        metadata = dict(table.schema.metadata or {})
+        metadata[COVERAGE_START_KEY] = _to_timestamp(start_date).strftime('%Y-%m-%d').encode()
+        metadata[COVERAGE_END_KEY] = _to_timestamp(end_date).strftime('%Y-%m-%d').encode()
+        table = table.replace_schema_metadata(metadata)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def merge(self, symbol, interval, df, start_date, end_date):
+        """
+        Merge freshly downloaded bars into the store.
+
+        New rows win over stored rows with the same timestamp; the stored
+        coverage is widened to include [start_date, end_date).
+
+        Returns:
+            pandas.DataFrame: The full merged frame now in the store
+        """
+        with self.lock_for(symbol, interval):
+            existing = self.read(symbol, interval)
+            coverage = self.coverage(symbol, interval)
+
+            start, end = _to_timestamp(start_date), _to_timestamp(end_date)
+            if coverage is not None:
+                start, end = min(start, coverage[0]), max(end, coverage[1])
+
+            if existing is not None and len(existing) > 0:
+                if df is not None and len(df) > 0:
+                    merged = pd.concat([existing, df])
+                    merged = merged[~merged.index.duplicated(keep='last')]
+                else:
+                    merged = existing
+            else:
+                merged = df
+            if merged is None:
+                return None
+            merged = merged.sort_index()
+
+            self.write(symbol, interval, merged, start, end)
+            return merged
+
+    def symbols(self, interval):
+        """List the symbols stored for an interval."""
+        directory = os.path.join(self.root, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.parquet')] for name in os.listdir(directory)
+                      if name.endswith('.parquet'))
+
+
+_default_store = None
+
+
+def get_default_store():
+    """Return the process-wide BarStore used by getBars."""
+    global _default_store
+    if _default_store is None:
+        _default_store = BarStore()
+    return _default_store
+
+
+def set_default_store(store):
+    """Replace the process-wide BarStore, e.g. to point scripts at another directory."""
+    global _default_store
+    _default_store = store
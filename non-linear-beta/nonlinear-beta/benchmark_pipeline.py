@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the bar pipeline.
+
+Runs the fetch -> store -> beta steps against the seeded synthetic provider
+(no network access needed) for universes of increasing size, and checks
+that the estimated positive/negative betas recover the known ones.
+
+Usage:
+    python benchmark_pipeline.py                 # 500, 3000 and 10000 symbols
+    python benchmark_pipeline.py 500 2000        # custom universe sizes
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_providers import SyntheticProvider, set_provider
+from bar_store import BarStore, set_default_store
+from getBars import getBarsMany
+from beta_engine import betas_from_matrix
+from returns_matrix import write_returns_matrix
+
+START_DATE = '2015-01-01'
+END_DATE = '2025-01-01'
+MARKET_SYMBOL = 'SPY'
+
+
+def run_benchmark(n_symbols, seed=0):
+    """
+    Time one full pipeline run for n_symbols synthetic stocks.
+
+    Returns:
+        dict: Timings in seconds and beta recovery errors
+    """
+    provider = SyntheticProvider(seed=seed)
+    set_provider(provider)
+    symbols = [f"SYN{i:05d}" for i in range(n_symbols)]
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        set_default_store(BarStore(store_dir))
+
+        start = time.perf_counter()
+        bars = getBarsMany(symbols + [MARKET_SYMBOL], START_DATE, END_DATE, batch_size=500)
+        cold_fetch = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bars = getBarsMany(symbols + [MARKET_SYMBOL], START_DATE, END_DATE, batch_size=500)
+        warm_fetch = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matrix = write_returns_matrix(bars, os.path.join(store_dir, 'returns.bin'), MARKET_SYMBOL)
+        matrix_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        betas = betas_from_matrix(matrix)
+        beta_time = time.perf_counter() - start
+        del matrix
+
+    set_default_store(None)
+    set_provider(None)
+
+    truth = provider.true_betas(list(betas))
+    estimated = pd.DataFrame(betas).T
+    up_error = (estimated['positive_beta'].astype(float) - truth['beta_up']).dropna()
+    down_error = (estimated['negative_beta'].astype(float) - truth['beta_down']).dropna()
+
+    return {
+        'symbols': n_symbols,
+        'cold_fetch_s': cold_fetch,
+        'warm_fetch_s': warm_fetch,
+        'matrix_s': matrix_time,
+        'beta_s': beta_time,
+        'symbols_per_s': n_symbols / (cold_fetch + matrix_time + beta_time),
+        'beta_up_rmse': float(np.sqrt(np.mean(up_error ** 2))),
+        'beta_down_rmse': float(np.sqrt(np.mean(down_error ** 2)))
+    }
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 3000, 10000]
+
+    results = []
+    for n in sizes:
+        print(f"\nBenchmarking {n} symbols...")
+        results.append(run_benchmark(n))
+
+    df = pd.DataFrame(results).set_index('symbols')
+    print("\nPIPELINE BENCHMARK (synthetic provider)")
+    print("=" * 80)
+    print(df.to_string(float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Vectorized cross-sectional beta engine.
+
+Computes traditional, positive-market and negative-market betas for every
+symbol of a dates x symbols return matrix at once, with the same
+definitions, thresholds and None conventions as
+sp500_optimized_analysis.calculate_beta_clean:
+
+    beta = cov(stock, market, ddof=1) / var(market, ddof=0)
+
+over the dates where both returns exist (at least 50), and over the subsets
+with market > 0 / market < 0 (more than 20 days each).
+
+Everything is derived from per-regime sufficient statistics
+(n, Sx, Sy, Sxx, Sxy, Syy), see RegimeMoments. A regime split depends only
+on the date, so every sum is a masked matrix product: W.T @ f(market) for
+the market moments and Y.T @ g(market) for the cross moments, with W the
+validity mask and Y the returns with missing entries zeroed. A full S&P 500
+run is three small GEMMs.
+
+Several benchmarks (S&P 500, QQQ, sector ETFs, ...) only add columns to
+f and g: the stock returns are still read once, and the result is a
+symbols x benchmarks x regimes cube (see compute_beta_cube).
+"""
+
+import os
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Minimum common dates for any beta (calculate_beta_clean: len < 50 -> None)
+MIN_OBSERVATIONS = 50
+# A regime beta needs more than this many days
+MIN_REGIME_DAYS = 20
+# Symbols per block, bounds the temporary float64 copies for huge universes
+BLOCK_SIZE = 2048
+# Chunks per worker process for per-symbol estimators (map_symbol_chunks); a
+# few per worker keeps the processes busy when symbols differ in cost
+CHUNKS_PER_WORKER = 4
+
+# (covariance ddof, variance ddof) pairs. 'legacy' is what calculate_beta_clean
+# has always used (np.cov defaults to ddof=1, np.var to ddof=0), so its betas
+# are n / (n - 1) times the OLS slope; the consistent policies give the slope.
+DDOF_POLICIES = {
+    'legacy': (1, 0),
+    'sample': (1, 1),
+    'population': (0, 0)
+}
+
+# The sign split used throughout the repo
+SIGN_REGIMES = ('all', 'positive', 'negative')
+
+# Guard against r = +-1 in the slope t-statistic (as scipy.stats.linregress)
+TINY = 1.0e-20
+
+
+def sign_regimes(market):
+    """
+    Date x regime masks for all days, market > 0 days and market < 0 days.
+
+    Returns:
+        numpy.ndarray: Boolean dates x 3 mask (missing market returns excluded)
+    """
+    market = np.asarray(market, dtype=np.float64)
+    valid = np.isfinite(market)
+    x = np.where(valid, market, 0.0)
+    return np.column_stack([valid, valid & (x > 0), valid & (x < 0)])
+
+
+def regime_usable(n, min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS):
+    """
+    Which betas the day-count thresholds allow.
+
+    Args:
+        n (numpy.ndarray): (..., regimes) day counts, the first regime being all days
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+
+    Returns:
+        numpy.ndarray: Boolean array shaped like n
+    """
+    n = np.asarray(n)
+    enough = n[..., :1] >= min_observations
+    return enough & np.concatenate([np.ones_like(enough), n[..., 1:] > min_regime_days], axis=-1)
+
+
+class RegimeMoments:
+    """
+    Per-symbol, per-regime sufficient statistics of (x = market, y = stock):
+    n, Sx, Sy, Sxx, Sxy, Syy, each an array of shape (symbols, regimes), or
+    (symbols, benchmarks, regimes) when built against several benchmarks.
+
+    Sums over disjoint date ranges simply add, so moments can be stored,
+    merged (e.g. yesterday's sums plus today's returns) and turned into any
+    beta, correlation, R^2 or standard error without touching the returns
+    again.
+
+    Args:
+        n, sx, sy, sxx, sxy, syy (numpy.ndarray): The sums
+        regimes (tuple, optional): Regime names, one per column
+    """
+
+    FIELDS = ('n', 'sx', 'sy', 'sxx', 'sxy', 'syy')
+
+    def __init__(self, n, sx, sy, sxx, sxy, syy, regimes=None):
+        self.n = np.asarray(n, dtype=np.float64)
+        self.sx = np.asarray(sx, dtype=np.float64)
+        self.sy = np.asarray(sy, dtype=np.float64)
+        self.sxx = np.asarray(sxx, dtype=np.float64)
+        self.sxy = np.asarray(sxy, dtype=np.float64)
+        self.syy = np.asarray(syy, dtype=np.float64)
+        self.regimes = tuple(regimes) if regimes is not None else None
+
+    @classmethod
+    def from_returns(cls, returns, market, regimes=None, mask=None, regime_names=None,
+                     block_size=BLOCK_SIZE):
+        """
+        Accumulate the moments of every column of returns against market.
+
+        Args:
+            returns (numpy.ndarray): dates x symbols returns (NaN where missing),
+                or a 1-D array for a single stock
+            market (numpy.ndarray): Market returns for the same dates (NaN where
+                missing), or a dates x benchmarks matrix
+            regimes (numpy.ndarray, optional): dates x regimes boolean (or weight)
+                matrix, shared by all benchmarks, or dates x benchmarks x regimes;
+                defaults to the sign split of each benchmark
+            mask (numpy.ndarray, optional): dates x symbols validity mask
+            regime_names (tuple, optional): Names for the regime columns
+            block_size (int): Symbols processed per block
+
+        Returns:
+            RegimeMoments: Sums with shape (symbols, regimes), or
+                (symbols, benchmarks, regimes) for a benchmark matrix
+        """
+        returns = returns[:, None] if np.ndim(returns) == 1 else returns
+        if mask is not None and np.ndim(mask) == 1:
+            mask = mask[:, None]
+        market = np.asarray(market, dtype=np.float64)
+        single = market.ndim == 1
+        markets = market[:, None] if single else market
+        n_dates, n_benchmarks = markets.shape
+        if regimes is None:
+            regimes = np.stack([sign_regimes(markets[:, b]) for b in range(n_benchmarks)], axis=1)
+            regime_names = regime_names or SIGN_REGIMES
+        regimes = np.asarray(regimes, dtype=np.float64)
+        regimes = regimes[:, None] if regimes.ndim == 1 else regimes
+        if regimes.ndim == 2:
+            regimes = np.broadcast_to(regimes[:, None, :], (n_dates, n_benchmarks, regimes.shape[1]))
+        n_regimes = regimes.shape[2]
+        # Regimes never include dates without a market return
+        market_valid = np.isfinite(markets)
+        regimes = regimes * market_valid[:, :, None]
+        x = np.where(market_valid, markets, 0.0)[:, :, None]
+
+        # One feature column per (benchmark, regime) pair
+        x = np.broadcast_to(x, regimes.shape).reshape(n_dates, -1)
+        regimes = regimes.reshape(n_dates, -1)
+        k = regimes.shape[1]
+        market_features = np.hstack([regimes, regimes * x, regimes * x * x])
+        cross_features = np.hstack([regimes, regimes * x])
+
+        n_symbols = returns.shape[1]
+        market_sums = np.empty((n_symbols, 3 * k))
+        cross_sums = np.empty((n_symbols, 2 * k))
+        syy = np.empty((n_symbols, k))
+        for lo in range(0, n_symbols, block_size):
+            hi = min(lo + block_size, n_symbols)
+            block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+            valid = np.isfinite(block)
+            if mask is not None:
+                valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+            y = np.where(valid, block, 0.0)
+            market_sums[lo:hi] = valid.T.astype(np.float64) @ market_features
+            cross_sums[lo:hi] = y.T @ cross_features
+            np.multiply(y, y, out=y)
+            syy[lo:hi] = y.T @ regimes
+
+        sums = (market_sums[:, :k], market_sums[:, k:2 * k], cross_sums[:, :k],
+                market_sums[:, 2 * k:], cross_sums[:, k:], syy)
+        if not single:
+            sums = tuple(s.reshape(n_symbols, n_benchmarks, n_regimes) for s in sums)
+        return cls(*sums, regimes=regime_names)
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    def merge(self, other):
+        """Moments of the union of two disjoint samples."""
+        return RegimeMoments(*(getattr(self, f) + getattr(other, f) for f in self.FIELDS),
+                             regimes=self.regimes)
+
+    def __sub__(self, other):
+        """Moments of this sample with a contained sub-sample removed."""
+        return RegimeMoments(*(getattr(self, f) - getattr(other, f) for f in self.FIELDS),
+                             regimes=self.regimes)
+
+    def regime(self, name):
+        """Column index of a named regime."""
+        return self.regimes.index(name)
+
+    def to_array(self):
+        """Stack the sums into one (6, symbols, regimes) array for storage."""
+        return np.stack([getattr(self, f) for f in self.FIELDS])
+
+    @classmethod
+    def from_array(cls, array, regimes=None):
+        """Inverse of to_array."""
+        return cls(*array, regimes=regimes)
+
+    # Centered sums of squares and cross products
+    def _centered(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cxx = self.sxx - self.sx * self.sx / self.n
+            cxy = self.sxy - self.sx * self.sy / self.n
+            cyy = self.syy - self.sy * self.sy / self.n
+        return cxx, cxy, cyy
+
+    def covariance(self, ddof=1):
+        """Covariance of stock and market."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._centered()[1] / (self.n - ddof)
+
+    def market_variance(self, ddof=1):
+        """Variance of the market returns."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._centered()[0] / (self.n - ddof)
+
+    def stock_variance(self, ddof=1):
+        """Variance of the stock returns."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self._centered()[2] / (self.n - ddof)
+
+    def beta(self, ddof='legacy'):
+        """
+        Beta = covariance / market variance under a ddof policy.
+
+        Args:
+            ddof (str or tuple): A DDOF_POLICIES name or (covariance ddof, variance ddof)
+
+        Returns:
+            numpy.ndarray: Betas, NaN where the market variance is not positive
+        """
+        cov_ddof, var_ddof = DDOF_POLICIES[ddof] if isinstance(ddof, str) else ddof
+        variance = self.market_variance(var_ddof)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            beta = self.covariance(cov_ddof) / variance
+        return np.where(variance > 0, beta, np.nan)
+
+    def alpha(self):
+        """OLS intercept (per-period alpha) of stock on market."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.sy - self.beta('sample') * self.sx) / self.n
+
+    def correlation(self):
+        """Pearson correlation of stock and market."""
+        cxx, cxy, cyy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = cxy / np.sqrt(cxx * cyy)
+        return np.clip(r, -1.0, 1.0)
+
+    def r_squared(self):
+        """R^2 of the regression of stock on market."""
+        return self.correlation() ** 2
+
+    def stderr(self):
+        """Standard error of the OLS slope (as scipy.stats.linregress)."""
+        cxx, cxy, cyy = self._centered()
+        r2 = self.r_squared()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt((1.0 - r2) * cyy / cxx / (self.n - 2))
+
+    def residual_variance(self, ddof=2):
+        """Variance of the OLS residuals (idiosyncratic variance)."""
+        cxx, cxy, cyy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.maximum(cyy - cxy * cxy / cxx, 0.0) / (self.n - ddof)
+
+    def intercept_stderr(self):
+        """Standard error of the OLS intercept (as scipy.stats.linregress)."""
+        cxx = self._centered()[0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_x = self.sx / self.n
+            return self.stderr() * np.sqrt(cxx / self.n + mean_x * mean_x)
+
+    def pvalue(self):
+        """Two-sided p-value of the slope t-test (as scipy.stats.linregress)."""
+        r = self.correlation()
+        df = self.n - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = r * np.sqrt(df / ((1.0 - r + TINY) * (1.0 + r + TINY)))
+            return np.where(df > 0, 2.0 * stats.t.sf(np.abs(t), np.maximum(df, 1)), np.nan)
+
+
+def map_symbol_chunks(func, n_symbols, task, workers=None):
+    """
+    Run a per-symbol estimator over chunks of symbols in worker processes.
+
+    Args:
+        func (callable): Module-level function taking the arguments of one task
+        n_symbols (int): Number of symbols
+        task (callable): task(lo, hi) -> tuple of func arguments for symbols lo:hi
+        workers (int, optional): Worker processes (default: one per CPU, 1 = in process)
+
+    Returns:
+        list: (lo, hi, func result) for every chunk, in symbol order
+    """
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-n_symbols // (workers * CHUNKS_PER_WORKER)))
+    bounds = [(lo, min(lo + chunk, n_symbols)) for lo in range(0, n_symbols, chunk)]
+    tasks = [task(lo, hi) for lo, hi in bounds]
+    if workers == 1 or len(tasks) <= 1:
+        outputs = [func(*arguments) for arguments in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(func, *zip(*tasks)))
+    return [(lo, hi, output) for (lo, hi), output in zip(bounds, outputs)]
+
+
+def compute_betas(returns, market, mask=None, min_observations=MIN_OBSERVATIONS,
+                  min_regime_days=MIN_REGIME_DAYS, block_size=BLOCK_SIZE):
+    """
+    Betas for every column of a return matrix against one market series.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing);
+            a ReturnsMatrix memmap works as is
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask; defaults to
+            the finite entries of returns
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        block_size (int): Symbols processed per block
+
+    Returns:
+        dict: Arrays of length n_symbols for 'traditional_beta', 'positive_beta',
+              'negative_beta', 'beta_ratio' (NaN where calculate_beta_clean
+              returns None) and 'data_points', 'positive_days', 'negative_days'
+    """
+    moments = RegimeMoments.from_returns(returns, market, mask=mask, block_size=block_size)
+    return betas_from_moments(moments, min_observations, min_regime_days)
+
+
+def ols_diagnostics(returns, market, mask=None, regimes=None, regime_names=None, residuals=True,
+                    block_size=BLOCK_SIZE):
+    """
+    scipy.stats.linregress of every column on the market, for every regime,
+    in one call.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask, e.g. the
+            last 60 common months of each symbol
+        regimes (numpy.ndarray, optional): dates x regimes masks (default: sign split)
+        regime_names (tuple, optional): Names of the regime columns
+        residuals (bool): Also return the residuals of the first regime's fit
+        block_size (int): Symbols processed per block
+
+    Returns:
+        dict: symbols x regimes arrays 'slope', 'intercept', 'rvalue', 'pvalue',
+              'stderr', 'intercept_stderr' (the linregress fields), 'n',
+              'mean_x', 'mean_y', 'std_x', 'std_y' (ddof=0, like ndarray.std),
+              'idiosyncratic_volatility' (residual standard deviation, ddof=2);
+              and 'residuals', dates x symbols, NaN outside the first regime
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    moments = RegimeMoments.from_returns(returns, market, regimes, mask, regime_names, block_size)
+
+    slope = moments.beta('sample')
+    intercept = moments.alpha()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = moments.sx / moments.n
+        mean_y = moments.sy / moments.n
+    diagnostics = {
+        'n': moments.n.astype(np.int64),
+        'slope': slope,
+        'intercept': intercept,
+        'rvalue': moments.correlation(),
+        'pvalue': moments.pvalue(),
+        'stderr': moments.stderr(),
+        'intercept_stderr': moments.intercept_stderr(),
+        'mean_x': mean_x,
+        'mean_y': mean_y,
+        'std_x': np.sqrt(np.maximum(moments.market_variance(0), 0.0)),
+        'std_y': np.sqrt(np.maximum(moments.stock_variance(0), 0.0)),
+        'idiosyncratic_volatility': np.sqrt(moments.residual_variance())
+    }
+
+    if residuals:
+        market = np.asarray(market, dtype=np.float64)
+        in_fit = sign_regimes(market)[:, 0] if regimes is None else np.asarray(regimes)[:, 0] > 0
+        in_fit = in_fit & np.isfinite(market)
+        fitted = np.full(returns.shape, np.nan)
+        for lo in range(0, returns.shape[1], block_size):
+            hi = min(lo + block_size, returns.shape[1])
+            block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+            valid = np.isfinite(block) & in_fit[:, None]
+            if mask is not None:
+                valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+            residual = block - intercept[lo:hi, 0] - slope[lo:hi, 0] * market[:, None]
+            fitted[:, lo:hi] = np.where(valid, residual, np.nan)
+        diagnostics['residuals'] = fitted
+
+    return diagnostics
+
+
+def betas_from_moments(moments, min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS,
+                       ddof='legacy'):
+    """
+    calculate_beta_clean-style betas from sign-regime moments.
+
+    Returns:
+        dict: Same arrays as compute_betas (shape (symbols, benchmarks) for
+              multi-benchmark moments)
+    """
+    n = moments.n
+    betas = np.where(regime_usable(n, min_observations, min_regime_days), moments.beta(ddof), np.nan)
+    traditional, positive, negative = betas[..., 0], betas[..., 1], betas[..., 2]
+    n_all, n_pos, n_neg = n[..., 0], n[..., 1], n[..., 2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(negative != 0, positive / negative, np.nan)
+
+    return {
+        'traditional_beta': traditional,
+        'positive_beta': positive,
+        'negative_beta': negative,
+        'beta_ratio': ratio,
+        'data_points': n_all.astype(np.int64),
+        'positive_days': n_pos.astype(np.int64),
+        'negative_days': n_neg.astype(np.int64)
+    }
+
+
+def compute_beta_cube(returns, benchmarks, mask=None, min_observations=MIN_OBSERVATIONS,
+                      min_regime_days=MIN_REGIME_DAYS, ddof='legacy', block_size=BLOCK_SIZE):
+    """
+    Betas of every column of a return matrix against several benchmarks at once.
+
+    The stock returns are read once; each extra benchmark adds three feature
+    columns per regime to the same matrix products.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        benchmarks (numpy.ndarray): dates x benchmarks returns (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        ddof (str or tuple): Policy from DDOF_POLICIES
+        block_size (int): Symbols processed per block
+
+    Returns:
+        dict: compute_betas arrays with shape (symbols, benchmarks), plus 'cube':
+              symbols x benchmarks x 3 betas in SIGN_REGIMES order
+    """
+    benchmarks = np.asarray(benchmarks, dtype=np.float64)
+    benchmarks = benchmarks[:, None] if benchmarks.ndim == 1 else benchmarks
+    moments = RegimeMoments.from_returns(returns, benchmarks, mask=mask, block_size=block_size)
+    betas = betas_from_moments(moments, min_observations, min_regime_days, ddof)
+    betas['cube'] = np.stack([betas['traditional_beta'], betas['positive_beta'],
+                              betas['negative_beta']], axis=-1)
+    return betas
+
+
+def beta_cube_from_matrix(matrix, benchmarks=None, symbols=None, min_bars=100, **kwargs):
+    """
+    Betas of the stocks of a ReturnsMatrix against several of its columns.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix holding the benchmark columns
+        benchmarks (list, optional): Benchmark columns (default: the market
+            column followed by the matrix's benchmark columns)
+        symbols (list, optional): Stocks to include (default: stock_symbols())
+        min_bars (int): Skip symbols with fewer bars (returns + 1)
+        **kwargs: Passed to compute_beta_cube
+
+    Returns:
+        pandas.DataFrame: One row per (symbol, benchmark) with the compute_betas
+            columns; rows without a traditional beta are dropped
+    """
+    if benchmarks is None:
+        benchmarks = [matrix.market_symbol] + list(matrix.benchmark_symbols)
+    symbols = matrix.stock_symbols() if symbols is None else list(symbols)
+    columns = [matrix.column_index(s) for s in symbols]
+    benchmark_columns = [matrix.column_index(b) for b in benchmarks]
+
+    benchmark_returns = np.where(matrix.mask[:, benchmark_columns],
+                                 matrix.returns[:, benchmark_columns], np.nan)
+    mask = matrix.mask[:, columns]
+    betas = compute_beta_cube(matrix.returns[:, columns], benchmark_returns, mask, **kwargs)
+    betas.pop('cube')
+
+    index = pd.MultiIndex.from_product([symbols, benchmarks], names=['symbol', 'benchmark'])
+    frame = pd.DataFrame({name: values.ravel() for name, values in betas.items()}, index=index)
+    bars = np.repeat(np.asarray(mask.sum(axis=0)) + 1, len(benchmarks))
+    return frame[(bars >= min_bars) & frame['traditional_beta'].notna().to_numpy()]
+
+
+def betas_from_matrix(matrix, symbols=None, min_bars=100):
+    """
+    calculate_beta_clean results for every stock of a ReturnsMatrix.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix with a market column
+        symbols (list, optional): Stocks to include (default: all but the market)
+        min_bars (int): Skip symbols with fewer bars (returns + 1), like calculate_betas
+
+    Returns:
+        dict: symbol -> result dict with None for undefined betas; symbols whose
+              traditional beta is undefined are omitted, as calculate_beta_clean
+              returns None for them
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+    bars = np.asarray(mask.sum(axis=0)) + 1
+
+    betas = compute_betas(returns, market, mask)
+    return to_result_dicts(symbols, betas, keep=bars >= min_bars)
+
+
+def to_result_dicts(symbols, betas, keep=None):
+    """
+    Convert compute_betas arrays to calculate_beta_clean-style dicts.
+
+    Returns:
+        dict: symbol -> {'traditional_beta', 'positive_beta', 'negative_beta',
+              'beta_ratio', 'data_points', 'positive_days', 'negative_days'}
+    """
+    def value(x):
+        return None if np.isnan(x) else float(x)
+
+    results = {}
+    for j, symbol in enumerate(symbols):
+        if keep is not None and not keep[j]:
+            continue
+        if np.isnan(betas['traditional_beta'][j]):
+            continue
+        results[symbol] = {
+            'traditional_beta': float(betas['traditional_beta'][j]),
+            'positive_beta': value(betas['positive_beta'][j]),
+            'negative_beta': value(betas['negative_beta'][j]),
+            'beta_ratio': value(betas['beta_ratio'][j]),
+            'data_points': int(betas['data_points'][j]),
+            'positive_days': int(betas['positive_days'][j]),
+            'negative_days': int(betas['negative_days'][j])
+        }
+    return results
+
+
+def path_frame(panels):
+    """
+    Long (date, symbol) frame of beta path panels, as written to the *_path.parquet files.
+
+    Args:
+        panels (dict): Beta name -> DataFrame (dates x symbols)
+
+    Returns:
+        pandas.DataFrame: One column per beta and one row per date and symbol
+            with at least one defined beta
+    """
+    frame = pd.DataFrame({name: panel.stack(future_stack=True) for name, panel in panels.items()})
+    frame.index.names = ['date', 'symbol']
+    return frame.dropna(how='all')
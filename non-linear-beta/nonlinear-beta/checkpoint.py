@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Append-only checkpoint log for long-running fetches.
+
+Each completed item (e.g. a fetched symbol's marker) is pickled into its own record
+file, written to a temporary name and moved into place with os.replace. A
+line "key<TAB>file<TAB>size<TAB>sha256" is then appended to index.log and
+fsynced. Saving a symbol therefore costs the same no matter how many have
+been saved before, and a crash can at worst lose the record being written:
+a torn index line or a record whose size/checksum does not match is
+skipped on load.
+
+    sp500_progress/
+        index.log
+        records/
+            AAPL.3f2a9c1d7e4b.pkl
+            ...
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+
+
+class CheckpointLog:
+    """
+    Append-only, per-key checkpoint store.
+
+    Args:
+        directory (str): Directory holding index.log and the record files
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.records_dir = os.path.join(directory, 'records')
+        self.index_path = os.path.join(directory, 'index.log')
+        self.lock = threading.Lock()
+
+    def exists(self):
+        """True if a checkpoint index is present."""
+        return os.path.exists(self.index_path)
+
+    def append(self, key, obj):
+        """
+        Persist obj under key. A later append of the same key supersedes it.
+
+        Args:
+            key (str): Record key (e.g. stock symbol)
+            obj: Any picklable object
+        """
+        payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(payload).hexdigest()
+        safe_key = key.replace('/', '_').replace('\t', '_')
+        filename = f"{safe_key}.{digest[:12]}.pkl"
+        path = os.path.join(self.records_dir, filename)
+
+        os.makedirs(self.records_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        line = f"{key}\t{filename}\t{len(payload)}\t{digest}\n"
+        with self.lock:
+            with open(self.index_path, 'a+b') as f:
+                # Terminate a torn final line left by a crash, so this record
+                # starts on a line of its own instead of being glued onto it
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = '\n' + line
+                f.write(line.encode())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def index(self):
+        """
+        Read the index, keeping the latest entry per key.
+
+        Returns:
+            dict: key -> (filename, size, sha256)
+        """
+        entries = {}
+        if not self.exists():
+            return entries
+        with open(self.index_path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    continue  # torn final line from an interrupted append
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 4 or not parts[2].isdigit() or len(parts[3]) != 64:
+                    continue
+                key, filename, size, digest = parts
+                entries[key] = (filename, int(size), digest)
+        return entries
+
+    def load(self, key, entry=None):
+        """
+        Load one record after checking its size and checksum.
+
+        Returns:
+            The stored object, or None if missing or corrupted
+        """
+        entry = entry or self.index().get(key)
+        if entry is None:
+            return None
+        filename, size, digest = entry
+        path = os.path.join(self.records_dir, filename)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except OSError as e:
+            print(f"Checkpoint record for {key} unreadable: {e}")
+            return None
+        if len(payload) != size or hashlib.sha256(payload).hexdigest() != digest:
+            print(f"Checkpoint record for {key} failed integrity check, skipping")
+            return None
+        return pickle.loads(payload)
+
+    def load_all(self):
+        """
+        Load every valid record.
+
+        Returns:
+            dict: key -> object for all records that pass the integrity check
+        """
+        records = {}
+        for key, entry in self.index().items():
+            obj = self.load(key, entry)
+            if obj is not None:
+                records[key] = obj
+        return records
+
+    def clear(self):
+        """Delete the checkpoint directory."""
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
@@ -4,7 +4,7 @@ Compare NVIDIA beta calculations to find the discrepancy.
 """
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 from getBars import getBars
 from sp500_optimized_analysis import calculate_beta_clean
 
@@ -13,8 +13,8 @@ print()
 
 # Method 1: Direct YFinance calculation
 print("Method 1: Direct YFinance calculation")
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 print(f"YFinance NVDA shape: {nvda.shape}")
 print(f"YFinance SPY shape: {spy.shape}")
@@ -13,7 +13,7 @@ import os
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from getBars import getBars
+from getBars import getBars, getBenchmarkBars
 
 def calculate_positive_beta_original_method(stock_returns, market_returns):
     """
@@ -68,7 +68,7 @@ def test_both_methods(symbol, period_years=5):
     
     # Get stock and market data
     stock_data = getBars(symbol, start_str, end_str)
-    market_data = getBars('^GSPC', start_str, end_str)
+    market_data = getBenchmarkBars('^GSPC', start_str, end_str)
     
     if stock_data is None or market_data is None:
         print(f"❌ Failed to get data for {symbol}")
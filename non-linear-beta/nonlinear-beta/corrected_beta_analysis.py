@@ -6,15 +6,15 @@ Fixed data alignment and beta calculation issues.
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 # Simple test first
 print("NVIDIA BETA CALCULATION - CORRECTED")
 print("="*50)
 
 # Test NVIDIA specifically
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 # Extract closing prices
 nvda_prices = nvda['Close'].dropna()
@@ -5,7 +5,7 @@ Create corrected SP500 optimized results using proper beta calculations.
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
@@ -14,8 +14,8 @@ def calculate_correct_beta(symbol, start_date='2015-01-01', end_date='2025-01-01
     """Calculate correct beta for a stock using the working method."""
     try:
         # Download data
-        stock = yf.download(symbol, start=start_date, end=end_date, progress=False, auto_adjust=False)
-        spy = yf.download('SPY', start=start_date, end=end_date, progress=False, auto_adjust=False)
+        stock = download(symbol, start=start_date, end=end_date, progress=False, auto_adjust=False)
+        spy = download('SPY', start=start_date, end=end_date, progress=False, auto_adjust=False)
         
         if stock.empty or spy.empty:
             return None
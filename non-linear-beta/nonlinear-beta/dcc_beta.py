@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Conditional betas from GJR-GARCH volatilities and DCC correlations.
+
+For every stock and the market:
+
+    GJR-GARCH(1,1)  s2_t = omega + (alpha + gamma * 1[e_{t-1} < 0]) * e_{t-1}^2 + beta * s2_{t-1}
+    DCC(1,1)        Q_t  = (1 - a - b) * Qbar + a * z_{t-1} z_{t-1}' + b * Q_{t-1}
+                    rho_t = Q_t[0, 1] / sqrt(Q_t[0, 0] * Q_t[1, 1])
+    beta_t          = rho_t * s_stock,t / s_market,t
+
+Given the data, both recursions are linear in the state (s2_t and the
+elements of Q_t), so each likelihood evaluation is a scipy.signal.lfilter
+call instead of a Python loop over days; the parameters are fitted with
+SLSQP under the stationarity constraints. The DCC step is the bivariate
+stock / market model of Engle's dynamic conditional beta, fitted per stock
+on the dates both traded.
+
+Symbols are fitted in worker processes. Fitted parameters are cached in
+GARCH_CACHE_PATH with the last date and number of observations they were
+fitted on: unchanged symbols are only re-filtered, and symbols with new
+days start the optimizer from yesterday's parameters, so a nightly refit
+takes a few iterations per name instead of a fit from scratch.
+
+Usage:
+    python dcc_beta.py                  # stocks of returns_matrix.bin
+    python dcc_beta.py path/to/matrix   # another returns matrix
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import optimize, signal
+
+from beta_engine import MIN_OBSERVATIONS, map_symbol_chunks, path_frame
+from returns_matrix import DEFAULT_MATRIX_PATH, open_returns_matrix
+
+GARCH_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'garch_params.parquet')
+DCC_RESULTS_PATH = 'sp500_dcc_betas.csv'
+DCC_PATH_PATH = 'sp500_dcc_beta_path.parquet'
+
+GARCH_PARAMS = ('omega', 'alpha', 'gamma', 'beta')
+DCC_PARAMS = ('dcc_a', 'dcc_b')
+DCC_BETA_TYPES = ('dcc_beta', 'dcc_positive_beta', 'dcc_negative_beta')
+
+# Returns are fitted in percent; betas do not depend on the scale
+RETURN_SCALE = 100.0
+# Keep fitted processes strictly stationary
+STATIONARITY_MARGIN = 1.0e-4
+# Starting persistence for a symbol without cached parameters
+GARCH_START = (0.05, 0.05, 0.88)
+DCC_START = (0.02, 0.95)
+
+
+def gjr_variance(residuals, params):
+    """
+    Conditional variances of a GJR-GARCH(1,1), backcast from the sample variance.
+
+    Args:
+        residuals (numpy.ndarray): Demeaned returns (no NaN)
+        params (tuple): (omega, alpha, gamma, beta)
+
+    Returns:
+        numpy.ndarray: s2_t for every observation
+    """
+    omega, alpha, gamma, beta = params
+    shocks = (alpha + gamma * (residuals < 0)) * residuals * residuals
+    variance = np.empty(len(residuals))
+    variance[0] = residuals.var()
+    if len(residuals) > 1:
+        variance[1:], _ = signal.lfilter([1.0], [1.0, -beta], omega + shocks[:-1],
+                                         zi=[beta * variance[0]])
+    return variance
+
+
+def _gjr_nll(params, residuals):
+    """Gaussian negative log-likelihood (without constants) of a GJR-GARCH(1,1)."""
+    variance = gjr_variance(residuals, params)
+    if not np.all(variance > 0):
+        return 1.0e10
+    return 0.5 * np.sum(np.log(variance) + residuals * residuals / variance)
+
+
+def fit_gjr_garch(residuals, start=None):
+    """
+    Maximum-likelihood GJR-GARCH(1,1) parameters.
+
+    Args:
+        residuals (numpy.ndarray): Demeaned returns (no NaN)
+        start (tuple, optional): (omega, alpha, gamma, beta) warm start
+
+    Returns:
+        tuple: (params, negative log-likelihood, iterations)
+    """
+    variance = residuals.var()
+    if start is None or not np.all(np.isfinite(start)):
+        alpha, gamma, beta = GARCH_START
+        start = (variance * (1.0 - alpha - 0.5 * gamma - beta), alpha, gamma, beta)
+    constraint = {'type': 'ineq',
+                  'fun': lambda p: 1.0 - STATIONARITY_MARGIN - p[1] - 0.5 * p[2] - p[3]}
+    bounds = [(1.0e-8 * variance, 10.0 * variance), (0.0, 1.0), (0.0, 1.0), (0.0, 1.0)]
+    result = optimize.minimize(_gjr_nll, np.asarray(start, dtype=np.float64), args=(residuals,),
+                               method='SLSQP', bounds=bounds, constraints=[constraint])
+    return tuple(result.x), result.fun, result.nit
+
+
+def dcc_correlation(z, params, q_bar=None):
+    """
+    Conditional correlations of a bivariate DCC(1,1).
+
+    Args:
+        z (numpy.ndarray): observations x 2 standardized residuals
+        params (tuple): (a, b)
+        q_bar (numpy.ndarray, optional): Unconditional 2 x 2 matrix (default: z'z / n)
+
+    Returns:
+        numpy.ndarray: rho_t for every observation
+    """
+    a, b = params
+    if q_bar is None:
+        q_bar = z.T @ z / len(z)
+    products = np.column_stack([z[:, 0] * z[:, 0], z[:, 1] * z[:, 1], z[:, 0] * z[:, 1]])
+    targets = np.array([q_bar[0, 0], q_bar[1, 1], q_bar[0, 1]])
+    q = np.empty((len(z), 3))
+    q[0] = targets
+    if len(z) > 1:
+        q[1:], _ = signal.lfilter([1.0], [1.0, -b], (1.0 - a - b) * targets + a * products[:-1],
+                                  axis=0, zi=(b * targets)[None, :])
+    return q[:, 2] / np.sqrt(q[:, 0] * q[:, 1])
+
+
+def _dcc_nll(params, z, q_bar):
+    """Correlation part of the DCC negative log-likelihood (without constants)."""
+    rho = dcc_correlation(z, params, q_bar)
+    one_minus = 1.0 - rho * rho
+    if not np.all(one_minus > 0):
+        return 1.0e10
+    quadratic = z[:, 0] * z[:, 0] + z[:, 1] * z[:, 1] - 2.0 * rho * z[:, 0] * z[:, 1]
+    return 0.5 * np.sum(np.log(one_minus) + quadratic / one_minus)
+
+
+def fit_dcc(z, start=None):
+    """
+    Maximum-likelihood bivariate DCC(1,1) parameters.
+
+    Args:
+        z (numpy.ndarray): observations x 2 standardized residuals
+        start (tuple, optional): (a, b) warm start
+
+    Returns:
+        tuple: (params, negative log-likelihood, iterations)
+    """
+    if start is None or not np.all(np.isfinite(start)):
+        start = DCC_START
+    q_bar = z.T @ z / len(z)
+    constraint = {'type': 'ineq', 'fun': lambda p: 1.0 - STATIONARITY_MARGIN - p[0] - p[1]}
+    result = optimize.minimize(_dcc_nll, np.asarray(start, dtype=np.float64), args=(z, q_bar),
+                               method='SLSQP', bounds=[(0.0, 1.0), (0.0, 1.0)], constraints=[constraint])
+    return tuple(result.x), result.fun, result.nit
+
+
+def _fit_symbols(block, valid, market_sigma, market_z, cached, refit):
+    """
+    GJR-GARCH + DCC fits and conditional beta paths of a block of symbols;
+    runs in a worker process.
+
+    Args:
+        block (numpy.ndarray): dates x symbols returns (scaled)
+        valid (numpy.ndarray): dates x symbols rows to use (stock and market valid)
+        market_sigma, market_z (numpy.ndarray): Market conditional volatility and
+            standardized residuals per date (NaN where the market is missing)
+        cached (numpy.ndarray): symbols x 6 cached parameters (NaN where none)
+        refit (numpy.ndarray): Per symbol, False to reuse the cached parameters as they are
+
+    Returns:
+        tuple: (dates x symbols betas, symbols x 6 parameters, symbols optimizer iterations)
+    """
+    n_dates, n_symbols = block.shape
+    betas = np.full((n_dates, n_symbols), np.nan)
+    params = np.full((n_symbols, len(GARCH_PARAMS) + len(DCC_PARAMS)), np.nan)
+    iterations = np.zeros(n_symbols, dtype=np.int64)
+
+    for j in range(n_symbols):
+        rows = np.flatnonzero(valid[:, j])
+        returns = block[rows, j]
+        residuals = returns - returns.mean()
+        garch_start, dcc_start = cached[j, :4], cached[j, 4:]
+        if refit[j]:
+            garch, _, garch_iterations = fit_gjr_garch(residuals, garch_start)
+        else:
+            garch, garch_iterations = tuple(garch_start), 0
+        sigma = np.sqrt(gjr_variance(residuals, garch))
+
+        z = np.column_stack([residuals / sigma, market_z[rows]])
+        if refit[j]:
+            dcc, _, dcc_iterations = fit_dcc(z, dcc_start)
+        else:
+            dcc, dcc_iterations = tuple(dcc_start), 0
+        rho = dcc_correlation(z, dcc)
+
+        betas[rows, j] = rho * sigma / market_sigma[rows]
+        params[j] = garch + dcc
+        iterations[j] = garch_iterations + dcc_iterations
+    return betas, params, iterations
+
+
+def load_cache(path=GARCH_CACHE_PATH):
+    """Cached parameters (one row per symbol), or an empty frame."""
+    if path is not None and os.path.exists(path):
+        return pd.read_parquet(path)
+    return pd.DataFrame(columns=list(GARCH_PARAMS + DCC_PARAMS) + ['last_date', 'observations'])
+
+
+def dcc_betas(returns, market, dates, symbols, mask=None, market_symbol='market', cache=None,
+              min_observations=MIN_OBSERVATIONS * 5, workers=None):
+    """
+    Daily conditional betas of every column of returns.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        dates (pandas.DatetimeIndex): Row dates
+        symbols (list): Column names (keys of the cache)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        market_symbol (str): Cache key of the market fit
+        cache (pandas.DataFrame, optional): Parameters from a previous run (load_cache)
+        min_observations (int): Minimum common dates for a fit (GARCH needs a long sample)
+        workers (int, optional): Worker processes (default: one per CPU, 1 = in process)
+
+    Returns:
+        tuple: (dates x symbols betas, NaN where undefined; DataFrame of the fitted
+                parameters for the symbols and the market, the new cache)
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64) * RETURN_SCALE
+    dates = pd.DatetimeIndex(dates)
+    cache = load_cache(None) if cache is None else cache
+    columns = list(GARCH_PARAMS + DCC_PARAMS)
+
+    def cached_row(symbol, rows):
+        """Cached parameters, and whether they were fitted on exactly these rows."""
+        if symbol not in cache.index:
+            return np.full(len(columns), np.nan), True
+        entry = cache.loc[symbol]
+        current = (len(rows) and pd.Timestamp(entry['last_date']) == dates[rows[-1]]
+                   and int(entry['observations']) == len(rows))
+        return entry[columns].to_numpy(dtype=np.float64), not current
+
+    # The market is fitted once in the main process
+    market_rows = np.flatnonzero(np.isfinite(market))
+    market_residuals = market[market_rows] - market[market_rows].mean()
+    cached, market_refit = cached_row(market_symbol, market_rows)
+    market_params = fit_gjr_garch(market_residuals, cached[:4])[0] if market_refit else tuple(cached[:4])
+    market_sigma = np.full(len(market), np.nan)
+    market_sigma[market_rows] = np.sqrt(gjr_variance(market_residuals, market_params))
+    market_z = np.full(len(market), np.nan)
+    market_z[market_rows] = market_residuals / market_sigma[market_rows]
+
+    n_dates, n_symbols = returns.shape
+    valid = np.isfinite(returns) & np.isfinite(market)[:, None]
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+    fitted = np.flatnonzero(valid.sum(axis=0) >= min_observations)
+    starts, refits = [], []
+    for j in fitted:
+        row, refit = cached_row(symbols[j], np.flatnonzero(valid[:, j]))
+        starts.append(row)
+        refits.append(refit)
+    starts = np.array(starts).reshape(len(fitted), len(columns))
+    refits = np.array(refits, dtype=bool)
+
+    def task(lo, hi):
+        part = fitted[lo:hi]
+        return (np.asarray(returns[:, part], dtype=np.float64) * RETURN_SCALE, valid[:, part],
+                market_sigma, market_z, starts[lo:hi], refits[lo:hi])
+
+    betas = np.full((n_dates, n_symbols), np.nan)
+    params = np.full((len(fitted), len(columns)), np.nan)
+    iterations = np.zeros(len(fitted), dtype=np.int64)
+    for lo, hi, output in map_symbol_chunks(_fit_symbols, len(fitted), task, workers):
+        betas[:, fitted[lo:hi]], params[lo:hi], iterations[lo:hi] = output
+
+    last_rows = [np.flatnonzero(valid[:, j])[-1] for j in fitted]
+    frame = pd.DataFrame(params, index=pd.Index([symbols[j] for j in fitted], name='symbol'), columns=columns)
+    frame['last_date'] = dates[last_rows] if len(fitted) else pd.DatetimeIndex([])
+    frame['observations'] = valid[:, fitted].sum(axis=0)
+    frame['refit'] = refits
+    frame['iterations'] = iterations
+    frame.loc[market_symbol, list(GARCH_PARAMS)] = market_params
+    frame.loc[market_symbol, ['last_date', 'observations', 'refit']] = (
+        dates[market_rows[-1]] if len(market_rows) else pd.NaT, len(market_rows), market_refit)
+    return betas, frame
+
+
+def dcc_betas_from_matrix(matrix, symbols=None, cache_path=GARCH_CACHE_PATH, **kwargs):
+    """
+    Conditional betas for the stocks of a ReturnsMatrix, cached in cache_path.
+
+    Returns:
+        tuple: (DataFrame dates x symbols of betas, DataFrame of parameters)
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    betas, params = dcc_betas(returns, market, matrix.dates, symbols, mask=mask,
+                              market_symbol=matrix.market_symbol,
+                              cache=load_cache(cache_path), **kwargs)
+    if cache_path is not None:
+        cache = load_cache(cache_path).drop(index=params.index, errors='ignore')
+        updated = pd.concat([cache, params.drop(columns=['refit', 'iterations'])])
+        updated['last_date'] = pd.to_datetime(updated['last_date'])
+        updated['observations'] = updated['observations'].astype(np.int64)
+        updated.to_parquet(cache_path)
+    return pd.DataFrame(betas, index=matrix.dates, columns=symbols), params
+
+
+def summarize_dcc_betas(betas, market):
+    """
+    Latest conditional beta and its average over up- and down-market days.
+
+    Args:
+        betas (pandas.DataFrame): dates x symbols conditional betas
+        market (numpy.ndarray): Market returns for the same dates
+
+    Returns:
+        pandas.DataFrame: One row per symbol with DCC_BETA_TYPES columns
+    """
+    values = betas.to_numpy()
+    market = np.asarray(market, dtype=np.float64)
+    latest = pd.DataFrame(values).ffill().to_numpy()[-1] if len(values) else np.full(values.shape[1], np.nan)
+    with np.errstate(invalid='ignore'):
+        positive = np.nanmean(np.where((market > 0)[:, None], values, np.nan), axis=0)
+        negative = np.nanmean(np.where((market < 0)[:, None], values, np.nan), axis=0)
+    return pd.DataFrame(np.column_stack([latest, positive, negative]),
+                        index=pd.Index(betas.columns, name='symbol'), columns=list(DCC_BETA_TYPES))
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MATRIX_PATH
+    matrix = open_returns_matrix(path)
+    if matrix is None:
+        return
+
+    start = time.perf_counter()
+    betas, params = dcc_betas_from_matrix(matrix)
+    elapsed = time.perf_counter() - start
+
+    stocks = params.drop(index=matrix.market_symbol)
+    refit = stocks['refit'].astype(bool)
+    print(f"Fitted {len(stocks)} stocks in {elapsed:.2f}s ({refit.sum()} refitted, "
+          f"{(~refit).sum()} reused from {GARCH_CACHE_PATH})")
+    if refit.any():
+        print(f"Optimizer iterations per refit: {stocks.loc[refit, 'iterations'].mean():.1f}")
+
+    summary = summarize_dcc_betas(betas, matrix.market().reindex(matrix.dates).to_numpy())
+    print(f"Mean conditional beta on up-market days: {summary['dcc_positive_beta'].mean():.3f}")
+    print(f"Mean conditional beta on down-market days: {summary['dcc_negative_beta'].mean():.3f}")
+
+    summary.join(stocks[list(GARCH_PARAMS + DCC_PARAMS)]).to_csv(DCC_RESULTS_PATH)
+    path_frame({'dcc_beta': betas}).to_parquet(DCC_PATH_PATH)
+    print(f"Results saved to '{DCC_RESULTS_PATH}' and '{DCC_PATH_PATH}'")
+
+
+if __name__ == "__main__":
+    main()
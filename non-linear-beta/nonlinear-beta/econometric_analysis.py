@@ -10,6 +10,9 @@ from scipy import stats
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from asymmetry_tests import ASYMMETRY_RESULTS_PATH, asymmetry_tests_from_matrix, newey_west_lags
+from returns_matrix import DEFAULT_MATRIX_PATH, open_returns_matrix
+
 def load_data():
     """Load the beta results data."""
     try:
@@ -63,6 +66,30 @@ def perform_paired_ttest(df):
     
     return t_stat, p_value, effect_size
 
+def perform_robust_ttest(df):
+    """Paired t-tests on the Huber and Theil-Sen positive vs negative betas."""
+    print("\n" + "="*60)
+    print("ROBUST PAIRED T-TESTS: POSITIVE VS NEGATIVE BETAS")
+    print("="*60)
+    
+    results = {}
+    for estimator, label in [('huber', 'Huber'), ('theil_sen', 'Theil-Sen')]:
+        columns = [f'{estimator}_positive_beta', f'{estimator}_negative_beta']
+        if not set(columns).issubset(df.columns):
+            print(f"{label} betas not found in the results. Re-run the main analysis.")
+            continue
+        clean_df = df.dropna(subset=columns)
+        if len(clean_df) < 2:
+            continue
+        
+        t_stat, p_value = stats.ttest_rel(clean_df[columns[0]], clean_df[columns[1]])
+        difference = clean_df[columns[0]].mean() - clean_df[columns[1]].mean()
+        print(f"{label:<10} N={len(clean_df)}, mean difference: {difference:.4f}, "
+              f"T-statistic: {t_stat:.4f}, P-value: {p_value:.6f}")
+        results[estimator] = (t_stat, p_value)
+    
+    return results
+
 def test_sector_asymmetry(df):
     """Test for significant asymmetry within each sector."""
     print("\n" + "="*60)
@@ -191,6 +218,47 @@ def test_extreme_cases(df):
     
     return top_asymmetric
 
+def test_time_series_asymmetry(matrix_path=DEFAULT_MATRIX_PATH, alpha=0.05):
+    """
+    Per-stock test of positive beta = negative beta on the return series.
+    
+    Uses the piecewise regression of asymmetry_tests.py with Newey-West
+    standard errors and Benjamini-Hochberg control of the false discovery
+    rate across all stocks.
+    """
+    print("\n" + "="*60)
+    print("PER-STOCK ASYMMETRY TESTS (PIECEWISE REGRESSION, HAC)")
+    print("="*60)
+    
+    matrix = open_returns_matrix(matrix_path)
+    if matrix is None:
+        print("Skipping per-stock tests.")
+        return None
+    
+    # K is excluded before testing so it is not part of the FDR family
+    symbols = [s for s in matrix.stock_symbols() if s != 'K']
+    results_df = asymmetry_tests_from_matrix(matrix, symbols=symbols, alpha=alpha)
+    tested = results_df.dropna(subset=['p_value'])
+    
+    print(f"Stocks tested: {len(tested)}")
+    print(f"Newey-West lags: {newey_west_lags(len(matrix.dates))}")
+    print(f"Significant at {alpha:.0%} (unadjusted): {(tested['p_value'] < alpha).sum()}")
+    print(f"Significant at {alpha:.0%} FDR (Benjamini-Hochberg): {tested['significant'].sum()}")
+    
+    significant = tested[tested['significant']].sort_values('q_value')
+    if len(significant) > 0:
+        print("\nMost Significant Asymmetries:")
+        print("-" * 80)
+        print(f"{'Stock':<8} {'Pos_Beta':<10} {'Neg_Beta':<10} {'Difference':<12} {'Wald':<10} {'Q-Value':<10}")
+        print("-" * 80)
+        for stock, row in significant.head(10).iterrows():
+            print(f"{stock:<8} {row['positive_beta']:<10.3f} {row['negative_beta']:<10.3f} "
+                  f"{row['beta_difference']:<12.3f} {row['wald_statistic']:<10.3f} {row['q_value']:<10.4f}")
+    
+    results_df.to_csv(ASYMMETRY_RESULTS_PATH)
+    print(f"\nPer-stock results saved to '{ASYMMETRY_RESULTS_PATH}'")
+    return results_df
+
 def perform_regression_analysis(df):
     """Perform regression analysis to test for systematic patterns."""
     print("\n" + "="*60)
@@ -244,9 +312,11 @@ def main():
     
     # Perform analyses
     t_stat, p_value, effect_size = perform_paired_ttest(df)
+    robust_tests = perform_robust_ttest(df)
     sector_results = test_sector_asymmetry(df)
     extreme_cases = test_extreme_cases(df)
     perform_regression_analysis(df)
+    stock_tests = test_time_series_asymmetry()
     
     # Summary
     print("\n" + "="*60)
@@ -276,6 +346,14 @@ def main():
     
     print(f"✓ {extreme_significant} out of 10 extreme cases are statistically significant")
     
+    if stock_tests is not None:
+        print(f"✓ {stock_tests['significant'].sum()} stocks show significant asymmetry "
+              f"in their own returns (HAC Wald test, 5% FDR)")
+    
+    for estimator, (robust_t, robust_p) in robust_tests.items():
+        verdict = "✓" if robust_p < 0.05 else "✗"
+        print(f"{verdict} Asymmetry with {estimator.replace('_', '-')} betas: P-value {robust_p:.6f}")
+    
     print("\nAnalysis complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Exponentially weighted traditional / up-market / down-market betas.
+
+Every day's contribution to the per-regime moments (n, x, y, x^2, xy masked
+by regime and validity) is discounted by lambda = 0.5 ** (1 / half_life)
+per trading day, so the betas follow a stock whose risk profile shifted
+instead of weighting 2016 like last month. The discounted sums obey
+
+    S_t = lambda * S_{t-1} + c_t
+
+which is a first-order IIR filter: the full history of every symbol and
+regime is one scipy.signal.lfilter call along time, and the filter state
+(the latest sums) is all that has to be kept. A new day is then one
+vectorized update of that state instead of a full-history recompute.
+
+Betas are weighted cov / var over the regime days (the weights cancel, so
+there is no ddof); the usual thresholds apply to the raw day counts.
+
+Usage:
+    python ewma_beta.py                  # update the saved state from returns_matrix.bin
+    python ewma_beta.py 63               # another half-life (rebuilds the state)
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from beta_engine import MIN_OBSERVATIONS, MIN_REGIME_DAYS, regime_usable, sign_regimes
+from returns_matrix import DEFAULT_MATRIX_PATH, open_returns_matrix
+
+EWMA_BETA_TYPES = ('ewma_beta', 'ewma_positive_beta', 'ewma_negative_beta')
+
+# Half-life in trading days (about six months)
+EWMA_HALF_LIFE = 126
+EWMA_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ewma_beta_state.npz')
+EWMA_PATH_PATH = 'sp500_ewma_beta_path.parquet'
+
+# Symbols per block; bounds the filter buffers (dates x 5 x block x 3)
+EWMA_BLOCK_SIZE = 256
+
+
+def _contributions(returns, market, mask):
+    """Daily moment contributions (dates x 5 x symbols x 3) and regime day counts."""
+    valid = np.isfinite(returns) & np.isfinite(market)[:, None]
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+    w = (valid[:, :, None] & sign_regimes(market)[:, None, :]).astype(np.float64)
+    x = np.where(np.isfinite(market), market, 0.0)[:, None, None]
+    yw = np.where(valid, returns, 0.0)[:, :, None] * w
+    return np.stack([w, w * x, yw, w * x * x, yw * x], axis=1), w
+
+
+def _betas(sums, counts, min_observations, min_regime_days):
+    """Betas from (..., 5, symbols, 3) sums and (..., symbols, 3) raw counts."""
+    n, sx, sy, sxx, sxy = np.moveaxis(sums, -3, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = n * sxy - sx * sy
+        variance = n * sxx - sx * sx
+        betas = covariance / variance
+    usable = (variance > 0) & regime_usable(counts, min_observations, min_regime_days)
+    return np.where(usable, betas, np.nan)
+
+
+class EWMABetaState:
+    """
+    Discounted per-regime moments of every symbol against the market.
+
+    Args:
+        symbols (list): Column names
+        half_life (float): Half-life of the weights in trading days
+
+    Attributes:
+        sums (numpy.ndarray): 5 x symbols x 3 discounted sums (n, Sx, Sy, Sxx, Sxy)
+        counts (numpy.ndarray): symbols x 3 raw regime day counts
+        last_date (pandas.Timestamp): Date of the last update, or None
+    """
+
+    def __init__(self, symbols, half_life=EWMA_HALF_LIFE):
+        self.symbols = list(symbols)
+        self.half_life = float(half_life)
+        self.decay = 0.5 ** (1.0 / self.half_life)
+        self.sums = np.zeros((5, len(self.symbols), 3))
+        self.counts = np.zeros((len(self.symbols), 3))
+        self.last_date = None
+
+    def update(self, returns, market, mask=None, dates=None, path=False,
+               min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS,
+               block_size=EWMA_BLOCK_SIZE):
+        """
+        Advance the state by one or more days.
+
+        Args:
+            returns (numpy.ndarray): dates x symbols returns, or one day's
+                returns per symbol (NaN where missing)
+            market (numpy.ndarray): Market returns for the same dates (or a scalar)
+            mask (numpy.ndarray, optional): Validity mask shaped like returns
+            dates (pandas.DatetimeIndex, optional): Dates of the rows
+            path (bool): Also return the betas after every day
+            min_observations (int): Minimum days for any beta in the path
+            min_regime_days (int): A regime beta needs more than this many days
+            block_size (int): Symbols filtered per block
+
+        Returns:
+            numpy.ndarray: dates x symbols x 3 betas if path, otherwise None
+        """
+        returns = np.atleast_2d(np.asarray(returns, dtype=np.float64))
+        market = np.atleast_1d(np.asarray(market, dtype=np.float64))
+        if mask is not None:
+            mask = np.atleast_2d(mask)
+        n_dates, n_symbols = returns.shape
+        betas = np.full((n_dates, n_symbols, 3), np.nan) if path else None
+
+        for lo in range(0, n_symbols, block_size):
+            hi = min(lo + block_size, n_symbols)
+            contributions, days = _contributions(returns[:, lo:hi], market,
+                                                 None if mask is None else mask[:, lo:hi])
+            # S_t = decay * S_{t-1} + c_t, started from the current state
+            sums, _ = signal.lfilter([1.0], [1.0, -self.decay], contributions, axis=0,
+                                     zi=self.decay * self.sums[None, :, lo:hi])
+            counts = self.counts[lo:hi] + np.cumsum(days, axis=0)
+            if path:
+                betas[:, lo:hi] = _betas(sums, counts, min_observations, min_regime_days)
+            if n_dates:
+                self.sums[:, lo:hi] = sums[-1]
+                self.counts[lo:hi] = counts[-1]
+
+        if dates is not None and len(dates):
+            self.last_date = pd.Timestamp(dates[-1])
+        return betas
+
+    def betas(self, min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS):
+        """Latest betas, symbols x 3 in EWMA_BETA_TYPES order (NaN where undefined)."""
+        return _betas(self.sums, self.counts, min_observations, min_regime_days)
+
+    def to_frame(self, **kwargs):
+        """Latest betas as a DataFrame indexed by symbol."""
+        return pd.DataFrame(self.betas(**kwargs), index=pd.Index(self.symbols, name='symbol'),
+                            columns=list(EWMA_BETA_TYPES))
+
+    def update_from_matrix(self, matrix, path=False, **kwargs):
+        """
+        Advance the state by the rows of a ReturnsMatrix after last_date.
+
+        Returns:
+            dict: EWMA_BETA_TYPES -> DataFrame (new dates x symbols) if path, otherwise None
+        """
+        start = 0 if self.last_date is None else int(matrix.dates.searchsorted(self.last_date, 'right'))
+        _, returns, market, mask = matrix.stock_panel(self.symbols, rows=slice(start, None))
+        dates = matrix.dates[start:]
+
+        betas = self.update(returns, market, mask=mask, dates=dates, path=path, **kwargs)
+        if not path:
+            return None
+        return {name: pd.DataFrame(betas[:, :, i], index=dates, columns=self.symbols)
+                for i, name in enumerate(EWMA_BETA_TYPES)}
+
+    @classmethod
+    def from_matrix(cls, matrix, half_life=EWMA_HALF_LIFE, symbols=None, path=False, **kwargs):
+        """
+        State built from the full history of a ReturnsMatrix.
+
+        Returns:
+            tuple: (EWMABetaState, path panels from update_from_matrix or None)
+        """
+        symbols = matrix.stock_symbols() if symbols is None else list(symbols)
+        state = cls(symbols, half_life)
+        return state, state.update_from_matrix(matrix, path=path, **kwargs)
+
+    def save(self, path=EWMA_STATE_PATH):
+        """Write the state to an .npz file."""
+        np.savez(path, symbols=np.array(self.symbols), half_life=self.half_life,
+                 sums=self.sums, counts=self.counts,
+                 last_date=np.datetime64('NaT' if self.last_date is None else self.last_date, 'ns'))
+
+    @classmethod
+    def load(cls, path=EWMA_STATE_PATH):
+        """Read a state written by save()."""
+        with np.load(path) as data:
+            state = cls(data['symbols'].tolist(), float(data['half_life']))
+            state.sums = data['sums']
+            state.counts = data['counts']
+            last_date = data['last_date'][()]
+        state.last_date = None if np.isnat(last_date) else pd.Timestamp(last_date)
+        return state
+
+
+def main():
+    half_life = float(sys.argv[1]) if len(sys.argv) > 1 else EWMA_HALF_LIFE
+    matrix = open_returns_matrix(DEFAULT_MATRIX_PATH)
+    if matrix is None:
+        return
+
+    try:
+        state = EWMABetaState.load(EWMA_STATE_PATH)
+        if state.half_life != half_life or not set(state.symbols).issubset(matrix.symbols):
+            raise ValueError("state does not match")
+        print(f"Loaded EWMA state up to {state.last_date.date()}")
+    except (FileNotFoundError, ValueError, AttributeError):
+        state = EWMABetaState(matrix.stock_symbols(), half_life)
+        print(f"Building EWMA state (half-life {half_life:g} days) from {len(matrix.dates)} days")
+
+    before = state.last_date
+    state.update_from_matrix(matrix)
+    if state.last_date is None:
+        print("Returns matrix has no dates")
+        return
+    if state.last_date == before:
+        print("No new days in the returns matrix")
+    state.save(EWMA_STATE_PATH)
+
+    latest = state.to_frame()
+    print(f"EWMA betas up to {state.last_date.date()} for {latest['ewma_beta'].notna().sum()} stocks")
+    print(f"Mean EWMA positive beta: {latest['ewma_positive_beta'].mean():.3f}")
+    print(f"Mean EWMA negative beta: {latest['ewma_negative_beta'].mean():.3f}")
+
+
+if __name__ == "__main__":
+    main()
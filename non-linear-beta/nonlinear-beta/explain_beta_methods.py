@@ -18,7 +18,7 @@ import os
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from getBars import getBars
+from getBars import getBars, getBenchmarkBars
 
 def explain_mathematical_relationship():
     """
@@ -87,7 +87,7 @@ def demonstrate_with_real_data(symbol="NVDA", months_back=60):
     start_date = end_date - timedelta(days=int(months_back/12*365) + 30)
     
     stock_data = getBars(symbol, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
-    market_data = getBars('^GSPC', start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    market_data = getBenchmarkBars('^GSPC', start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
     
     if stock_data is None or market_data is None:
         print(f"❌ Could not get data for {symbol}")
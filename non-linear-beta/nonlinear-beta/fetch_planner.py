@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Incremental fetch planner for the bar store.
+
+Works out, for every symbol, which date ranges are missing from the local
+bar store, groups symbols that share the same gap, and downloads each group
+with a single multi-symbol request. A nightly refresh of the S&P 500 where
+every symbol is one bar behind therefore becomes a handful of small batched
+calls instead of 500 full-history downloads.
+
+Usage:
+    python fetch_planner.py                  # refresh sp500_wikipedia_data.csv symbols
+    python fetch_planner.py 2015-01-01       # ... from a given start date
+"""
+
+import sys
+from collections import namedtuple, defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+from bar_store import get_default_store
+from getBars import INTERVAL_MAP, _coverage_end, _download_group, _has_sessions, _store_interval
+from rate_limiter import AdaptiveConcurrency, RequestScheduler
+
+
+# One planned download: every symbol in `symbols` is missing [start, end)
+FetchRequest = namedtuple('FetchRequest', ['start', 'end', 'symbols'])
+
+
+def plan_fetches(symbols, start_date, end_date, timeframe='1Day', store=None, max_batch=100):
+    """
+    Plan the downloads needed to bring symbols up to [start_date, end_date).
+
+    Args:
+        symbols (list): Stock symbols
+        start_date (str): Start date in 'YYYY-MM-DD' format
+        end_date (str): End date in 'YYYY-MM-DD' format (exclusive)
+        timeframe (str): Bar timeframe as accepted by getBars
+        store (BarStore, optional): Bar store to plan against (default store if None)
+        max_batch (int): Maximum number of symbols per request
+
+    Returns:
+        list: FetchRequest tuples, largest groups first
+    """
+    store = store or get_default_store()
+    interval = _store_interval(INTERVAL_MAP.get(timeframe, '1d'))
+    covered_end = _coverage_end(end_date)
+
+    groups = defaultdict(list)
+    for symbol in dict.fromkeys(symbols):
+        for gap in store.missing_ranges(symbol, interval, start_date, covered_end):
+            groups[gap].append(symbol)
+
+    plan = []
+    for (gap_start, gap_end), gap_symbols in sorted(groups.items(), key=lambda item: -len(item[1])):
+        for i in range(0, len(gap_symbols), max_batch):
+            plan.append(FetchRequest(gap_start, gap_end, gap_symbols[i:i + max_batch]))
+    return plan
+
+
+def execute_plan(plan, end_date, timeframe='1Day', store=None, scheduler=None):
+    """
+    Issue the planned requests and append the new bars to the store.
+
+    Each symbol's file is rewritten through BarStore.merge, which replaces it
+    atomically, so an interrupted refresh leaves every file either fully
+    updated or untouched. Gaps that contain no NYSE session (a weekend or
+    holiday) are marked as covered without a network call.
+
+    Args:
+        plan (list): FetchRequest tuples from plan_fetches
+        end_date (str): The end date the plan was built for
+        timeframe (str): Bar timeframe as accepted by getBars
+        store (BarStore, optional): Bar store to update (default store if None)
+        scheduler (RequestScheduler, optional): Rate/concurrency control for the
+            downloads; requests run one at a time if None
+
+    Returns:
+        dict: {'requests': n, 'updated': [...], 'empty': [...]}
+    """
+    store = store or get_default_store()
+    interval = INTERVAL_MAP.get(timeframe, '1d')
+    store_interval = _store_interval(interval)
+    covered_end = _coverage_end(end_date)
+    if scheduler is None:
+        scheduler = RequestScheduler(concurrency=AdaptiveConcurrency(initial=1, maximum=1))
+
+    summary = {'requests': 0, 'updated': [], 'empty': []}
+    downloads = []
+    for request in plan:
+        # The tail gap is downloaded up to the caller's end date so that a
+        # still-forming bar is returned, even though it is not marked covered
+        download_end = pd.Timestamp(end_date) if request.end == covered_end else request.end
+
+        if not _has_sessions(request.start, download_end):
+            for symbol in request.symbols:
+                store.merge(symbol, store_interval, None, request.start, request.end)
+        else:
+            downloads.append((request, download_end))
+
+    def download(item):
+        request, download_end = item
+        print(f"Fetching {request.start:%Y-%m-%d} -> {download_end:%Y-%m-%d} "
+              f"for {len(request.symbols)} symbols")
+        return _download_group(request.symbols, request.start.strftime('%Y-%m-%d'),
+                               download_end.strftime('%Y-%m-%d'), interval)
+
+    for (request, _), bars, error in scheduler.map(download, downloads):
+        if error is not None:
+            print(f"Error fetching batch starting {request.symbols[0]}: {error}")
+            bars = {}
+        summary['requests'] += 1
+
+        for symbol in request.symbols:
+            if symbol in bars:
+                store.merge(symbol, store_interval, bars[symbol], request.start, request.end)
+                summary['updated'].append(symbol)
+            else:
+                # Leave coverage untouched so the symbol is retried next run
+                summary['empty'].append(symbol)
+
+    return summary
+
+
+def refresh_bars(symbols, start_date, end_date=None, timeframe='1Day', store=None, max_batch=100,
+                 scheduler=None):
+    """
+    Bring the bar store up to date for symbols over [start_date, end_date).
+
+    Returns:
+        dict: Summary from execute_plan plus the planned request count
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+
+    plan = plan_fetches(symbols, start_date, end_date, timeframe, store, max_batch)
+    if not plan:
+        print(f"Bar store up to date for {len(symbols)} symbols")
+        return {'planned': 0, 'requests': 0, 'updated': [], 'empty': []}
+
+    print(f"Planned {len(plan)} requests for {sum(len(r.symbols) for r in plan)} symbol gaps")
+    summary = execute_plan(plan, end_date, timeframe, store, scheduler)
+    summary['planned'] = len(plan)
+    print(f"Refresh complete: {summary['requests']} requests, "
+          f"{len(summary['updated'])} updated, {len(summary['empty'])} without new bars")
+    return summary
+
+
+def main():
+    start_date = sys.argv[1] if len(sys.argv) > 1 else '2015-01-01'
+
+    try:
+        symbols = pd.read_csv('sp500_wikipedia_data.csv')['symbol'].tolist()
+    except FileNotFoundError:
+        print("Wikipedia data file not found. Please run sp500_wikipedia_scraper.py first.")
+        return
+
+    refresh_bars(symbols + ['SPY', '^GSPC'], start_date, scheduler=RequestScheduler())
+
+
+if __name__ == "__main__":
+    main()
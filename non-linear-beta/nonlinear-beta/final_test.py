@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 print("NVIDIA BETA CALCULATION - WORKING")
 
 # Get data
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 # Simple arrays
 nvda_prices = nvda['Close'].values
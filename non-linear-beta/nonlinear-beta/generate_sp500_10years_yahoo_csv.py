@@ -5,19 +5,77 @@ Using the exact method validated for 5-year analysis, extended to 10 years
 """
 
 import pandas as pd
-import numpy as np
 import sys
 import os
-import time
 from datetime import datetime, timedelta
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from getBars import getBars
+from getBars import getBars, getBarsMany, getBenchmarkBars
+from period_returns import period_returns, recent_common_mask
+from beta_engine import ols_diagnostics
+
+def calculate_yahoo_betas_10y(closes, market_symbol='^GSPC'):
+    """
+    Calculate 10-year betas for many symbols at once using exact Yahoo Finance methodology.
+    
+    Monthly returns come from one pass over the daily closes (period_returns.py)
+    and every linregress (all, positive and negative months) plus the
+    volatility and mean statistics from one batched call
+    (beta_engine.ols_diagnostics).
+    
+    Args:
+        closes (dict): symbol -> daily close Series, including the market
+        market_symbol (str): Market key in closes
+    
+    Returns:
+        dict: symbol -> CSV row; symbols with fewer than 60 months are omitted
+    """
+    # End of Month method (the one that matched perfectly)
+    monthly = period_returns(closes, ('monthly',))['monthly']
+    symbols = [s for s in monthly.columns if s != market_symbol]
+    stock_ret = monthly[symbols].to_numpy()
+    market_ret = monthly[market_symbol].to_numpy()
+    
+    # Align data, limited to the last 120 months of each symbol
+    window = recent_common_mask(stock_ret, market_ret, 120)
+    fits = ols_diagnostics(stock_ret, market_ret, mask=window, residuals=False)
+    months = window.sum(axis=0)
+    
+    results = {}
+    for j, symbol in enumerate(symbols):
+        if months[j] < 60:  # Need at least 60 months for meaningful 10Y analysis
+            continue
+        dates = monthly.index[window[:, j]]
+        positive_months = fits['n'][j, 1]
+        negative_months = fits['n'][j, 2]
+        volatility = fits['std_y'][j, 0]
+        
+        results[symbol] = {
+            'Symbol': symbol,
+            'Beta_10Y_Yahoo': fits['slope'][j, 0],
+            'Correlation': fits['rvalue'][j, 0],
+            'R_Squared': fits['rvalue'][j, 0] ** 2,
+            'Positive_Beta': fits['slope'][j, 1] if positive_months > 10 else None,
+            'Negative_Beta': fits['slope'][j, 2] if negative_months > 10 else None,
+            'Alpha': fits['intercept'][j, 0],
+            'Standard_Error': fits['stderr'][j, 0],
+            'Volatility': volatility,
+            'Market_Volatility': fits['std_x'][j, 0],
+            'Sharpe_Ratio': fits['mean_y'][j, 0] / volatility if volatility > 0 else None,
+            'Months': int(months[j]),
+            'Positive_Months': positive_months,
+            'Negative_Months': negative_months,
+            'Start_Date': dates[0].strftime('%Y-%m'),
+            'End_Date': dates[-1].strftime('%Y-%m'),
+            'Avg_Monthly_Return': fits['mean_y'][j, 0],
+            'Market_Avg_Return': fits['mean_x'][j, 0]
+        }
+    return results
 
 def calculate_yahoo_beta_10y(symbol, market_symbol='^GSPC'):
     """
-    Calculate 10-year beta using exact Yahoo Finance methodology.
+    Calculate 10-year beta for one symbol using exact Yahoo Finance methodology.
     """
     # Calculate exact 10-year period (120 months back from now)
     end_date = datetime.now()
@@ -29,89 +87,13 @@ def calculate_yahoo_beta_10y(symbol, market_symbol='^GSPC'):
     try:
         # Get data
         stock_data = getBars(symbol, start_str, end_str)
-        market_data = getBars(market_symbol, start_str, end_str)
+        market_data = getBenchmarkBars(market_symbol, start_str, end_str)
         
         if stock_data is None or market_data is None:
             return None
         
-        # End of Month method (the one that matched perfectly)
-        stock_monthly = stock_data['close'].resample('ME').last()
-        market_monthly = market_data['close'].resample('ME').last()
-        
-        # Calculate monthly returns
-        stock_returns = stock_monthly.pct_change().dropna()
-        market_returns = market_monthly.pct_change().dropna()
-        
-        # Align data
-        common_dates = stock_returns.index.intersection(market_returns.index)
-        if len(common_dates) < 60:  # Need at least 60 months for meaningful 10Y analysis
-            return None
-            
-        stock_aligned = stock_returns.loc[common_dates]
-        market_aligned = market_returns.loc[common_dates]
-        
-        # Limit to exactly 120 months if we have more
-        if len(stock_aligned) > 120:
-            stock_aligned = stock_aligned.tail(120)
-            market_aligned = market_aligned.tail(120)
-        
-        # Calculate beta using regression method
-        stock_ret = stock_aligned.values
-        market_ret = market_aligned.values
-        
-        from scipy import stats
-        slope, intercept, r_value, p_value, std_err = stats.linregress(market_ret, stock_ret)
-        beta = slope
-        r_squared = r_value ** 2
-        correlation = stock_aligned.corr(market_aligned)
-        
-        # Calculate nonlinear betas
-        positive_mask = market_ret > 0
-        negative_mask = market_ret < 0
-        
-        positive_beta = None
-        negative_beta = None
-        
-        if np.sum(positive_mask) > 10:
-            stock_pos = stock_ret[positive_mask]
-            market_pos = market_ret[positive_mask]
-            if len(stock_pos) > 1:
-                slope_pos, _, _, _, _ = stats.linregress(market_pos, stock_pos)
-                positive_beta = slope_pos
-                
-        if np.sum(negative_mask) > 10:
-            stock_neg = stock_ret[negative_mask]
-            market_neg = market_ret[negative_mask]
-            if len(stock_neg) > 1:
-                slope_neg, _, _, _, _ = stats.linregress(market_neg, stock_neg)
-                negative_beta = slope_neg
-        
-        # Calculate additional statistics
-        volatility = stock_ret.std()
-        market_volatility = market_ret.std()
-        alpha = intercept
-        sharpe_ratio = stock_ret.mean() / stock_ret.std() if stock_ret.std() > 0 else None
-        
-        return {
-            'Symbol': symbol,
-            'Beta_10Y_Yahoo': beta,
-            'Correlation': correlation,
-            'R_Squared': r_squared,
-            'Positive_Beta': positive_beta,
-            'Negative_Beta': negative_beta,
-            'Alpha': alpha,
-            'Standard_Error': std_err,
-            'Volatility': volatility,
-            'Market_Volatility': market_volatility,
-            'Sharpe_Ratio': sharpe_ratio,
-            'Months': len(stock_aligned),
-            'Positive_Months': np.sum(positive_mask),
-            'Negative_Months': np.sum(negative_mask),
-            'Start_Date': stock_aligned.index[0].strftime('%Y-%m'),
-            'End_Date': stock_aligned.index[-1].strftime('%Y-%m'),
-            'Avg_Monthly_Return': stock_ret.mean(),
-            'Market_Avg_Return': market_ret.mean()
-        }
+        closes = {symbol: stock_data['close'], market_symbol: market_data['close']}
+        return calculate_yahoo_betas_10y(closes, market_symbol).get(symbol)
         
     except Exception as e:
         print(f"Error processing {symbol}: {e}")
@@ -184,58 +166,47 @@ def main():
     print("Fetching S&P 500 index data...")
     end_date = datetime.now()
     start_date = end_date - timedelta(days=10*365 + 60)
-    market_data = getBars('^GSPC', start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    market_symbol = '^GSPC'
+    market_data = getBenchmarkBars(market_symbol, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
     
     if market_data is None:
         print("Failed to get S&P 500 data! Using SPY fallback...")
-        market_data = getBars('SPY', start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        market_symbol = 'SPY'
+        market_data = getBenchmarkBars(market_symbol, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
         if market_data is None:
             print("❌ Failed to get market data!")
             return
     
     print(f"Market data: {len(market_data)} days")
     
-    # Process stocks in batches
-    batch_size = 50
-    total_batches = (len(all_symbols) + batch_size - 1) // batch_size
+    # Fetch all stocks with multi-ticker requests, then compute every beta at once
+    print(f"Fetching daily bars for {len(all_symbols)} symbols...")
+    bars = getBarsMany(all_symbols, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    closes = {symbol: df['close'] for symbol, df in bars.items() if symbol != market_symbol}
+    closes[market_symbol] = market_data['close']
+    
+    try:
+        betas = calculate_yahoo_betas_10y(closes, market_symbol)
+    except Exception as e:
+        print(f"❌ Error calculating betas: {e}")
+        return
+    
     results = []
     failed_stocks = []
-    
-    for batch_num in range(total_batches):
-        start_idx = batch_num * batch_size
-        end_idx = min(start_idx + batch_size, len(all_symbols))
-        batch_symbols = all_symbols[start_idx:end_idx]
+    for i, symbol in enumerate(all_symbols):
+        print(f"  {i + 1}/{len(all_symbols)}: {symbol}", end=" ")
+        result = betas.get(symbol)
         
-        print(f"\nProcessing batch {batch_num + 1}/{total_batches} ({len(batch_symbols)} symbols)")
-        
-        for i, symbol in enumerate(batch_symbols):
-            print(f"  {start_idx + i + 1}/{len(all_symbols)}: {symbol}", end=" ")
+        if result is not None:
+            results.append(result)
+            print(f"✅ Beta: {result['Beta_10Y_Yahoo']:.3f} (R²={result['R_Squared']:.3f}, {result['Months']}m)")
             
-            try:
-                result = calculate_yahoo_beta_10y(symbol)
-                
-                if result is not None:
-                    results.append(result)
-                    print(f"✅ Beta: {result['Beta_10Y_Yahoo']:.3f} (R²={result['R_Squared']:.3f}, {result['Months']}m)")
-                    
-                    # Special highlight for key stocks
-                    if symbol in ['NVDA', 'TSLA', 'PLTR', 'COIN', 'AAPL', 'MSFT']:
-                        print(f"    🎯 {symbol}: {result['Beta_10Y_Yahoo']:.3f}")
-                else:
-                    failed_stocks.append(symbol)
-                    print("❌ Failed")
-                    
-                # Small delay to avoid overwhelming the API
-                time.sleep(0.05)
-                
-            except Exception as e:
-                print(f"❌ Error: {e}")
-                failed_stocks.append(symbol)
-        
-        # Longer delay between batches
-        if batch_num < total_batches - 1:
-            print(f"  Batch complete. Waiting 2 seconds...")
-            time.sleep(2)
+            # Special highlight for key stocks
+            if symbol in ['NVDA', 'TSLA', 'PLTR', 'COIN', 'AAPL', 'MSFT']:
+                print(f"    🎯 {symbol}: {result['Beta_10Y_Yahoo']:.3f}")
+        else:
+            failed_stocks.append(symbol)
+            print("❌ Failed")
     
     # Save results
     if results:
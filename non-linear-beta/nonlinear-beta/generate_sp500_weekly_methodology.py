@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Generate S&P 500 5-Year Weekly and Monthly Beta CSV
+Weekly (260 weeks) and Yahoo-style monthly (60 months) betas against ^GSPC,
+both taken from the same daily close panel (see period_returns.py)
+"""
+
+import pandas as pd
+import numpy as np
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add current directory to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from getBars import getBarsMany, getBenchmarkBars
+from period_returns import period_betas, period_returns
+
+WEEKS = 260
+MONTHS = 60
+MIN_WEEKS = 104  # Need at least 2 years of weekly returns
+MIN_MONTHS = 24  # Need at least 24 months
+OUTPUT_FILE = 'sp500_weekly_methodology.csv'
+
+def load_symbols():
+    """S&P 500 symbols from the Wikipedia scrape."""
+    try:
+        sp500_df = pd.read_csv('sp500_wikipedia_data.csv')
+        symbols = sp500_df['symbol'].tolist()
+        print(f"Loaded {len(symbols)} S&P 500 symbols")
+        return symbols
+    except Exception as e:
+        print(f"Error loading S&P 500 data: {e}")
+        print("Please run sp500_wikipedia_scraper.py first.")
+        return None
+
+def calculate_weekly_monthly_betas(closes, market_symbol):
+    """
+    Weekly and monthly betas for every stock from one daily close panel.
+
+    Args:
+        closes (dict): symbol -> close Series, including the market
+        market_symbol (str): Market key in closes
+
+    Returns:
+        pandas.DataFrame: One row per stock in the CSV layout
+    """
+    returns = period_returns(closes, ('weekly', 'monthly'))
+    weekly = period_betas(returns['weekly'], market_symbol, periods=WEEKS,
+                          min_periods=MIN_WEEKS, min_regime_periods=20)
+    monthly = period_betas(returns['monthly'], market_symbol, periods=MONTHS,
+                           min_periods=MIN_MONTHS, min_regime_periods=5)
+
+    results = pd.DataFrame({
+        'Symbol': weekly.index,
+        'Beta_Weekly_5Y': weekly['traditional_beta'].values,
+        'Positive_Beta_Weekly': weekly['positive_beta'].values,
+        'Negative_Beta_Weekly': weekly['negative_beta'].values,
+        'Correlation_Weekly': weekly['correlation'].values,
+        'Weeks': weekly['data_points'].values,
+        'Positive_Weeks': weekly['positive_days'].values,
+        'Negative_Weeks': weekly['negative_days'].values,
+        'Beta_Monthly_5Y': monthly['traditional_beta'].reindex(weekly.index).values,
+        'Positive_Beta_Monthly': monthly['positive_beta'].reindex(weekly.index).values,
+        'Negative_Beta_Monthly': monthly['negative_beta'].reindex(weekly.index).values,
+        'Months': monthly['data_points'].reindex(weekly.index).values,
+        'Start_Date': weekly['start_date'].dt.strftime('%Y-%m-%d').values,
+        'End_Date': weekly['end_date'].dt.strftime('%Y-%m-%d').values
+    })
+    return results.dropna(subset=['Beta_Weekly_5Y'])
+
+def main():
+    print("🎯 S&P 500 5-YEAR WEEKLY BETA CSV")
+    print("Weekly and monthly betas from one daily panel")
+    print("="*80)
+
+    symbols = load_symbols()
+    if symbols is None:
+        return
+
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=5*365 + 30)  # Add buffer
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    print(f"Period: {start_str} to {end_str}")
+
+    market_symbol = '^GSPC'
+    market_data = getBenchmarkBars(market_symbol, start_str, end_str)
+    if market_data is None:
+        print("Failed to get S&P 500 data! Using SPY fallback...")
+        market_symbol = 'SPY'
+        market_data = getBenchmarkBars(market_symbol, start_str, end_str)
+        if market_data is None:
+            print("❌ Failed to get market data!")
+            return
+    print(f"Market data ({market_symbol}): {len(market_data)} days")
+
+    print(f"Fetching daily bars for {len(symbols)} symbols...")
+    bars = getBarsMany(symbols, start_str, end_str)
+    print(f"Got data for {len(bars)} symbols")
+
+    closes = {symbol: df['close'] for symbol, df in bars.items() if symbol != market_symbol}
+    closes[market_symbol] = market_data['close']
+    results_df = calculate_weekly_monthly_betas(closes, market_symbol)
+
+    if results_df.empty:
+        print("❌ No betas calculated")
+        return
+
+    results_df.to_csv(OUTPUT_FILE, index=False)
+    failed = sorted(set(symbols) - set(results_df['Symbol']))
+
+    print(f"\n{'='*80}")
+    print(f"5-YEAR WEEKLY BETA ANALYSIS COMPLETE!")
+    print(f"{'='*80}")
+    print(f"✅ Successfully processed: {len(results_df)} stocks")
+    print(f"❌ Failed to process: {len(failed)} stocks")
+    print(f"📊 Results saved to: {OUTPUT_FILE}")
+
+    print(f"\n📈 WEEKLY vs MONTHLY BETA SUMMARY:")
+    print(f"Average Weekly Beta: {results_df['Beta_Weekly_5Y'].mean():.3f}")
+    print(f"Average Monthly Beta: {results_df['Beta_Monthly_5Y'].mean():.3f}")
+    both = results_df.dropna(subset=['Beta_Monthly_5Y'])
+    if len(both) > 1:
+        print(f"Weekly/Monthly Correlation: {np.corrcoef(both['Beta_Weekly_5Y'], both['Beta_Monthly_5Y'])[0, 1]:.3f}")
+
+    print(f"\n🏆 HIGHEST WEEKLY BETAS:")
+    for _, row in results_df.nlargest(10, 'Beta_Weekly_5Y').iterrows():
+        print(f"  {row['Symbol']:<6} Weekly: {row['Beta_Weekly_5Y']:.3f}  Monthly: {row['Beta_Monthly_5Y']:.3f}")
+
+    key_stocks = ['NVDA', 'AAPL', 'MSFT', 'PLTR', 'TSLA', 'COIN']
+    print(f"\n🎯 KEY STOCKS:")
+    for stock in key_stocks:
+        stock_row = results_df[results_df['Symbol'] == stock]
+        if not stock_row.empty:
+            row = stock_row.iloc[0]
+            print(f"  {stock:<6} Weekly: {row['Beta_Weekly_5Y']:.3f} ({row['Weeks']} weeks), "
+                  f"Monthly: {row['Beta_Monthly_5Y']:.3f} ({row['Months']} months)")
+
+if __name__ == "__main__":
+    main()
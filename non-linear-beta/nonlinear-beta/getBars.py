@@ -2,110 +2,269 @@
 
 """
 YFinance functions for fetching historical bar data.
+
+Downloads go through the active bar provider (see bar_providers.py), which
+is yfinance unless BAR_PROVIDER or set_provider() selects another source.
 """
 
 
+import numpy as np
 import pandas as pd
+import threading
 from datetime import datetime, timedelta
-import yfinance as yf
+
+from bar_store import get_default_store
+from bar_providers import get_provider
+from helperMethods import getTradingCalendar
 
 
 def load_config():
     pass  # No longer needed
 
-def getBars(symbol, start_date, end_date, timeframe='1Day'):
+# Map timeframe to yfinance interval
+INTERVAL_MAP = {
+    '1Min': '1m',
+    '5Min': '5m',
+    '15Min': '15m',
+    '30Min': '30m',
+    '1Hour': '60m',
+    '1Day': '1d'
+}
+
+
+def _clean_bars(df, symbol, adjusted=True):
+    """
+    Normalize a single-symbol yfinance frame to [open, high, low, close, volume].
+
+    With adjusted=False the raw Close is used even when Adj Close is present.
+
+    Returns:
+        pandas.DataFrame: Cleaned bars, or None if no usable close prices exist
+    """
+    if df is None or df.empty:
+        print(f"No data found for {symbol}")
+        return None
+
+    # Force single-level columns by ensuring symbol is passed as string, not list
+    if isinstance(df.columns, pd.MultiIndex):
+        # If we still get multi-index, flatten it
+        df.columns = [col[0] if isinstance(col, tuple) else col for col in df.columns]
+
+    # Standardize column names
+    df.columns = df.columns.str.strip()  # Remove any whitespace
+
+    # Use Adj Close if available, otherwise use Close
+    if adjusted and 'Adj Close' in df.columns:
+        df['close'] = df['Adj Close']
+    elif 'Close' in df.columns:
+        df['close'] = df['Close']
+    else:
+        print(f"No close price column found for {symbol}. Available columns: {df.columns.tolist()}")
+        return None
+
+    # Rename other columns to match expected format
+    column_mapping = {
+        'Open': 'open',
+        'High': 'high', 
+        'Low': 'low',
+        'Volume': 'volume'
+    }
+
+    df = df.rename(columns=column_mapping)
+
+    # Ensure we have the expected columns
+    expected_cols = ['open', 'high', 'low', 'close', 'volume']
+    available_cols = [col for col in expected_cols if col in df.columns]
+
+    if 'close' not in available_cols:
+        print(f"No close price data available for {symbol}")
+        return None
+
+    # Only keep expected columns that exist
+    df = df[available_cols]
+
+    # Remove any rows with NaN in close price
+    df = df.dropna(subset=['close'])
+
+    # Ensure numeric data types
+    for col in ['open', 'high', 'low', 'close']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    if 'volume' in df.columns:
+        df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
+
+    # Final check for valid data
+    if df['close'].isna().all():
+        print(f"All close prices are NaN for {symbol}")
+        return None
+
+    return df
+
+
+def _download_bars(symbol, start_date, end_date, interval, adjusted=True):
+    """Download cleaned bars for one symbol from the active provider."""
+    return get_provider().fetch(symbol, start_date, end_date, interval, adjusted)
+
+
+def _split_wide_frame(df, symbols, adjusted=True):
+    """
+    Split a multi-ticker yfinance frame into per-symbol OHLCV frames.
+
+    Applies the same cleaning rules as _clean_bars (Adj Close preferred over
+    Close, rows without a close dropped, numeric coercion), but field by field
+    across all tickers at once instead of one symbol at a time.
+
+    Returns:
+        dict: symbol -> cleaned bars for every symbol that returned data
+    """
+    if df is None or df.empty:
+        return {}
+    if not isinstance(df.columns, pd.MultiIndex):
+        # A single ticker can come back with flat columns
+        cleaned = _clean_bars(df, symbols[0], adjusted) if len(symbols) == 1 else None
+        return {symbols[0]: cleaned} if cleaned is not None else {}
+
+    # Normalize to (ticker, field) columns; group_by='ticker' puts ticker first
+    wide = df
+    if not set(symbols) & set(wide.columns.get_level_values(0)):
+        wide = wide.swaplevel(0, 1, axis=1)
+    wide.columns = pd.MultiIndex.from_arrays([
+        wide.columns.get_level_values(0),
+        wide.columns.get_level_values(1).str.strip()
+    ])
+
+    fields = set(wide.columns.get_level_values(1))
+    if adjusted and 'Adj Close' in fields:
+        close_field = 'Adj Close'
+    elif 'Close' in fields:
+        close_field = 'Close'
+    else:
+        print(f"No close price column found. Available columns: {sorted(fields)}")
+        return {}
+
+    tickers = [s for s in dict.fromkeys(symbols) if s in set(wide.columns.get_level_values(0))]
+    column_mapping = [('open', 'Open'), ('high', 'High'), ('low', 'Low'),
+                      ('close', close_field), ('volume', 'Volume')]
+    column_mapping = [(col, field) for col, field in column_mapping if field in fields]
+
+    # One dates x tickers block per output column
+    blocks = {}
+    for col, field in column_mapping:
+        block = wide.xs(field, axis=1, level=1).reindex(columns=tickers)
+        blocks[col] = block.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(blocks['close'])
+
+    bars = {}
+    for j, symbol in enumerate(tickers):
+        rows = valid[:, j]
+        if not rows.any():
+            continue
+        bars[symbol] = pd.DataFrame(
+            {col: block[rows, j] for col, block in blocks.items()},
+            index=wide.index[rows]
+        )
+    return bars
+
+
+def _download_group(symbols, start_date, end_date, interval, adjusted=True):
+    """
+    Download several symbols that share the same date range in one request.
+
+    Returns:
+        dict: symbol -> cleaned bars for every symbol that returned data
+    """
+    return get_provider().fetch_many(list(symbols), start_date, end_date, interval, adjusted)
+
+
+def _has_sessions(start_date, end_date):
+    """True if [start_date, end_date) contains at least one NYSE session."""
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() - pd.Timedelta(days=1)
+    if start > end:
+        return False
+    lo, hi = getTradingCalendar(start, end).bounds(start, end)
+    return hi > lo
+
+
+def _coverage_end(end_date):
+    """
+    Exclusive end date that may be recorded as covered.
+
+    Today's bar is still forming, so coverage never extends past today and
+    the next run re-requests it.
+    """
+    today = pd.Timestamp(datetime.now().date())
+    return min(pd.Timestamp(end_date).normalize(), today)
+
+
+def _store_interval(interval, adjusted=True):
+    """
+    Store partition for an interval.
+
+    Unadjusted closes are kept apart, and so are bars from providers other
+    than yfinance, so switching BAR_PROVIDER never mixes sources in one file.
+    """
+    partition = interval if adjusted else f"{interval}_raw"
+    provider = get_provider().name
+    return partition if provider == 'yfinance' else f"{provider}-{partition}"
+
+
+def getBars(symbol, start_date, end_date, timeframe='1Day', use_store=True, adjusted=True):
     """
-    Fetch historical bar data from yfinance.
+    Fetch historical bar data from the active provider (yfinance by default).
+    
+    Reads through the local bar store (see bar_store.py): if the requested
+    range has already been downloaded it is served from disk without any
+    network call, otherwise only the missing date ranges are downloaded and
+    merged into the store.
     
     Args:
         symbol (str): Stock symbol (e.g., 'AAPL')
         start_date (str): Start date in 'YYYY-MM-DD' format
         end_date (str): End date in 'YYYY-MM-DD' format
         timeframe (str): Bar timeframe ('1Min', '5Min', '15Min', '30Min', '1Hour', '1Day')
+        use_store (bool): Read through the local bar store (default True)
+        adjusted (bool): Use Adj Close for close prices (default True)
     
     Returns:
         pandas.DataFrame: Historical bar data with columns [open, high, low, close, volume]
     """
-    # Map timeframe to yfinance interval
-    interval_map = {
-        '1Min': '1m',
-        '5Min': '5m',
-        '15Min': '15m',
-        '30Min': '30m',
-        '1Hour': '60m',
-        '1Day': '1d'
-    }
-    interval = interval_map.get(timeframe, '1d')
+    interval = INTERVAL_MAP.get(timeframe, '1d')
+    store_interval = _store_interval(interval, adjusted)
+    store = get_default_store() if use_store else None
     
     try:
-        # Ensure we download only one symbol to avoid multi-index
-        df = yf.download(
-            symbol,
-            start=start_date,
-            end=end_date,
-            interval=interval,
-            progress=False,
-            auto_adjust=False,
-            threads=False  # Prevent multi-threading issues
-        )
-        
-        if df.empty:
-            print(f"No data found for {symbol}")
-            return None
-            
-        # Force single-level columns by ensuring symbol is passed as string, not list
-        if isinstance(df.columns, pd.MultiIndex):
-            # If we still get multi-index, flatten it
-            df.columns = [col[0] if isinstance(col, tuple) else col for col in df.columns]
-        
-        # Standardize column names
-        df.columns = df.columns.str.strip()  # Remove any whitespace
-        
-        # Use Adj Close if available, otherwise use Close
-        if 'Adj Close' in df.columns:
-            df['close'] = df['Adj Close']
-        elif 'Close' in df.columns:
-            df['close'] = df['Close']
+        if store is not None:
+            covered_end = _coverage_end(end_date)
+            gaps = store.missing_ranges(symbol, store_interval, start_date, covered_end)
+            if not gaps:
+                df = store.read(symbol, store_interval, start_date, end_date)
+                if df is not None and len(df) > 0:
+                    print(f"Loaded {len(df)} rows for {symbol} from bar store")
+                    return df
+                print(f"No data found for {symbol}")
+                return None
+
+            # Only download what the store is missing
+            for gap_start, gap_end in gaps:
+                download_end = pd.Timestamp(end_date) if gap_end == covered_end else gap_end
+                if not _has_sessions(gap_start, download_end):
+                    store.merge(symbol, store_interval, None, gap_start, gap_end)
+                    continue
+                fetched = _download_bars(symbol, gap_start.strftime('%Y-%m-%d'),
+                                         download_end.strftime('%Y-%m-%d'), interval, adjusted)
+                if fetched is not None:
+                    store.merge(symbol, store_interval, fetched, gap_start, gap_end)
+
+            df = store.read(symbol, store_interval, start_date, end_date)
+            if df is None or len(df) == 0:
+                print(f"No data found for {symbol}")
+                return None
         else:
-            print(f"No close price column found for {symbol}. Available columns: {df.columns.tolist()}")
-            return None
-        
-        # Rename other columns to match expected format
-        column_mapping = {
-            'Open': 'open',
-            'High': 'high', 
-            'Low': 'low',
-            'Volume': 'volume'
-        }
-        
-        df = df.rename(columns=column_mapping)
-        
-        # Ensure we have the expected columns
-        expected_cols = ['open', 'high', 'low', 'close', 'volume']
-        available_cols = [col for col in expected_cols if col in df.columns]
-        
-        if 'close' not in available_cols:
-            print(f"No close price data available for {symbol}")
-            return None
-            
-        # Only keep expected columns that exist
-        df = df[available_cols]
-        
-        # Remove any rows with NaN in close price
-        df = df.dropna(subset=['close'])
-        
-        # Ensure numeric data types
-        for col in ['open', 'high', 'low', 'close']:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        if 'volume' in df.columns:
-            df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
-        
-        # Final check for valid data
-        if df['close'].isna().all():
-            print(f"All close prices are NaN for {symbol}")
-            return None
+            df = _download_bars(symbol, start_date, end_date, interval, adjusted)
+            if df is None:
+                return None
             
         print(f"Successfully fetched {len(df)} rows for {symbol}")
         return df
@@ -114,6 +273,96 @@ def getBars(symbol, start_date, end_date, timeframe='1Day'):
         print(f"Error fetching data for {symbol}: {str(e)}")
         return None
 
+def getBarsMany(symbols, start_date, end_date, timeframe='1Day', batch_size=100, use_store=True,
+                scheduler=None):
+    """
+    Fetch historical bars for many symbols with multi-ticker requests.
+    
+    Instead of one round trip per symbol, up to batch_size tickers are
+    requested together and the wide MultiIndex result is split into
+    per-symbol frames. With the bar store enabled only missing date ranges
+    are requested (see fetch_planner.py) and the result is read back from
+    disk.
+    
+    Args:
+        symbols (list): Stock symbols
+        start_date (str): Start date in 'YYYY-MM-DD' format
+        end_date (str): End date in 'YYYY-MM-DD' format
+        timeframe (str): Bar timeframe ('1Min', '5Min', '15Min', '30Min', '1Hour', '1Day')
+        batch_size (int): Maximum tickers per request
+        use_store (bool): Read through the local bar store (default True)
+        scheduler (RequestScheduler, optional): Rate/concurrency control for the
+            requests (see rate_limiter.py); requests run one at a time if None
+    
+    Returns:
+        dict: symbol -> DataFrame with columns [open, high, low, close, volume];
+              symbols without data are omitted
+    """
+    interval = INTERVAL_MAP.get(timeframe, '1d')
+    symbols = list(dict.fromkeys(symbols))
+    bars = {}
+    
+    if use_store:
+        from fetch_planner import refresh_bars
+        store = get_default_store()
+        refresh_bars(symbols, start_date, end_date, timeframe, store, max_batch=batch_size,
+                     scheduler=scheduler)
+        for symbol in symbols:
+            df = store.read(symbol, _store_interval(interval), start_date, end_date)
+            if df is not None and len(df) > 0:
+                bars[symbol] = df
+    else:
+        from rate_limiter import AdaptiveConcurrency, RequestScheduler
+        if scheduler is None:
+            scheduler = RequestScheduler(concurrency=AdaptiveConcurrency(initial=1, maximum=1))
+        batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+        download = lambda batch: _download_group(batch, start_date, end_date, interval)
+        for batch, batch_bars, error in scheduler.map(download, batches):
+            if error is not None:
+                print(f"Error fetching batch starting {batch[0]}: {str(error)}")
+            else:
+                bars.update(batch_bars)
+    
+    print(f"Successfully fetched {len(bars)}/{len(symbols)} symbols")
+    return bars
+
+# Benchmark series shared by every caller in the process, keyed by
+# (provider, symbol, start_date, end_date, timeframe, adjusted)
+_benchmark_cache = {}
+_benchmark_lock = threading.Lock()
+
+def getBenchmarkBars(symbol, start_date, end_date, timeframe='1Day', adjusted=True):
+    """
+    Fetch a benchmark series (e.g. '^GSPC', 'SPY') once per process.
+    
+    Per-symbol beta functions call this instead of getBars so the benchmark
+    is loaded once per run rather than once per stock. Failed fetches are
+    cached too, so a missing index is not retried for every symbol.
+    
+    Args:
+        symbol (str): Benchmark symbol
+        start_date (str): Start date in 'YYYY-MM-DD' format
+        end_date (str): End date in 'YYYY-MM-DD' format
+        timeframe (str): Bar timeframe as accepted by getBars
+        adjusted (bool): Use Adj Close for close prices (default True)
+    
+    Returns:
+        pandas.DataFrame: Benchmark bars (shared; copy before modifying), or None
+    """
+    key = (get_provider().name, symbol, str(start_date), str(end_date), timeframe, adjusted)
+    with _benchmark_lock:
+        if key in _benchmark_cache:
+            return _benchmark_cache[key]
+    
+    df = getBars(symbol, start_date, end_date, timeframe, adjusted=adjusted)
+    with _benchmark_lock:
+        return _benchmark_cache.setdefault(key, df)
+
+def clearBenchmarkCache():
+    """Drop all cached benchmark series."""
+    with _benchmark_lock:
+        _benchmark_cache.clear()
+
 def getBars5Min(symbol, start_date, end_date):
     """Fetch 5-minute bars."""
     return getBars(symbol, start_date, end_date, '5Min')
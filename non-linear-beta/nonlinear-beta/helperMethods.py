@@ -3,15 +3,225 @@
 Helper methods for trading day calculations and drift analysis.
 """
 
+import os
+import threading
+
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+# On-disk NYSE calendar cache (see TradingCalendar), next to this module so it
+# does not depend on the directory a script is run from
+CALENDAR_CACHE_PATH = os.environ.get(
+    'TRADING_CALENDAR_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trading_calendar.npy'))
+CALENDAR_START = '1990-01-01'
 
 
 def load_config():
     pass  # No longer needed
 
+class TradingCalendar:
+    """
+    Precomputed NYSE session index.
+    
+    Sessions are held as int64 day numbers (days since 1970-01-01) with one
+    flag array per attribute, so lookups are searchsorted calls on a small
+    array instead of DatetimeIndex intersections. The position of a session
+    in `days` is its ordinal: consecutive sessions have consecutive ordinals,
+    so alignment, gap detection and resampling can work on integers.
+    
+    Attributes:
+        days (numpy.ndarray): Session dates as int64 day numbers, ascending
+        early_close (numpy.ndarray): Session closes before 16:00 ET
+        week_end (numpy.ndarray): Last session of its ISO week
+        month_end (numpy.ndarray): Last session of its calendar month
+        start (numpy.datetime64): First date the calendar is valid for
+        end (numpy.datetime64): Last date the calendar is valid for
+    """
+    
+    def __init__(self, days, early_close, start, end, week_end=None, month_end=None):
+        self.days = np.asarray(days, dtype=np.int64)
+        self.early_close = np.asarray(early_close, dtype=bool)
+        self.start = np.datetime64(start, 'D')
+        self.end = np.datetime64(end, 'D')
+        
+        if week_end is None or month_end is None:
+            week_end, month_end = self._period_ends()
+        self.week_end = np.asarray(week_end, dtype=bool)
+        self.month_end = np.asarray(month_end, dtype=bool)
+    
+    def _period_ends(self):
+        """Last-session-of-week / -month flags."""
+        if len(self.days) == 0:
+            return np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+        months = self.days.astype('datetime64[D]').astype('datetime64[M]')
+        # ISO weeks start on Monday; 1970-01-01 was a Thursday
+        weeks = (self.days + 3) // 7
+        
+        # The final session only closes its period if the calendar covers the
+        # rest of that week / month
+        end = self.end.astype(np.int64)
+        last_week = np.array([end >= weeks[-1] * 7 + 3])
+        last_month = np.array([self.end >= (months[-1] + 1).astype('datetime64[D]') - 1])
+        week_end = np.concatenate([weeks[1:] != weeks[:-1], last_week])
+        month_end = np.concatenate([months[1:] != months[:-1], last_month])
+        return week_end, month_end
+    
+    @classmethod
+    def build(cls, start_date=CALENDAR_START, end_date=None):
+        """Build the calendar from pandas_market_calendars' NYSE schedule."""
+        import pandas_market_calendars as mcal
+        
+        if end_date is None:
+            end_date = f"{datetime.now().year + 1}-12-31"
+        nyse = mcal.get_calendar('NYSE')
+        schedule = nyse.schedule(start_date=start_date, end_date=end_date)
+        early = nyse.early_closes(schedule)
+        
+        sessions = pd.DatetimeIndex(schedule.index).normalize()
+        days = sessions.values.astype('datetime64[D]').astype(np.int64)
+        early_close = sessions.isin(pd.DatetimeIndex(early.index).normalize())
+        return cls(days, early_close, start_date, end_date)
+    
+    @classmethod
+    def load(cls, path=CALENDAR_CACHE_PATH):
+        """
+        Load a calendar saved with save().
+        
+        The file is a single int64 .npy table: row 0 holds the valid range,
+        every other row is (day, early_close, week_end, month_end).
+        """
+        table = np.load(path)
+        start, end = table[0, :2].astype('datetime64[D]')
+        rows = table[1:]
+        return cls(rows[:, 0], rows[:, 1], start, end, rows[:, 2], rows[:, 3])
+    
+    def save(self, path=CALENDAR_CACHE_PATH):
+        """Save the calendar next to its final location and move it into place."""
+        table = np.zeros((len(self.days) + 1, 4), dtype=np.int64)
+        table[0, :2] = [self.start.astype(np.int64), self.end.astype(np.int64)]
+        table[1:] = np.column_stack([self.days, self.early_close, self.week_end, self.month_end])
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, table)
+        os.replace(tmp_path, path)
+    
+    def covers(self, start_date, end_date):
+        """True if [start_date, end_date] lies inside the calendar's range."""
+        return (self.start <= np.datetime64(pd.Timestamp(start_date).date(), 'D')
+                and np.datetime64(pd.Timestamp(end_date).date(), 'D') <= self.end)
+    
+    def sessions(self, start_date=None, end_date=None):
+        """Sessions in [start_date, end_date] (both inclusive) as a DatetimeIndex."""
+        lo, hi = self.bounds(start_date, end_date)
+        return pd.DatetimeIndex(self.days[lo:hi].astype('datetime64[D]').astype('datetime64[ns]'))
+    
+    def bounds(self, start_date=None, end_date=None):
+        """Ordinal range [lo, hi) of the sessions in [start_date, end_date]."""
+        lo = 0 if start_date is None else int(np.searchsorted(self.days, _day_number(start_date), 'left'))
+        hi = len(self.days) if end_date is None else int(np.searchsorted(self.days, _day_number(end_date), 'right'))
+        return lo, hi
+    
+    def ordinals(self, dates, strict=True):
+        """
+        Integer session ordinals for dates.
+        
+        Args:
+            dates: DatetimeIndex, array of datetime64 or date strings
+            strict (bool): Return -1 for non-session dates; otherwise they map to
+                the next session's ordinal
+        
+        Returns:
+            numpy.ndarray: int64 ordinals
+        """
+        days = _day_numbers(dates)
+        positions = np.searchsorted(self.days, days, 'left')
+        if strict:
+            found = positions < len(self.days)
+            found[found] = self.days[positions[found]] == days[found]
+            positions = np.where(found, positions, -1)
+        return positions.astype(np.int64)
+    
+    def dates(self, ordinals):
+        """Session dates for integer ordinals."""
+        return pd.DatetimeIndex(self.days[np.asarray(ordinals)].astype('datetime64[D]').astype('datetime64[ns]'))
+    
+    def is_session(self, dates):
+        """Boolean array: True where the date is an NYSE session."""
+        return self.ordinals(dates) >= 0
+    
+    def missing_sessions(self, index, start_date=None, end_date=None):
+        """
+        Sessions in [start_date, end_date] that have no row in index, e.g. the
+        days a symbol did not trade or failed to download.
+        """
+        if start_date is None:
+            start_date = index.min()
+        if end_date is None:
+            end_date = index.max()
+        lo, hi = self.bounds(start_date, end_date)
+        present = np.zeros(hi - lo, dtype=bool)
+        ords = self.ordinals(index)
+        ords = ords[(ords >= lo) & (ords < hi)]
+        present[ords - lo] = True
+        return self.dates(np.flatnonzero(~present) + lo)
+    
+    def session_gaps(self, index):
+        """Number of sessions skipped between each pair of consecutive rows in index."""
+        ords = self.ordinals(index, strict=False)
+        return np.diff(ords) - 1
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+def getTradingCalendar(start_date=None, end_date=None, path=CALENDAR_CACHE_PATH):
+    """
+    Return the process-wide trading calendar, loading it from disk if cached.
+    
+    The NYSE schedule is only built when no cache exists or the cached range
+    does not cover [start_date, end_date]; the widened calendar is saved back.
+    
+    Args:
+        start_date (str, optional): First date that must be covered
+        end_date (str, optional): Last date that must be covered
+        path (str): Cache file
+    
+    Returns:
+        TradingCalendar: The calendar
+    """
+    global _calendar
+    with _calendar_lock:
+        calendar = _calendar
+        if calendar is None and os.path.exists(path):
+            try:
+                calendar = TradingCalendar.load(path)
+            except Exception as e:
+                print(f"Error loading trading calendar cache: {e}")
+        
+        needed_start = start_date or CALENDAR_START
+        needed_end = end_date or datetime.now().strftime('%Y-%m-%d')
+        if calendar is None or not calendar.covers(needed_start, needed_end):
+            build_start = min(pd.Timestamp(needed_start), pd.Timestamp(CALENDAR_START))
+            build_end = max(pd.Timestamp(needed_end), pd.Timestamp(f"{datetime.now().year + 1}-12-31"))
+            calendar = TradingCalendar.build(build_start.strftime('%Y-%m-%d'), build_end.strftime('%Y-%m-%d'))
+            try:
+                calendar.save(path)
+            except OSError as e:
+                print(f"Error saving trading calendar cache: {e}")
+        
+        _calendar = calendar
+        return calendar
+
+def _day_number(value):
+    """Days since 1970-01-01 for one date."""
+    return np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64)
+
+def _day_numbers(dates):
+    """Days since 1970-01-01 for many dates (tz-aware timestamps use their local date)."""
+    index = pd.DatetimeIndex(dates)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.values.astype('datetime64[D]').astype(np.int64)
+
 def getTradingDays(start_date, end_date):
     """
     Get list of trading days between start_date and end_date.
@@ -23,11 +233,9 @@ def getTradingDays(start_date, end_date):
     Returns:
         list: List of trading day dates
     """
-    # Use pandas market calendar for NYSE
-    import pandas_market_calendars as mcal
-    nyse = mcal.get_calendar('NYSE')
-    schedule = nyse.schedule(start_date=start_date, end_date=end_date)
-    trading_days = schedule.index.strftime('%Y-%m-%d').tolist()
+    # NYSE sessions from the cached calendar index
+    calendar = getTradingCalendar(start_date, end_date)
+    trading_days = calendar.sessions(start_date, end_date).strftime('%Y-%m-%d').tolist()
     return trading_days
 
 def calculateDrift(df, window=20):
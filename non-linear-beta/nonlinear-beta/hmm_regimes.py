@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Hidden Markov market regimes and probability-weighted betas.
+
+The sign of one day's market return is a noisy regime label: a calm bull
+market has plenty of down days and a crash has up days. Here the market
+series alone is fitted once with a 2 or 3 state Gaussian HMM (Baum-Welch
+with scaled forward-backward passes), and the smoothed state probabilities
+P(state_t = k | all returns) become regime weights.
+
+Every stock's state-k beta is then the weighted regression of stock on
+market with weights P(state_t = k). Weighted moments are exactly what
+RegimeMoments.from_returns accumulates when its regime matrix holds
+weights instead of booleans, so the whole universe is still one matrix
+product over the return panel, the same cost as the sign split.
+
+States are ordered by their volatility (HMM_STATE_NAMES), which keeps the
+labels stable from one fit to the next.
+"""
+
+import numpy as np
+import pandas as pd
+
+from beta_engine import MIN_OBSERVATIONS, MIN_REGIME_DAYS, RegimeMoments, regime_usable
+
+HMM_STATE_NAMES = {
+    2: ('low_volatility', 'high_volatility'),
+    3: ('low_volatility', 'medium_volatility', 'high_volatility')
+}
+
+# Initial probability of staying in a state from one day to the next
+HMM_INITIAL_PERSISTENCE = 0.95
+# Floor on state variances, relative to the sample variance (keeps a state
+# from collapsing onto a few near-identical returns)
+HMM_VARIANCE_FLOOR = 1.0e-2
+# EM stops when an iteration improves the log-likelihood by less than this
+# fraction of its magnitude
+HMM_TOLERANCE = 1.0e-7
+
+
+def _emissions(x, means, variances):
+    """Gaussian densities, observations x states."""
+    return np.exp(-0.5 * (x[:, None] - means) ** 2 / variances) / np.sqrt(2.0 * np.pi * variances)
+
+
+def _forward_backward(emissions, transition, initial):
+    """
+    Scaled forward-backward pass.
+
+    Returns:
+        tuple: (smoothed state probabilities, expected transition counts, log-likelihood)
+    """
+    n, k = emissions.shape
+    alpha = np.empty((n, k))
+    scale = np.empty(n)
+    a = initial * emissions[0]
+    for t in range(n):
+        if t:
+            a = (a @ transition) * emissions[t]
+        scale[t] = a.sum()
+        a = a / scale[t]
+        alpha[t] = a
+
+    beta = np.empty((n, k))
+    b = np.ones(k)
+    beta[-1] = b
+    for t in range(n - 2, -1, -1):
+        b = transition @ (emissions[t + 1] * b) / scale[t + 1]
+        beta[t] = b
+
+    probabilities = alpha * beta
+    # xi summed over time: alpha_t(i) A(i, j) e_{t+1}(j) beta_{t+1}(j) / c_{t+1}
+    weighted = emissions[1:] * beta[1:] / scale[1:, None]
+    transitions = transition * (alpha[:-1].T @ weighted)
+    return probabilities, transitions, np.log(scale).sum()
+
+
+def fit_market_hmm(market, n_states=2, max_iter=500, tol=HMM_TOLERANCE):
+    """
+    Gaussian HMM of the market returns by Baum-Welch.
+
+    Args:
+        market (numpy.ndarray): Market returns (NaN where missing; those dates
+            get zero state probabilities)
+        n_states (int): Number of states (2 or 3)
+        max_iter (int): Maximum EM iterations
+        tol (float): Stop when the log-likelihood improves by less than tol
+            times its magnitude
+
+    Returns:
+        dict: 'states' (names), 'means', 'variances', 'transition', 'initial',
+              'probabilities' (dates x states smoothed probabilities),
+              'log_likelihood', 'iterations', 'converged' (False if EM stopped
+              at max_iter)
+    """
+    market = np.asarray(market, dtype=np.float64)
+    rows = np.flatnonzero(np.isfinite(market))
+    x = market[rows]
+    if len(x) < 2 * n_states:
+        raise ValueError(f"Need at least {2 * n_states} market returns for a {n_states}-state HMM")
+
+    # Start from groups of increasing absolute return
+    groups = np.array_split(np.argsort(np.abs(x - x.mean()), kind='mergesort'), n_states)
+    means = np.array([x[g].mean() for g in groups])
+    variances = np.array([x[g].var() for g in groups])
+    floor = HMM_VARIANCE_FLOOR * x.var()
+    variances = np.maximum(variances, floor)
+    transition = np.full((n_states, n_states), (1.0 - HMM_INITIAL_PERSISTENCE) / max(n_states - 1, 1))
+    np.fill_diagonal(transition, HMM_INITIAL_PERSISTENCE)
+    initial = np.full(n_states, 1.0 / n_states)
+
+    previous = -np.inf
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        probabilities, transitions, log_likelihood = _forward_backward(
+            _emissions(x, means, variances), transition, initial)
+
+        # M step
+        weights = probabilities.sum(axis=0)
+        means = probabilities.T @ x / weights
+        variances = np.maximum((probabilities * (x[:, None] - means) ** 2).sum(axis=0) / weights, floor)
+        transition = transitions / transitions.sum(axis=1, keepdims=True)
+        initial = probabilities[0]
+
+        if log_likelihood - previous < tol * abs(log_likelihood):
+            converged = True
+            break
+        previous = log_likelihood
+
+    probabilities, _, log_likelihood = _forward_backward(_emissions(x, means, variances), transition, initial)
+    order = np.argsort(variances)
+    full = np.zeros((len(market), n_states))
+    full[rows] = probabilities[:, order]
+    return {
+        'states': HMM_STATE_NAMES.get(n_states, tuple(f'state_{k}' for k in range(n_states))),
+        'means': means[order],
+        'variances': variances[order],
+        'transition': transition[np.ix_(order, order)],
+        'initial': initial[order],
+        'probabilities': full,
+        'log_likelihood': log_likelihood,
+        'iterations': iteration,
+        'converged': converged
+    }
+
+
+def hmm_betas(returns, market, probabilities, states, mask=None, min_observations=MIN_OBSERVATIONS,
+              min_regime_days=MIN_REGIME_DAYS, ddof='sample'):
+    """
+    Probability-weighted state betas of every column of returns.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        probabilities (numpy.ndarray): dates x states weights (fit_market_hmm)
+        states (tuple): State names
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A state beta needs more than this many expected days
+        ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES ('sample' is the
+            weighted least-squares slope)
+
+    Returns:
+        dict: 'traditional_beta' and '<state>_beta', '<state>_days' (expected
+              days in the state) arrays of length n_symbols
+    """
+    market = np.asarray(market, dtype=np.float64)
+    weights = np.column_stack([np.isfinite(market), probabilities])
+    moments = RegimeMoments.from_returns(returns, market, regimes=weights, mask=mask,
+                                         regime_names=('all',) + tuple(states))
+    betas = np.where(regime_usable(moments.n, min_observations, min_regime_days), moments.beta(ddof), np.nan)
+
+    results = {'traditional_beta': betas[:, 0]}
+    for k, state in enumerate(states, start=1):
+        results[f'{state}_beta'] = betas[:, k]
+        results[f'{state}_days'] = moments.n[:, k]
+    return results
+
+
+def hmm_betas_from_matrix(matrix, n_states=2, symbols=None, fit=None, **kwargs):
+    """
+    HMM state betas for the stocks of a ReturnsMatrix.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix with a market column
+        n_states (int): Number of market states
+        symbols (list, optional): Stocks to include (default: all stocks)
+        fit (dict, optional): A fit_market_hmm result for these dates to reuse
+        **kwargs: Passed to hmm_betas
+
+    Returns:
+        tuple: (DataFrame with one row per stock, fit_market_hmm result)
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    if fit is None:
+        fit = fit_market_hmm(market, n_states)
+    results = hmm_betas(returns, market, fit['probabilities'], fit['states'], mask=mask, **kwargs)
+    return pd.DataFrame(results, index=pd.Index(symbols, name='symbol')), fit
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Time-varying up-market / down-market betas from a state-space model.
+
+Each stock follows the piecewise regression of asymmetry_tests.py with
+random-walk coefficients,
+
+    r_t     = alpha_t + beta+_t * max(m_t, 0) + beta-_t * min(m_t, 0) + e_t,   e_t ~ N(0, R)
+    theta_t = theta_{t-1} + u_t,                                                u_t ~ N(0, Q)
+
+filtered with a Kalman filter and smoothed with the Rauch-Tung-Striebel
+smoother. The design row depends only on the date, so every symbol's
+3 x 3 recursion runs together: one step of the filter is a handful of
+batched (symbols x 3 x 3) array operations, and a day a stock did not
+trade is a prediction without an update.
+
+R is the stock's piecewise OLS residual variance and Q = q * R * (X'X / n)^-1,
+so q alone sets how fast the betas may move (the filter's memory is
+roughly 1 / sqrt(q) days; the default matches the 252-day rolling window).
+With fit_noise=True q is chosen per symbol from KALMAN_Q_GRID by the
+prediction-error likelihood, all grid values filtered as one batch.
+"""
+
+import numpy as np
+import pandas as pd
+
+from beta_engine import MIN_OBSERVATIONS, MIN_REGIME_DAYS
+
+KALMAN_BETA_TYPES = ('alpha', 'positive_beta', 'negative_beta',
+                     'positive_beta_std', 'negative_beta_std')
+
+# Effective memory of the default filter in trading days (q = 1 / window^2)
+KALMAN_WINDOW = 252
+# Memories tried per symbol when fit_noise=True
+KALMAN_Q_GRID = tuple(1.0 / window ** 2 for window in (21, 42, 63, 126, 252, 504, 1008, 2016))
+# Prior variance of the initial state, in units of the full-sample OLS covariance
+KALMAN_PRIOR_SCALE = 1.0e4
+# Observations ignored by the likelihood while the diffuse prior washes out
+KALMAN_BURN_IN = 20
+# z for 95% uncertainty bands around the smoothed betas
+BAND_Z = 1.96
+
+# Symbols per block; bounds the stored filter output (dates x block x 3 x 3)
+KALMAN_BLOCK_SIZE = 256
+
+
+def _design(market):
+    """Dates x 3 design [1, max(x, 0), min(x, 0)] and the market validity."""
+    valid = np.isfinite(market)
+    x = np.where(valid, market, 0.0)
+    return np.column_stack([np.ones(len(x)), np.maximum(x, 0.0), np.minimum(x, 0.0)]), valid
+
+
+def _ols_noise(y, valid, design):
+    """Per-symbol residual variance R and scaled inverse moment matrix (X'X / n)^-1."""
+    k = design.shape[1]
+    outer = (design[:, :, None] * design[:, None, :]).reshape(len(design), k * k)
+    weights = valid.astype(np.float64)
+    n = weights.sum(axis=0)
+    xtx = (weights.T @ outer).reshape(-1, k, k)
+    xty = y.T @ design
+    ok = np.abs(np.linalg.det(xtx)) > 0
+    xtx = np.where(ok[:, None, None], xtx, np.eye(k))
+    coef = np.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+    rss = (y * y).sum(axis=0) - np.einsum('sk,sk->s', coef, xty)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.where(ok & (n > k), rss / (n - k), np.nan)
+        scaled_inverse = np.linalg.inv(xtx) * n[:, None, None]
+    return variance, scaled_inverse, ok
+
+
+def _filter(y, valid, design, market_valid, Q, R, P0, store=False, burn_in=KALMAN_BURN_IN):
+    """
+    Kalman filter for a batch of symbols sharing the design.
+
+    Returns:
+        tuple: (filtered states dates x batch x 3 and covariances dates x batch x 3 x 3
+                if store, otherwise None, None; log-likelihood per symbol)
+    """
+    n_dates, batch = y.shape
+    theta = np.zeros((batch, 3))
+    P = P0.copy()
+    log_likelihood = np.zeros(batch)
+    seen = np.zeros(batch)
+    thetas = np.empty((n_dates, batch, 3)) if store else None
+    covariances = np.empty((n_dates, batch, 3, 3)) if store else None
+
+    for t in range(n_dates):
+        if t:
+            P += Q
+        if market_valid[t]:
+            h = design[t]
+            ok = valid[t]
+            Ph = P @ h
+            S = Ph @ h + R
+            v = np.where(ok, y[t] - theta @ h, 0.0)
+            K = Ph / S[:, None]
+            theta += K * v[:, None]
+            P -= ok[:, None, None] * (K[:, :, None] * Ph[:, None, :])
+            P = 0.5 * (P + P.transpose(0, 2, 1))
+            scored = ok & (seen >= burn_in)
+            log_likelihood -= np.where(scored, 0.5 * (np.log(2.0 * np.pi * S) + v * v / S), 0.0)
+            seen += ok
+        if store:
+            thetas[t] = theta
+            covariances[t] = P
+    return thetas, covariances, log_likelihood
+
+
+def _smooth(thetas, covariances, Q):
+    """Rauch-Tung-Striebel smoother for the random-walk state (transition = identity)."""
+    smoothed = thetas.copy()
+    variances = np.empty(thetas.shape)
+    state, P_smooth = thetas[-1].copy(), covariances[-1].copy()
+    variances[-1] = np.diagonal(P_smooth, axis1=1, axis2=2)
+    for t in range(len(thetas) - 2, -1, -1):
+        P = covariances[t]
+        predicted = P + Q
+        # C = P predicted^-1 (both symmetric)
+        C = np.linalg.solve(predicted, P).transpose(0, 2, 1)
+        state = thetas[t] + np.einsum('sij,sj->si', C, state - thetas[t])
+        P_smooth = P + C @ (P_smooth - predicted) @ C.transpose(0, 2, 1)
+        smoothed[t] = state
+        variances[t] = np.diagonal(P_smooth, axis1=1, axis2=2)
+    return smoothed, variances
+
+
+def kalman_betas(returns, market, mask=None, q=None, fit_noise=False, smooth=True,
+                 min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS,
+                 block_size=KALMAN_BLOCK_SIZE):
+    """
+    Kalman-filtered (and smoothed) alpha, beta+ and beta- paths of every column of returns.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        q (float, optional): State noise relative to the OLS coefficient covariance
+            (default: 1 / KALMAN_WINDOW ** 2)
+        fit_noise (bool): Pick q per symbol from KALMAN_Q_GRID by maximum likelihood
+        smooth (bool): Return smoothed paths (False: real-time filtered paths)
+        min_observations (int): Minimum valid days for a symbol to be filtered
+        min_regime_days (int): Each regime needs more than this many days
+        block_size (int): Symbols processed per block
+
+    Returns:
+        tuple: (dict KALMAN_BETA_TYPES -> dates x symbols arrays, NaN outside each
+                symbol's first .. last valid day; dict 'q', 'observation_variance',
+                'log_likelihood' -> arrays of length n_symbols)
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    design, market_valid = _design(market)
+    n_dates, n_symbols = returns.shape
+
+    panels = {name: np.full((n_dates, n_symbols), np.nan) for name in KALMAN_BETA_TYPES}
+    params = {name: np.full(n_symbols, np.nan) for name in ('q', 'observation_variance', 'log_likelihood')}
+    grid = np.asarray(KALMAN_Q_GRID if fit_noise else [1.0 / KALMAN_WINDOW ** 2 if q is None else q])
+
+    for lo in range(0, n_symbols, block_size):
+        hi = min(lo + block_size, n_symbols)
+        block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+        valid = np.isfinite(block) & market_valid[:, None]
+        if mask is not None:
+            valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+        y = np.where(valid, block, 0.0)
+
+        R, scaled_inverse, ok = _ols_noise(y, valid, design)
+        n = valid.sum(axis=0)
+        up = (valid & (market > 0)[:, None]).sum(axis=0)
+        down = (valid & (market < 0)[:, None]).sum(axis=0)
+        ok &= (n >= min_observations) & (up > min_regime_days) & (down > min_regime_days) & (R > 0)
+        columns = np.flatnonzero(ok)
+        if not len(columns):
+            continue
+        y, valid, R, scaled_inverse = y[:, columns], valid[:, columns], R[columns], scaled_inverse[columns]
+        base = R[:, None, None] * scaled_inverse
+        P0 = KALMAN_PRIOR_SCALE * base
+
+        if len(grid) > 1:
+            # Every grid value as one batch: (grid x symbols) filters, likelihood only
+            G, B = len(grid), len(columns)
+            Q = (grid[:, None, None, None] * base[None]).reshape(G * B, 3, 3)
+            _, _, log_likelihood = _filter(np.tile(y, G), np.tile(valid, G), design, market_valid,
+                                           Q, np.tile(R, G), np.tile(P0, (G, 1, 1)))
+            best = log_likelihood.reshape(G, B).argmax(axis=0)
+            chosen = grid[best]
+        else:
+            chosen = np.full(len(columns), grid[0])
+
+        Q = chosen[:, None, None] * base
+        thetas, covariances, log_likelihood = _filter(y, valid, design, market_valid, Q, R, P0, store=True)
+        if smooth:
+            states, variances = _smooth(thetas, covariances, Q)
+        else:
+            states, variances = thetas, np.diagonal(covariances, axis1=2, axis2=3)
+
+        # Only report dates between the first and last observation of each symbol
+        first = valid.argmax(axis=0)
+        last = n_dates - 1 - valid[::-1].argmax(axis=0)
+        rows = np.arange(n_dates)[:, None]
+        listed = (rows >= first) & (rows <= last)
+        targets = lo + columns
+        values = [states[:, :, 0], states[:, :, 1], states[:, :, 2],
+                  np.sqrt(variances[:, :, 1]), np.sqrt(variances[:, :, 2])]
+        for name, value in zip(KALMAN_BETA_TYPES, values):
+            panels[name][:, targets] = np.where(listed, value, np.nan)
+        params['q'][targets] = chosen
+        params['observation_variance'][targets] = R
+        params['log_likelihood'][targets] = log_likelihood
+
+    return panels, params
+
+
+def kalman_betas_from_matrix(matrix, symbols=None, **kwargs):
+    """
+    Kalman beta paths for the stocks of a ReturnsMatrix.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix with a market column
+        symbols (list, optional): Stocks to include (default: all stocks)
+        **kwargs: Passed to kalman_betas
+
+    Returns:
+        tuple: (dict KALMAN_BETA_TYPES -> DataFrame (dates x symbols),
+                DataFrame of the per-symbol noise parameters)
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    panels, params = kalman_betas(returns, market, mask=mask, **kwargs)
+    frames = {name: pd.DataFrame(panel, index=matrix.dates, columns=symbols) for name, panel in panels.items()}
+    return frames, pd.DataFrame(params, index=pd.Index(symbols, name='symbol'))
+
+
+def beta_bands(panels, z=BAND_Z):
+    """
+    Uncertainty bands around the beta paths.
+
+    Args:
+        panels (dict): Output of kalman_betas or kalman_betas_from_matrix
+        z (float): Band half-width in standard deviations
+
+    Returns:
+        dict: 'positive_beta_lower', 'positive_beta_upper', 'negative_beta_lower',
+              'negative_beta_upper' -> arrays / DataFrames like the panels
+    """
+    bands = {}
+    for name in ('positive_beta', 'negative_beta'):
+        bands[f'{name}_lower'] = panels[name] - z * panels[f'{name}_std']
+        bands[f'{name}_upper'] = panels[name] + z * panels[f'{name}_std']
+    return bands
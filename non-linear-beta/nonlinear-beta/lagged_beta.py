@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Lead/lag-augmented betas for non-synchronous trading.
+
+Thinly traded stocks, and series closed at slightly different times (SPY
+vs ^GSPC), react to part of a market move a day late, which biases daily
+betas towards zero. Two classic corrections, for every symbol at once:
+
+    Dimson          r_t = a + sum_k b_k m_{t-k} + e,  k = -leads .. lags
+                    beta = sum_k b_k (one multiple regression per stock)
+    Scholes-Williams
+                    beta = sum_k beta_k / (1 + 2 rho_1),  k = -1, 0, 1
+                    beta_k the simple slope of r_t on m_{t-k}, rho_1 the
+                    market's first-order autocorrelation
+
+The shifted market series are columns of one dates x shifts matrix, so the
+Scholes-Williams slopes are a multi-benchmark RegimeMoments pass and the
+Dimson normal equations are masked matrix products over the shared design
+(as in asymmetry_tests.py), solved as one stacked batch.
+
+Both are split by the sign of the contemporaneous market return, like the
+positive / negative betas of beta_engine.
+"""
+
+import numpy as np
+
+from beta_engine import (BLOCK_SIZE, MIN_OBSERVATIONS, MIN_REGIME_DAYS, SIGN_REGIMES,
+                         RegimeMoments, regime_usable, sign_regimes)
+
+LAGGED_BETA_TYPES = ('dimson_beta', 'dimson_positive_beta', 'dimson_negative_beta',
+                     'scholes_williams_beta', 'scholes_williams_positive_beta',
+                     'scholes_williams_negative_beta')
+
+
+def shifted_market(market, lags=1, leads=1):
+    """
+    Market returns shifted by whole sessions.
+
+    Column k holds m_{t - shift} for shift = lags, ..., 1, 0, -1, ..., -leads,
+    where the previous / next session is the previous / next row with a
+    market return (rows without one stay NaN).
+
+    Returns:
+        tuple: (dates x (lags + leads + 1) matrix, list of shifts)
+    """
+    market = np.asarray(market, dtype=np.float64)
+    rows = np.flatnonzero(np.isfinite(market))
+    values = market[rows]
+    shifts = list(range(lags, -leads - 1, -1))
+
+    shifted = np.full((len(market), len(shifts)), np.nan)
+    for k, shift in enumerate(shifts):
+        if shift > 0:
+            shifted[rows[shift:], k] = values[:-shift]
+        elif shift < 0:
+            shifted[rows[:shift], k] = values[-shift:]
+        else:
+            shifted[rows, k] = values
+    return shifted, shifts
+
+
+def scholes_williams_betas(returns, market, mask=None, min_observations=MIN_OBSERVATIONS,
+                           min_regime_days=MIN_REGIME_DAYS, ddof='legacy', block_size=BLOCK_SIZE):
+    """
+    Scholes-Williams betas of every column of returns, per sign regime.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES for the slopes
+        block_size (int): Symbols processed per block
+
+    Returns:
+        numpy.ndarray: symbols x 3 betas in SIGN_REGIMES order, NaN where undefined
+    """
+    market = np.asarray(market, dtype=np.float64)
+    shifted, _ = shifted_market(market, lags=1, leads=1)
+    # Regimes follow today's market move; every slope uses the same dates
+    complete = np.isfinite(shifted).all(axis=1)
+    regimes = sign_regimes(np.where(complete, market, np.nan))
+
+    moments = RegimeMoments.from_returns(returns, shifted, regimes=regimes, mask=mask,
+                                         regime_names=SIGN_REGIMES, block_size=block_size)
+    slopes = moments.beta(ddof)  # symbols x shifts x regimes
+
+    lagged, current = shifted[complete, 0], shifted[complete, 1]
+    rho = np.corrcoef(lagged, current)[0, 1] if complete.sum() > 2 else np.nan
+    with np.errstate(invalid='ignore'):
+        betas = slopes.sum(axis=1) / (1.0 + 2.0 * rho)
+
+    usable = regime_usable(moments.n[:, 1, :], min_observations, min_regime_days)
+    return np.where(usable, betas, np.nan)
+
+
+def dimson_betas(returns, market, mask=None, lags=1, leads=1, min_observations=MIN_OBSERVATIONS,
+                 min_regime_days=MIN_REGIME_DAYS, block_size=BLOCK_SIZE):
+    """
+    Dimson sum-of-coefficients betas of every column of returns, per sign regime.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        lags (int): Lagged market terms m_{t-1} .. m_{t-lags}
+        leads (int): Leading market terms m_{t+1} .. m_{t+leads}
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        block_size (int): Symbols processed per block
+
+    Returns:
+        numpy.ndarray: symbols x 3 betas in SIGN_REGIMES order, NaN where undefined
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    shifted, _ = shifted_market(market, lags, leads)
+    complete = np.isfinite(shifted).all(axis=1)
+    regimes = sign_regimes(np.where(complete, market, np.nan)).astype(np.float64)
+
+    n_dates, n_symbols = returns.shape
+    design = np.column_stack([np.ones(n_dates), np.where(complete[:, None], shifted, 0.0)])
+    k = design.shape[1]
+    outer = (design[:, :, None] * design[:, None, :]).reshape(n_dates, k * k)
+
+    betas = np.full((n_symbols, 3), np.nan)
+    for lo in range(0, n_symbols, block_size):
+        hi = min(lo + block_size, n_symbols)
+        block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+        valid = np.isfinite(block) & complete[:, None]
+        if mask is not None:
+            valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+        y = np.where(valid, block, 0.0)
+        n = valid.T.astype(np.float64) @ regimes
+        usable = regime_usable(n, min_observations, min_regime_days)
+
+        for r in range(3):
+            weights = valid * regimes[:, r:r + 1]
+            xtx = (weights.T @ outer).reshape(-1, k, k)
+            xty = (y * weights).T @ design
+            # Singular systems (e.g. too few days) are left NaN
+            ok = usable[:, r].copy()
+            ok &= np.linalg.cond(np.where(ok[:, None, None], xtx, np.eye(k))) < 1e12
+            if not ok.any():
+                continue
+            coef = np.linalg.solve(xtx[ok], xty[ok][:, :, None])[:, :, 0]
+            betas[lo:hi, r][ok] = coef[:, 1:].sum(axis=1)
+    return betas
+
+
+def lagged_betas(returns, market, mask=None, lags=1, leads=1, **kwargs):
+    """
+    Dimson and Scholes-Williams betas as compute_betas-style arrays.
+
+    Args:
+        lags, leads (int): Dimson lag / lead terms (Scholes-Williams always uses one of each)
+        **kwargs: min_observations, min_regime_days, block_size
+
+    Returns:
+        dict: LAGGED_BETA_TYPES -> arrays of length n_symbols
+    """
+    dimson = dimson_betas(returns, market, mask, lags, leads, **kwargs)
+    scholes_williams = scholes_williams_betas(returns, market, mask, **kwargs)
+    arrays = [dimson[:, 0], dimson[:, 1], dimson[:, 2],
+              scholes_williams[:, 0], scholes_williams[:, 1], scholes_williams[:, 2]]
+    return dict(zip(LAGGED_BETA_TYPES, arrays))
+
+
+def lagged_betas_from_matrix(matrix, symbols=None, lags=1, leads=1, **kwargs):
+    """
+    Dimson and Scholes-Williams betas for the stocks of a ReturnsMatrix.
+
+    Returns:
+        dict: symbol -> {LAGGED_BETA_TYPES: value or None}
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    arrays = lagged_betas(returns, market, mask, lags, leads, **kwargs)
+    return {symbol: {name: None if np.isnan(values[j]) else float(values[j])
+                     for name, values in arrays.items()}
+            for j, symbol in enumerate(symbols)}
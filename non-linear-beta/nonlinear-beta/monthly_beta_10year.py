@@ -14,19 +14,17 @@ from datetime import datetime
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from getBars import getBars
+from period_returns import period_returns
 
 def resample_to_monthly(data):
     """Convert daily data to monthly returns."""
     if data is None or len(data) == 0:
         return None
     
-    # Resample to month-end prices
-    monthly_prices = data['close'].resample('ME').last()  # Updated to 'ME' to avoid deprecation
+    # Month-end closes and returns from the calendar-based period stage
+    monthly_returns = period_returns({'close': data['close']}, ('monthly',))['monthly']['close']
     
-    # Calculate monthly returns
-    monthly_returns = monthly_prices.pct_change().dropna()
-    
-    return monthly_returns
+    return monthly_returns.dropna()
 
 def calculate_beta_monthly(stock_data, market_data):
     """
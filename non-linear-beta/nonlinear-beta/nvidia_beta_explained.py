@@ -11,6 +11,8 @@ import os
 # Add the current directory to the path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from getBars import getBars
+from kalman_beta import beta_bands, kalman_betas
+from rolling_beta import rolling_betas as compute_rolling_betas
 
 print("="*80)
 print("NVIDIA BETA INVESTIGATION: WHY 1.7 IS ACTUALLY REASONABLE")
@@ -106,19 +108,12 @@ print(f"   • NVIDIA is volatile but HIGHLY correlated (r={correlation:.3f})")
 print(f"\n5. PERIOD ANALYSIS:")
 # Let's look at rolling beta over time
 rolling_window = 252  # 1 year
-rolling_betas = []
-rolling_dates = []
-
-for i in range(rolling_window, len(nvda_ret_clean)):
-    window_nvda = nvda_ret_clean[i-rolling_window:i]
-    window_spy = spy_ret_clean[i-rolling_window:i]
-    
-    window_cov = np.cov(window_nvda, window_spy)[0, 1]
-    window_var = np.var(window_spy)
-    window_beta = window_cov / window_var
-    
-    rolling_betas.append(window_beta)
-    rolling_dates.append(nvda_returns.index[i])
+
+# Cumulative-sum rolling engine (O(1) per step, see rolling_beta.py); the
+# beta dated i uses the window of returns i-252 .. i-1
+panels = compute_rolling_betas(nvda_ret_clean, spy_ret_clean, rolling_window)
+rolling_betas = panels['traditional_beta'][rolling_window - 1:len(nvda_ret_clean) - 1, 0]
+rolling_dates = list(nvda_returns.index[rolling_window:len(nvda_ret_clean)])
 
 avg_beta = np.mean(rolling_betas)
 min_beta = np.min(rolling_betas)
@@ -128,6 +123,15 @@ print(f"   • 1-year rolling beta: {min_beta:.2f} to {max_beta:.2f}")
 print(f"   • Average rolling beta: {avg_beta:.2f}")
 print(f"   • Current 10-year beta: {beta:.2f}")
 
+# Smoothed state-space path of the up- and down-market betas (kalman_beta.py),
+# no window edge effects and a 95% band for every day
+kalman, _ = kalman_betas(nvda_ret_clean, spy_ret_clean, fit_noise=True)
+bands = beta_bands(kalman)
+for name, label in [('positive_beta', 'Up-market'), ('negative_beta', 'Down-market')]:
+    path = kalman[name][:, 0]
+    print(f"   • {label} Kalman beta: {np.nanmin(path):.2f} to {np.nanmax(path):.2f}, "
+          f"latest {path[-1]:.2f} [{bands[f'{name}_lower'][-1, 0]:.2f}, {bands[f'{name}_upper'][-1, 0]:.2f}]")
+
 print(f"\nCONCLUSION:")
 print("="*50)
 print("A 1.7 beta for NVIDIA is MATHEMATICALLY CORRECT and REASONABLE")
@@ -5,14 +5,14 @@ Ultra-simple NVIDIA beta calculator.
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 print("NVIDIA BETA CALCULATION - WORKING VERSION")
 print("="*50)
 
 # Download with auto_adjust=False to get simpler column structure
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 print(f"Downloaded {len(nvda)} NVIDIA records")
 print(f"Downloaded {len(spy)} SPY records")
@@ -91,7 +91,7 @@ tech_stocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN']
 
 for stock in tech_stocks:
     try:
-        data = yf.download(stock, start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+        data = download(stock, start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
         returns = data['Close'].pct_change().dropna()
         aligned_returns = returns[aligned_dates]
         
@@ -4,14 +4,15 @@ Simple analysis of why NVIDIA beta is 1.7
 """
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
+from rolling_beta import MomentPrefixSums
 
 print("WHY IS NVIDIA BETA ONLY 1.7? - INVESTIGATION")
 print("="*50)
 
 # Get data
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 # Check price performance
 nvda_start = float(nvda['Close'].iloc[0])
@@ -58,17 +59,15 @@ periods = [
     ('2023-01-01', '2025-01-01', '2023-2025 (AI Boom)')
 ]
 
+# Each period is answered from prefix sums over the data already loaded
+prefix = MomentPrefixSums.from_closes({'NVDA': nvda['Close']}, spy['Close'])
+
 for start, end, label in periods:
     try:
-        n = yf.download('NVDA', start=start, end=end, progress=False, auto_adjust=False)
-        s = yf.download('SPY', start=start, end=end, progress=False, auto_adjust=False)
+        moments = prefix.moments(start, end)
         
-        if len(n) > 50:
-            n_ret = n['Close'].pct_change().dropna().values
-            s_ret = s['Close'].pct_change().dropna().values
-            
-            min_l = min(len(n_ret), len(s_ret))
-            b = np.cov(n_ret[:min_l], s_ret[:min_l])[0,1] / np.var(s_ret[:min_l])
+        if moments.n[0, 0] > 50:
+            b = moments.beta()[0, 0]
             
             print(f"{label}: {b:.3f}")
     except:
@@ -102,7 +101,7 @@ growth_stocks = ['TSLA', 'AMZN', 'NFLX']
 
 for stock in growth_stocks:
     try:
-        data = yf.download(stock, start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+        data = download(stock, start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
         if len(data) > 100:
             ret = data['Close'].pct_change().dropna().values
             min_l = min(len(ret), len(spy_ret))
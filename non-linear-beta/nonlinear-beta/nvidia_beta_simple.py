@@ -5,7 +5,7 @@ Simple NVIDIA beta calculator - corrected version.
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 def calculate_nvidia_beta_simple():
     """Simple, working beta calculation for NVIDIA."""
@@ -15,10 +15,10 @@ def calculate_nvidia_beta_simple():
     
     # Download data
     print("Downloading NVIDIA data...")
-    nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False)
+    nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False)
     
     print("Downloading SPY data...")
-    spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False)
+    spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False)
     
     # Use adjusted close for proper split handling
     print("Column names:", nvda.columns.tolist())
@@ -96,8 +96,8 @@ def test_other_stocks():
     
     for symbol in stocks:
         try:
-            stock = yf.download(symbol, start='2015-01-01', end='2025-01-01', progress=False)
-            spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False)
+            stock = download(symbol, start='2015-01-01', end='2025-01-01', progress=False)
+            spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False)
             
             stock_returns = stock['Adj Close'].pct_change().dropna()
             spy_returns = spy['Adj Close'].pct_change().dropna()
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 print("NVIDIA BETA - FINAL WORKING VERSION")
 print("="*40)
 
 # Get data with auto_adjust=False to avoid multi-index issues
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 # Extract close prices as 1D series
 nvda_close = nvda['Close'].squeeze()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Weekly and monthly returns for the whole universe from one daily panel.
+
+The monthly scripts used to call close.resample('ME'/'BM').last() per
+symbol and per convention, then pct_change(). Here the period boundaries
+come once from the trading calendar's last-session-of-week / -month
+flags, each row of the daily close panel is assigned to its period with a
+searchsorted, and the last valid close of every period and symbol is taken
+with a single np.maximum.reduceat over row numbers. All conventions built
+on the same period (monthly, business month end, calendar month end)
+share that one reduction and only differ in their labels and fill rule.
+
+Conventions (matching the pandas calls they replace):
+    weekly              resample('W').last()           labelled on Sundays
+    monthly             resample('ME').last()          labelled on calendar month ends
+    business_month_end  resample('BME').last()         labelled on the last weekday
+    calendar_month_end  resample('ME').last().ffill()  months without a close carry the last one
+
+Returns are pct_change() without padding: a period whose close or previous
+close is missing has a NaN return.
+"""
+
+import numpy as np
+import pandas as pd
+
+from beta_engine import RegimeMoments, betas_from_moments
+from helperMethods import _day_numbers, getTradingCalendar
+
+# convention -> (period, label, forward-fill closes)
+PERIOD_CONVENTIONS = {
+    'weekly': ('week', 'W-SUN', False),
+    'monthly': ('month', 'ME', False),
+    'business_month_end': ('month', 'BME', False),
+    'calendar_month_end': ('month', 'ME', True)
+}
+
+
+def close_panel(closes):
+    """
+    Daily close panel on the union of all dates.
+
+    Args:
+        closes: dict symbol -> close Series (or bars DataFrame with 'close'),
+            or a DataFrame of closes (dates x symbols)
+
+    Returns:
+        pandas.DataFrame: dates x symbols closes, NaN where a symbol has no bar
+    """
+    if isinstance(closes, pd.DataFrame):
+        return closes.sort_index().astype(np.float64)
+
+    series = {}
+    for symbol, close in closes.items():
+        if isinstance(close, pd.DataFrame):
+            close = close['close']
+        if close is not None and len(close) > 0:
+            series[symbol] = close
+    if not series:
+        return pd.DataFrame(dtype=np.float64)
+    return pd.DataFrame(series).sort_index().astype(np.float64)
+
+
+def _period_last_days(end_days, label):
+    """Label day numbers for periods given their last sessions."""
+    if label == 'W-SUN':
+        # Monday is weekday 0; 1970-01-01 was a Thursday
+        return end_days + 6 - (end_days + 3) % 7
+    months = end_days.astype('datetime64[D]').astype('datetime64[M]')
+    month_ends = ((months + 1).astype('datetime64[D]') - 1).astype(np.int64)
+    if label == 'ME':
+        return month_ends
+    if label == 'BME':
+        weekday = (month_ends + 3) % 7
+        return month_ends - np.maximum(weekday - 4, 0)
+    raise ValueError(f"Unknown period label {label}")
+
+
+def period_rows(dates, period='month', calendar=None):
+    """
+    Period of every row of a daily index.
+
+    Args:
+        dates (pandas.DatetimeIndex): Sorted daily dates
+        period (str): 'week' or 'month'
+        calendar (TradingCalendar, optional): Calendar to take the period ends
+            from (default: the process-wide calendar)
+
+    Returns:
+        tuple: (row_periods, end_days) - the period number of each row and the
+               day number of each period's last session, periods numbered
+               0 .. len(end_days) - 1 from the first row's period
+    """
+    days = _day_numbers(dates)
+    if len(days) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if calendar is None:
+        first, last = pd.DatetimeIndex(dates)[[0, -1]]
+        calendar = getTradingCalendar(first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d'))
+
+    flags = calendar.week_end if period == 'week' else calendar.month_end
+    end_days = calendar.days[flags]
+    # Search on the period's last calendar day so that rows falling on
+    # non-session days still land in their own week / month
+    boundaries = _period_last_days(end_days, 'W-SUN' if period == 'week' else 'ME')
+    row_periods = np.searchsorted(boundaries, days, 'left')
+    if row_periods[-1] >= len(end_days):
+        raise ValueError(f"Trading calendar ends before {pd.DatetimeIndex(dates)[-1].date()}")
+
+    first_period = row_periods[0]
+    return row_periods - first_period, end_days[first_period:row_periods[-1] + 1]
+
+
+def period_last_rows(values, row_periods, n_periods):
+    """
+    Row of the last valid close of every period and column.
+
+    Args:
+        values (numpy.ndarray): dates x symbols closes, NaN where missing
+        row_periods (numpy.ndarray): Non-decreasing period number of each row
+        n_periods (int): Number of periods
+
+    Returns:
+        numpy.ndarray: periods x symbols row numbers, -1 where a period has no close
+    """
+    n_dates, n_symbols = values.shape
+    last_rows = np.full((n_periods, n_symbols), -1)
+    if n_dates == 0 or n_symbols == 0:
+        return last_rows
+
+    rows = np.where(np.isfinite(values), np.arange(n_dates)[:, None], -1)
+    starts = np.flatnonzero(np.r_[True, row_periods[1:] != row_periods[:-1]])
+    last_rows[row_periods[starts]] = np.maximum.reduceat(rows, starts, axis=0)
+    return last_rows
+
+
+def period_closes(values, last_rows, fill=False):
+    """
+    Period closes from period_last_rows.
+
+    Args:
+        values (numpy.ndarray): dates x symbols closes
+        last_rows (numpy.ndarray): Output of period_last_rows
+        fill (bool): Carry the last close into periods without one, up to
+            the symbol's last period with a close
+
+    Returns:
+        numpy.ndarray: periods x symbols closes, NaN where a period has no close
+    """
+    if fill and len(last_rows):
+        present = last_rows >= 0
+        last_period = len(last_rows) - 1 - present[::-1].argmax(axis=0)
+        last_rows = np.maximum.accumulate(last_rows, axis=0)
+        last_rows[np.arange(len(last_rows))[:, None] > last_period] = -1
+    closes = np.full(last_rows.shape, np.nan)
+    present = last_rows >= 0
+    if present.any():
+        closes[present] = np.take_along_axis(values, np.maximum(last_rows, 0), axis=0)[present]
+    return closes
+
+
+def period_returns(closes, conventions=tuple(PERIOD_CONVENTIONS), calendar=None):
+    """
+    Period returns of every symbol for several conventions at once.
+
+    Args:
+        closes: dict symbol -> close Series / bars DataFrame, or a DataFrame of
+            closes (dates x symbols), e.g. the daily panel loaded once
+        conventions (tuple): Keys of PERIOD_CONVENTIONS
+        calendar (TradingCalendar, optional): Calendar for the period ends
+
+    Returns:
+        dict: convention -> DataFrame (periods x symbols) of returns, indexed by
+              period label, NaN where a symbol has no return
+    """
+    panel = close_panel(closes)
+    values = panel.to_numpy(dtype=np.float64)
+
+    # One reduction per period type, shared by its conventions
+    reduced = {}
+    results = {}
+    for convention in conventions:
+        period, label, fill = PERIOD_CONVENTIONS[convention]
+        if period not in reduced:
+            row_periods, end_days = period_rows(panel.index, period, calendar)
+            reduced[period] = (end_days, period_last_rows(values, row_periods, len(end_days)))
+        end_days, last_rows = reduced[period]
+        prices = period_closes(values, last_rows, fill)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1.0
+        labels = _period_last_days(end_days[1:], label).astype('datetime64[D]').astype('datetime64[ns]')
+        results[convention] = pd.DataFrame(returns, index=pd.DatetimeIndex(labels), columns=panel.columns)
+    return results
+
+
+def recent_common_mask(returns, market, periods=None):
+    """
+    Each symbol's last `periods` dates on which it and the market both have a
+    return: the rows of stock_aligned.tail(periods) after intersecting the
+    two indexes.
+
+    Args:
+        returns (numpy.ndarray): periods x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns (NaN where missing)
+        periods (int, optional): Window length (default: all common dates)
+
+    Returns:
+        numpy.ndarray: Boolean periods x symbols mask
+    """
+    common = np.isfinite(returns) & np.isfinite(market)[:, None]
+    if periods is None:
+        return common
+    remaining = np.cumsum(common[::-1], axis=0)[::-1]
+    return common & (remaining <= periods)
+
+
+def period_betas(returns, market_symbol, periods=None, min_periods=24, min_regime_periods=5,
+                 ddof='sample'):
+    """
+    Yahoo-style betas of every column of a period return frame.
+
+    Args:
+        returns (pandas.DataFrame): Output of period_returns for one convention
+        market_symbol (str): Column holding the market returns
+        periods (int, optional): Use only each stock's last this many periods in
+            common with the market (60 for 5Y monthly), as recent_common_mask
+        min_periods (int): Minimum common periods for any beta
+        min_regime_periods (int): A regime beta needs more than this many periods
+        ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES ('sample' is
+            the linregress slope)
+
+    Returns:
+        pandas.DataFrame: One row per stock with the compute_betas columns plus
+            'correlation', 'start_date' and 'end_date'
+    """
+    market = returns[market_symbol].to_numpy(dtype=np.float64)
+    stocks = returns.drop(columns=[market_symbol])
+    values = stocks.to_numpy(dtype=np.float64)
+    valid = recent_common_mask(values, market, periods)
+
+    moments = RegimeMoments.from_returns(values, market, mask=valid)
+    betas = betas_from_moments(moments, min_periods, min_regime_periods, ddof)
+    betas['correlation'] = moments.correlation()[:, 0]
+
+    dates = stocks.index
+    has_data = valid.any(axis=0)
+    first = np.where(has_data, valid.argmax(axis=0), 0)
+    last = np.where(has_data, len(dates) - 1 - valid[::-1].argmax(axis=0), 0)
+    frame = pd.DataFrame(betas, index=stocks.columns)
+    if len(dates):
+        frame['start_date'] = dates[first].where(has_data)
+        frame['end_date'] = dates[last].where(has_data)
+    else:
+        frame['start_date'] = frame['end_date'] = pd.NaT
+    return frame
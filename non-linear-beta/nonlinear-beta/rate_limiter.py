@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Request scheduling for data providers: token-bucket rate limiting plus
+AIMD (additive-increase / multiplicative-decrease) concurrency control.
+
+The token bucket caps the request rate; the concurrency controller finds
+how many requests can be in flight at once by growing the limit while
+requests succeed quickly and halving it on throttling signals (HTTP 429,
+empty responses) or latency spikes. Nobody ever sleeps while holding a lock.
+"""
+
+import threading
+import time
+import concurrent.futures
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket allowing max_calls per time_window with bursts up to burst.
+
+    acquire() reserves a token under the lock and sleeps, if needed, after
+    releasing it, so a throttled caller never blocks the other workers from
+    taking their own reservation.
+    """
+
+    def __init__(self, max_calls=200, time_window=60, burst=None):
+        self.rate = max_calls / float(time_window)
+        self.capacity = float(burst if burst is not None else max_calls)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens (possibly going into debt) and return seconds to wait."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def wait_if_needed(self):
+        """Drop-in replacement for the old OptimizedRateLimiter API."""
+        self.acquire(1)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on the number of in-flight requests.
+
+    Every successful request adds 1/limit to the limit (about +1 per round
+    of requests); a throttled or slow request multiplies it by `decrease`,
+    at most once per observed round-trip so a burst of failures from the
+    same round only backs off once. Requests that failed for other reasons
+    leave the limit unchanged.
+
+    Args:
+        initial (int): Starting concurrency
+        minimum (int): Lower bound for the limit
+        maximum (int): Upper bound for the limit
+        decrease (float): Multiplicative backoff factor
+        latency_tolerance (float): Latency above tolerance x baseline counts as congestion
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, decrease=0.5, latency_tolerance=3.0):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def set_maximum(self, maximum):
+        """Change the concurrency ceiling, clamping the current limit to it."""
+        with self.condition:
+            self.maximum = maximum
+            self.limit = max(self.minimum, min(self.limit, maximum))
+            self.condition.notify_all()
+
+    def acquire(self):
+        """Wait for a free slot under the current limit."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled=False, failed=False):
+        """
+        Return a slot and feed the outcome of the request back into the limit.
+
+        Args:
+            latency (float): Seconds the request took
+            throttled (bool): The provider signalled congestion
+            failed (bool): The request raised an error that is not a throttling
+                signal; the slot is returned without changing the limit
+        """
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if failed and not throttled:
+                self.condition.notify_all()
+                return
+
+            congested = throttled
+            if not throttled:
+                if self.baseline_latency is None:
+                    self.baseline_latency = latency
+                else:
+                    # Slow-moving baseline so a single spike does not shift it
+                    self.baseline_latency = 0.9 * self.baseline_latency + 0.1 * latency
+                    congested = latency > self.latency_tolerance * self.baseline_latency
+
+            if congested:
+                if now - self.last_decrease > (self.baseline_latency or 0.0):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self.condition.notify_all()
+
+
+def is_throttled(result, error):
+    """
+    Default congestion signal: HTTP 429 / rate-limit errors or an empty response.
+    """
+    if error is not None:
+        text = f"{type(error).__name__} {error}"
+        return '429' in text or 'RateLimit' in text or 'Too Many Requests' in text
+    if result is None:
+        return True
+    try:
+        return len(result) == 0
+    except TypeError:
+        return False
+
+
+class RequestScheduler:
+    """
+    Run provider requests through a token bucket and an AIMD concurrency limit.
+
+    Args:
+        rate_limiter (TokenBucketRateLimiter, optional): Request-rate cap
+        concurrency (AdaptiveConcurrency, optional): In-flight request limit
+        throttled (callable, optional): f(result, error) -> bool congestion signal
+    """
+
+    def __init__(self, rate_limiter=None, concurrency=None, throttled=is_throttled):
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter()
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.throttled = throttled
+
+    def call(self, func, *args, **kwargs):
+        """Run one request under the scheduler; exceptions are re-raised."""
+        self.concurrency.acquire()
+        start = time.monotonic()
+        result, error = None, None
+        try:
+            self.rate_limiter.acquire()
+            start = time.monotonic()
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            throttled = self.throttled(result, error)
+            self.concurrency.release(time.monotonic() - start, throttled,
+                                     failed=error is not None and not throttled)
+
+    def map(self, func, items):
+        """
+        Apply func to every item concurrently, yielding (item, result, error)
+        as requests complete. The thread pool is sized to the concurrency
+        ceiling; the adaptive limit decides how many actually run at once.
+        """
+        items = list(items)
+        if not items:
+            return
+        workers = min(len(items), self.concurrency.maximum)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.call, func, item): item for item in items}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Many regime definitions, one pass over the returns.
+
+The analysis scripts split days one way: market > 0 vs market < 0. Any
+split of the dates is a boolean mask over the market's dates, and
+RegimeMoments.from_returns already takes a dates x regimes mask matrix,
+turning it into per-regime sums with one masks' x returns matrix product
+for the whole universe. This module builds that matrix for a catalogue
+of definitions at once:
+
+    sign         market > 0 / market < 0
+    mean         above / below the sample mean (Bawa-Lindenberg downside)
+    quantile     buckets of the market return (quintiles by default)
+    lagged_sign  sign of the previous session's market return
+    volatility   terciles of the trailing 21-day market volatility, with cut
+                 points from the volatility history up to the day
+    drawdown     market more than 10% below its running peak, or not
+    trend        market above / below its 200-day moving average
+
+States that describe the market before the day (lagged sign, volatility,
+drawdown, trend) use data up to the previous session only; the volatility
+cut points are expanding-window quantiles, so days before a year of
+volatility history belong to no volatility regime. The mean and quantile
+splits describe the day's own return and use full-sample thresholds.
+
+RegimeMasks keeps the masks as bitsets (np.packbits along the dates, one
+bit per day and regime), so dozens of definitions over ten years take a
+few kilobytes and can be saved next to the returns matrix.
+
+Usage:
+    python regime_masks.py                  # stocks of returns_matrix.bin
+    python regime_masks.py path/to/matrix   # another returns matrix
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from beta_engine import MIN_OBSERVATIONS, MIN_REGIME_DAYS, RegimeMoments, regime_usable
+from returns_matrix import DEFAULT_MATRIX_PATH, open_returns_matrix
+
+REGIME_RESULTS_PATH = 'sp500_regime_betas.csv'
+
+# Volatility observations needed before the expanding cut points are used
+VOLATILITY_MIN_HISTORY = 252
+
+
+def _previous(values):
+    """Values shifted one row later (the previous session's value), NaN first."""
+    shifted = np.full(len(values), np.nan)
+    shifted[1:] = values[:-1]
+    return shifted
+
+
+def _market_level(market):
+    """Market index level from its returns (missing days leave the level unchanged)."""
+    return np.cumprod(1.0 + np.where(np.isfinite(market), market, 0.0))
+
+
+def _buckets(values, n_buckets):
+    """Bucket (0 .. n_buckets - 1) of every value by full-sample quantiles, -1 where NaN."""
+    finite = np.isfinite(values)
+    buckets = np.full(len(values), -1)
+    if finite.any():
+        cuts = np.quantile(values[finite], np.linspace(0.0, 1.0, n_buckets + 1)[1:-1])
+        buckets[finite] = np.searchsorted(cuts, values[finite], 'right')
+    return buckets
+
+
+def _expanding_buckets(values, n_buckets, min_periods):
+    """
+    Bucket of every value by quantiles of the values up to and including it,
+    -1 where NaN or with fewer than min_periods values so far.
+    """
+    series = pd.Series(values).dropna()
+    buckets = np.full(len(values), -1)
+    if len(series):
+        levels = np.linspace(0.0, 1.0, n_buckets + 1)[1:-1]
+        cuts = np.column_stack([series.expanding(min_periods).quantile(q).to_numpy() for q in levels])
+        ready = np.isfinite(cuts).all(axis=1)
+        rows = series.index.to_numpy()[ready]
+        buckets[rows] = (cuts[ready] <= series.to_numpy()[ready, None]).sum(axis=1)
+    return buckets
+
+
+def sign_split(market):
+    """Market up / down on the day."""
+    return ['positive', 'negative'], [market > 0, market < 0]
+
+
+def mean_split(market):
+    """Market above / below its sample mean (Bawa-Lindenberg downside beta)."""
+    mean = np.nanmean(market)
+    return ['above', 'below'], [market > mean, market < mean]
+
+
+def quantile_split(market, buckets=5):
+    """Buckets of the day's market return, lowest first."""
+    bucket = _buckets(market, buckets)
+    return [f'{k + 1}of{buckets}' for k in range(buckets)], [bucket == k for k in range(buckets)]
+
+
+def lagged_sign_split(market):
+    """Sign of the previous session's market return."""
+    rows = np.flatnonzero(np.isfinite(market))
+    previous = np.full(len(market), np.nan)
+    previous[rows[1:]] = market[rows[:-1]]
+    return ['positive', 'negative'], [previous > 0, previous < 0]
+
+
+def volatility_split(market, window=21, buckets=3, min_history=VOLATILITY_MIN_HISTORY):
+    """
+    Terciles of the trailing market volatility (previous window sessions),
+    cut at quantiles of the volatility history up to the day.
+    """
+    series = pd.Series(market)
+    valid = series.dropna()
+    volatility = valid.rolling(window).std().shift(1).reindex(series.index).to_numpy()
+    bucket = _expanding_buckets(volatility, buckets, min_history)
+    labels = ['low', 'mid', 'high'] if buckets == 3 else [f'{k + 1}of{buckets}' for k in range(buckets)]
+    return labels, [bucket == k for k in range(buckets)]
+
+
+def drawdown_split(market, threshold=0.10):
+    """Previous close more than threshold below the running peak, or not."""
+    level = _market_level(market)
+    drawdown = _previous(level / np.maximum.accumulate(level) - 1.0)
+    return ['in', 'out'], [drawdown <= -threshold, drawdown > -threshold]
+
+
+def trend_split(market, window=200):
+    """Previous close above / below its window-session moving average."""
+    rows = np.flatnonzero(np.isfinite(market))
+    level = np.full(len(market), np.nan)
+    level[rows] = _market_level(market)[rows]
+    average = pd.Series(level[rows]).rolling(window).mean().to_numpy()
+    gap = np.full(len(market), np.nan)
+    gap[rows] = level[rows] - average
+    gap = _previous(gap)
+    return ['up', 'down'], [gap > 0, gap < 0]
+
+
+# kind -> function(market, **params) returning (labels, masks)
+REGIME_DEFINITIONS = {
+    'sign': sign_split,
+    'mean': mean_split,
+    'quantile': quantile_split,
+    'lagged_sign': lagged_sign_split,
+    'volatility': volatility_split,
+    'drawdown': drawdown_split,
+    'trend': trend_split
+}
+
+DEFAULT_REGIMES = tuple(REGIME_DEFINITIONS)
+
+
+class RegimeMasks:
+    """
+    Named date masks stored as bitsets.
+
+    Args:
+        bits (numpy.ndarray): ceil(dates / 8) x regimes uint8, np.packbits of
+            the dates x regimes masks along the dates
+        names (list): Regime names, one per column
+        n_dates (int): Number of dates
+        dates (pandas.DatetimeIndex, optional): Row dates
+    """
+
+    def __init__(self, bits, names, n_dates, dates=None):
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.names = list(names)
+        self.n_dates = int(n_dates)
+        self.dates = pd.DatetimeIndex(dates) if dates is not None else None
+
+    @classmethod
+    def from_masks(cls, masks, names, dates=None):
+        """Pack a dates x regimes boolean matrix."""
+        masks = np.asarray(masks, dtype=bool)
+        return cls(np.packbits(masks, axis=0), names, masks.shape[0], dates)
+
+    @classmethod
+    def from_market(cls, market, definitions=DEFAULT_REGIMES, dates=None):
+        """
+        Masks of several regime definitions of one market series.
+
+        Args:
+            market (numpy.ndarray): Market returns (NaN where missing; those days
+                belong to no regime)
+            definitions: Iterable of REGIME_DEFINITIONS kinds, or (kind, params) pairs,
+                e.g. ('sign', ('quantile', {'buckets': 10}))
+            dates (pandas.DatetimeIndex, optional): Row dates
+
+        Returns:
+            RegimeMasks: One column per regime, named '<kind>_<label>'
+        """
+        market = np.asarray(market, dtype=np.float64)
+        valid = np.isfinite(market)
+        names, masks = [], []
+        for definition in definitions:
+            kind, params = (definition, {}) if isinstance(definition, str) else definition
+            if kind not in REGIME_DEFINITIONS:
+                raise ValueError(f"Unknown regime definition {kind}")
+            labels, columns = REGIME_DEFINITIONS[kind](market, **params)
+            names.extend(f'{kind}_{label}' for label in labels)
+            masks.extend(np.asarray(column, dtype=bool) & valid for column in columns)
+        matrix = np.column_stack(masks) if masks else np.zeros((len(market), 0), dtype=bool)
+        return cls.from_masks(matrix, names, dates)
+
+    def unpack(self, names=None):
+        """Boolean dates x regimes matrix (optionally only some regimes)."""
+        bits = self.bits if names is None else self.bits[:, [self.names.index(n) for n in names]]
+        return np.unpackbits(bits, axis=0, count=self.n_dates).astype(bool)
+
+    def __getitem__(self, name):
+        return self.unpack([name])[:, 0]
+
+    def __len__(self):
+        return len(self.names)
+
+    def days(self):
+        """Number of days in every regime."""
+        return pd.Series(self.unpack().sum(axis=0), index=self.names, name='days')
+
+    def save(self, path):
+        """Write the bitsets to an .npz file."""
+        dates = self.dates.values if self.dates is not None else np.array([], dtype='datetime64[ns]')
+        np.savez(path, bits=self.bits, names=np.array(self.names), n_dates=self.n_dates, dates=dates)
+
+    @classmethod
+    def load(cls, path):
+        """Read masks written by save()."""
+        with np.load(path) as data:
+            dates = data['dates']
+            return cls(data['bits'], data['names'].tolist(), int(data['n_dates']),
+                       dates if len(dates) else None)
+
+
+def regime_betas(returns, market, masks, mask=None, min_observations=MIN_OBSERVATIONS,
+                 min_regime_days=MIN_REGIME_DAYS, ddof='legacy'):
+    """
+    Betas of every column of returns in every regime of a RegimeMasks.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        masks (RegimeMasks): Regimes over the same dates
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES
+
+    Returns:
+        tuple: (symbols x regimes betas, NaN where undefined; symbols x regimes day counts),
+               the first column being all days ('traditional')
+    """
+    market = np.asarray(market, dtype=np.float64)
+    regimes = np.column_stack([np.isfinite(market), masks.unpack()])
+    moments = RegimeMoments.from_returns(returns, market, regimes=regimes, mask=mask,
+                                         regime_names=['traditional'] + masks.names)
+    betas = moments.beta(ddof)
+    usable = regime_usable(moments.n, min_observations, min_regime_days)
+    return np.where(usable, betas, np.nan), moments.n.astype(np.int64)
+
+
+def regime_betas_from_matrix(matrix, definitions=DEFAULT_REGIMES, symbols=None, **kwargs):
+    """
+    Betas under several regime definitions for the stocks of a ReturnsMatrix.
+
+    Returns:
+        tuple: (DataFrame of betas and DataFrame of day counts, one row per stock
+                and one column per regime, RegimeMasks)
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    masks = RegimeMasks.from_market(market, definitions, dates=matrix.dates)
+    betas, days = regime_betas(returns, market, masks, mask=mask, **kwargs)
+    index = pd.Index(symbols, name='symbol')
+    names = ['traditional'] + masks.names
+    return pd.DataFrame(betas, index=index, columns=names), pd.DataFrame(days, index=index, columns=names), masks
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MATRIX_PATH
+    matrix = open_returns_matrix(path)
+    if matrix is None:
+        return
+
+    start = time.perf_counter()
+    betas, days, masks = regime_betas_from_matrix(matrix)
+    elapsed = time.perf_counter() - start
+    print(f"{len(masks)} regimes x {len(betas)} stocks in {elapsed:.2f}s "
+          f"(masks: {masks.bits.nbytes:,} bytes as bitsets)")
+
+    print(f"\n{'Regime':<22} {'Days':>6} {'Mean beta':>10}")
+    market_days = masks.days()
+    for name in masks.names:
+        print(f"{name:<22} {market_days[name]:>6} {betas[name].mean():>10.3f}")
+
+    betas.to_csv(REGIME_RESULTS_PATH)
+    print(f"\nResults saved to '{REGIME_RESULTS_PATH}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Aligned, memory-mapped returns matrix for the whole universe.
+
+Instead of every analyzer keeping a dict of full OHLCV DataFrames and
+rebuilding returns per symbol with pct_change().dropna() and
+index.intersection, the close-to-close returns of all symbols are written
+once to a single file:
+
+    [ magic | header length | JSON header | pad ][ returns T x N ][ mask T x N ]
+
+The JSON header holds the date index, the symbol list, the dtype and the
+market column; both blocks start on a 64-byte boundary and are C-ordered
+dates x symbols, so any process can np.memmap them without copying.
+
+Returns are computed on each symbol's own bars (exactly what
+pct_change().dropna() gives), then placed on the union of all dates. The
+mask is True where a return exists; aligning a stock with the market is
+mask[:, j] & mask[:, market]. Benchmark columns (index or sector ETFs)
+can be stored alongside and are listed in the header so they are not
+mistaken for stocks.
+
+Usage:
+    python returns_matrix.py                          # S&P 500 from the bar store, since 2015
+    python returns_matrix.py 2015-01-01 2025-01-01    # explicit range
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'RETMTX01'
+ALIGNMENT = 64
+# Next to this module, like the bar store it is built from
+DEFAULT_MATRIX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'returns_matrix.bin')
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _close_returns(close):
+    """Close-to-close returns on a symbol's own bars, like pct_change().dropna()."""
+    close = pd.Series(close).dropna()
+    values = close.to_numpy(dtype=float)
+    if len(values) < 2:
+        return None
+    return pd.Series(values[1:] / values[:-1] - 1.0, index=close.index[1:])
+
+
+def write_returns_matrix(closes, path=DEFAULT_MATRIX_PATH, market_symbol=None, dtype='float64',
+                         benchmark_symbols=None):
+    """
+    Write the aligned returns matrix for a set of close-price series.
+
+    Args:
+        closes (dict): symbol -> close prices (Series indexed by date, or a bars
+            DataFrame with a 'close' column)
+        path (str): Output file
+        market_symbol (str, optional): Column holding the market series
+        dtype (str): 'float64' or 'float32' for the returns block
+        benchmark_symbols (list, optional): Extra benchmark columns (e.g. QQQ,
+            sector ETFs); symbols without returns are left out
+
+    Returns:
+        ReturnsMatrix: The written matrix, opened read-only
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype('float64'), np.dtype('float32')):
+        raise ValueError(f"Unsupported returns dtype {dtype}; use float64 or float32")
+
+    returns = {}
+    for symbol, close in closes.items():
+        if isinstance(close, pd.DataFrame):
+            close = close['close']
+        series = _close_returns(close) if close is not None else None
+        if series is not None and len(series) > 0:
+            returns[symbol] = series
+    if market_symbol is not None and market_symbol not in returns:
+        raise ValueError(f"No returns for market symbol {market_symbol}")
+
+    symbols = list(returns)
+    if returns:
+        dates = pd.DatetimeIndex(np.unique(np.concatenate([s.index.values for s in returns.values()])))
+    else:
+        dates = pd.DatetimeIndex([])
+    n_dates, n_symbols = len(dates), len(symbols)
+
+    header = {
+        'version': 1,
+        'dtype': dtype.str,
+        'shape': [n_dates, n_symbols],
+        'dates': [str(d) for d in dates.astype(str)],
+        'symbols': symbols,
+        'market': market_symbol,
+        'benchmarks': [s for s in (benchmark_symbols or []) if s in returns and s != market_symbol]
+    }
+    # Offsets depend on the header length, which depends on the offsets:
+    # reserve room for them, then fill in
+    header['returns_offset'] = header['mask_offset'] = 0
+    base = len(json.dumps(header).encode()) + 64
+    returns_offset = _align(len(MAGIC) + 8 + base)
+    mask_offset = _align(returns_offset + n_dates * n_symbols * dtype.itemsize)
+    header['returns_offset'] = returns_offset
+    header['mask_offset'] = mask_offset
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (returns_offset - len(MAGIC) - 8 - len(header_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            f.truncate(mask_offset + n_dates * n_symbols)
+
+        if n_dates and n_symbols:
+            matrix = np.memmap(tmp_path, dtype=dtype, mode='r+', offset=returns_offset,
+                               shape=(n_dates, n_symbols))
+            mask = np.memmap(tmp_path, dtype=np.bool_, mode='r+', offset=mask_offset,
+                             shape=(n_dates, n_symbols))
+            matrix[:] = np.nan
+            for j, symbol in enumerate(symbols):
+                rows = dates.get_indexer(returns[symbol].index)
+                matrix[rows, j] = returns[symbol].to_numpy()
+                mask[rows, j] = True
+            matrix.flush()
+            mask.flush()
+            del matrix, mask
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    print(f"Wrote {n_dates} x {n_symbols} {dtype.name} returns matrix to {path}")
+    return ReturnsMatrix(path)
+
+
+def build_from_store(symbols, start_date, end_date=None, path=DEFAULT_MATRIX_PATH,
+                     market_symbol='SPY', timeframe='1Day', dtype='float64', store=None, refresh=True,
+                     benchmark_symbols=None):
+    """
+    Build the returns matrix from the bar store, loading only close prices.
+
+    Args:
+        symbols (list): Stock symbols
+        start_date (str): Start date in 'YYYY-MM-DD' format
+        end_date (str, optional): End date in 'YYYY-MM-DD' format (default: today)
+        path (str): Output file
+        market_symbol (str): Market series stored alongside the stocks
+        timeframe (str): Bar timeframe as accepted by getBars
+        dtype (str): 'float64' or 'float32'
+        store (BarStore, optional): Bar store to read (default store if None)
+        refresh (bool): Download missing ranges first (see fetch_planner.py)
+        benchmark_symbols (list, optional): Extra benchmark columns (e.g. QQQ, sector ETFs)
+
+    Returns:
+        ReturnsMatrix: The written matrix, opened read-only
+    """
+    from bar_store import get_default_store
+    from getBars import INTERVAL_MAP, _store_interval
+
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
+    store = store or get_default_store()
+    benchmark_symbols = list(benchmark_symbols or [])
+    symbols = list(dict.fromkeys([market_symbol] + benchmark_symbols + list(symbols)))
+
+    if refresh:
+        from fetch_planner import refresh_bars
+        refresh_bars(symbols, start_date, end_date, timeframe, store)
+
+    interval = _store_interval(INTERVAL_MAP.get(timeframe, '1d'))
+    closes = {}
+    for symbol in symbols:
+        df = store.read(symbol, interval, start_date, end_date, columns=['close'])
+        if df is not None and len(df) > 0:
+            closes[symbol] = df['close']
+    return write_returns_matrix(closes, path, market_symbol, dtype, benchmark_symbols)
+
+
+class ReturnsMatrix:
+    """
+    Read-only, zero-copy view of a returns matrix file.
+
+    Attributes:
+        returns (numpy.memmap): dates x symbols returns, NaN where missing
+        mask (numpy.memmap): dates x symbols validity mask
+        dates (pandas.DatetimeIndex): Row index
+        symbols (list): Column index
+        market_symbol (str): Market column, or None
+        benchmark_symbols (list): Benchmark columns other than the market
+    """
+
+    def __init__(self, path=DEFAULT_MATRIX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a returns matrix file")
+            (header_len,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_len))
+
+        self.header = header
+        self.dtype = np.dtype(header['dtype'])
+        self.shape = tuple(header['shape'])
+        self.dates = pd.DatetimeIndex(header['dates'])
+        self.symbols = header['symbols']
+        self.market_symbol = header['market']
+        self.benchmark_symbols = header.get('benchmarks', [])
+        self._columns = {symbol: j for j, symbol in enumerate(self.symbols)}
+
+        if self.shape[0] and self.shape[1]:
+            self.returns = np.memmap(path, dtype=self.dtype, mode='r',
+                                     offset=header['returns_offset'], shape=self.shape)
+            self.mask = np.memmap(path, dtype=np.bool_, mode='r',
+                                  offset=header['mask_offset'], shape=self.shape)
+        else:
+            self.returns = np.empty(self.shape, dtype=self.dtype)
+            self.mask = np.zeros(self.shape, dtype=bool)
+
+    def __contains__(self, symbol):
+        return symbol in self._columns
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def column_index(self, symbol):
+        """Column position of symbol."""
+        return self._columns[symbol]
+
+    def column(self, symbol):
+        """A symbol's valid returns as a Series (like pct_change().dropna())."""
+        j = self._columns[symbol]
+        rows = self.mask[:, j]
+        return pd.Series(np.asarray(self.returns[rows, j]), index=self.dates[rows], name=symbol)
+
+    def market(self):
+        """The market column's valid returns as a Series."""
+        if self.market_symbol is None:
+            raise ValueError("Returns matrix has no market column")
+        return self.column(self.market_symbol)
+
+    def market_returns(self):
+        """The market column over all dates as an array, NaN where missing."""
+        if self.market_symbol is None:
+            raise ValueError("Returns matrix has no market column")
+        m = self._columns[self.market_symbol]
+        return np.where(self.mask[:, m], self.returns[:, m], np.nan)
+
+    def stock_panel(self, symbols=None, rows=slice(None)):
+        """
+        Stocks and market in the layout the vectorized beta engines take.
+
+        Args:
+            symbols (list, optional): Stocks to include (default: stock_symbols())
+            rows (slice): Dates to include (default: all)
+
+        Returns:
+            tuple: (symbols, dates x symbols returns, market returns with NaN
+                    where missing, dates x symbols mask); a contiguous run of
+                    columns is returned as a view of the memory map
+        """
+        symbols = self.stock_symbols() if symbols is None else list(symbols)
+        columns = np.array([self._columns[s] for s in symbols], dtype=np.int64)
+        if len(columns) and np.array_equal(columns, np.arange(columns[0], columns[0] + len(columns))):
+            columns = slice(columns[0], columns[0] + len(columns))
+        return symbols, self.returns[rows, columns], self.market_returns()[rows], self.mask[rows, columns]
+
+    def stock_symbols(self):
+        """All columns except the market and benchmarks."""
+        excluded = set(self.benchmark_symbols) | {self.market_symbol}
+        return [s for s in self.symbols if s not in excluded]
+
+    def aligned(self, symbol):
+        """
+        Stock and market returns on their common dates.
+
+        Returns:
+            tuple: (stock, market) numpy arrays, the same pairs
+                   calculate_beta_clean builds with index.intersection
+        """
+        j = self._columns[symbol]
+        m = self._columns[self.market_symbol]
+        rows = self.mask[:, j] & self.mask[:, m]
+        return np.asarray(self.returns[rows, j]), np.asarray(self.returns[rows, m])
+
+    def to_frame(self, symbols=None):
+        """Copy (a subset of) the matrix into a DataFrame with NaN for missing returns."""
+        symbols = self.symbols if symbols is None else list(symbols)
+        columns = [self._columns[s] for s in symbols]
+        return pd.DataFrame(np.asarray(self.returns[:, columns]), index=self.dates, columns=symbols)
+
+
+def open_returns_matrix(path=DEFAULT_MATRIX_PATH):
+    """
+    Open a returns matrix for a script, saying how to build it if it is missing.
+
+    Returns:
+        ReturnsMatrix: The matrix, or None if path does not exist
+    """
+    try:
+        return ReturnsMatrix(path)
+    except FileNotFoundError:
+        print(f"Returns matrix {path} not found. Run sp500_optimized_analysis.py or returns_matrix.py first.")
+        return None
+
+
+def main():
+    start_date = sys.argv[1] if len(sys.argv) > 1 else '2015-01-01'
+    end_date = sys.argv[2] if len(sys.argv) > 2 else None
+
+    try:
+        symbols = pd.read_csv('sp500_wikipedia_data.csv')['symbol'].tolist()
+    except FileNotFoundError:
+        print("Wikipedia data file not found. Please run sp500_wikipedia_scraper.py first.")
+        return
+
+    matrix = build_from_store(symbols, start_date, end_date)
+    size_mb = os.path.getsize(matrix.path) / 1e6
+    print(f"{len(matrix.dates)} days x {len(matrix.symbols)} symbols, {size_mb:.1f} MB on disk")
+
+
+if __name__ == "__main__":
+    main()
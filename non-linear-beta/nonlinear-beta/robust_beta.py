@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Outlier-robust traditional / up-market / down-market betas for the whole universe.
+
+A single crash day can move an np.cov beta more than a year of ordinary
+sessions, which is why some scripts drop symbols by hand. Two robust
+alternatives, fitted per sign regime like the OLS betas:
+
+    Huber       IRLS with Huber weights (t = 1.345) and a MAD scale,
+                as statsmodels RLM. Every symbol is iterated together: the
+                weighted normal equations of a simple regression on the
+                shared market column are five column sums, so one iteration
+                of a block is a handful of matrix-vector products.
+    Theil-Sen   Median of the pairwise slopes (y_j - y_i) / (x_j - x_i).
+                Instead of forming the O(n^2) pairs, the median is the root
+                of Kendall's tau between x and the residuals y - b x (the
+                sign of tau counts the pairs with slope above b minus those
+                below), and each tau is an O(n log n) merge-sort count. The
+                root is bracketed around the Huber slope and found with the
+                Illinois method; symbols are split across worker processes.
+"""
+
+import numpy as np
+from scipy import stats
+
+from beta_engine import (BLOCK_SIZE, MIN_OBSERVATIONS, MIN_REGIME_DAYS, map_symbol_chunks, regime_usable,
+                         sign_regimes)
+
+ROBUST_BETA_TYPES = ('huber_beta', 'huber_positive_beta', 'huber_negative_beta',
+                     'theil_sen_beta', 'theil_sen_positive_beta', 'theil_sen_negative_beta')
+
+# Huber tuning constant: 95% efficiency at the normal distribution
+HUBER_T = 1.345
+# MAD of a standard normal, for a consistent scale estimate
+MAD_NORMAL = stats.norm.ppf(0.75)
+
+
+def _regime_masks(returns, market, mask, lo, hi):
+    """Validity of a block of symbols and the sign regime masks of the market."""
+    block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+    valid = np.isfinite(block) & np.isfinite(market)[:, None]
+    if mask is not None:
+        valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+    return block, valid
+
+
+def huber_betas(returns, market, mask=None, t=HUBER_T, max_iter=50, tol=1e-8,
+                min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS,
+                block_size=BLOCK_SIZE):
+    """
+    Huber M-estimator slopes of every column of returns, per sign regime.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        t (float): Huber threshold in scale units
+        max_iter (int): Maximum IRLS iterations
+        tol (float): Stop when no slope moves by more than this
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        block_size (int): Symbols processed per block
+
+    Returns:
+        numpy.ndarray: symbols x 3 betas in SIGN_REGIMES order, NaN where undefined
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    regimes = sign_regimes(market)
+    x = np.where(np.isfinite(market), market, 0.0)
+    xx = x * x
+
+    n_symbols = returns.shape[1]
+    betas = np.full((n_symbols, 3), np.nan)
+    for lo in range(0, n_symbols, block_size):
+        hi = min(lo + block_size, n_symbols)
+        block, valid = _regime_masks(returns, market, mask, lo, hi)
+        y = np.where(valid, block, 0.0)
+        usable = regime_usable(valid.T @ regimes.astype(np.float64), min_observations, min_regime_days)
+
+        for r in range(3):
+            in_regime = valid & regimes[:, r:r + 1]
+            weights = in_regime.astype(np.float64)
+            slope = np.full(hi - lo, np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for _ in range(max_iter):
+                    # Weighted least squares of y on [1, x] for every column
+                    wy = weights * y
+                    sw, sx, sxx = weights.sum(axis=0), x @ weights, xx @ weights
+                    sy, sxy = wy.sum(axis=0), x @ wy
+                    new_slope = (sw * sxy - sx * sy) / (sw * sxx - sx * sx)
+                    intercept = (sy - new_slope * sx) / sw
+
+                    residuals = np.abs(y - intercept - x[:, None] * new_slope)
+                    scale = np.nanmedian(np.where(in_regime, residuals, np.nan), axis=0) / MAD_NORMAL
+                    u = residuals / scale
+                    weights = in_regime * np.where((u <= t) | ~(scale > 0), 1.0, t / u)
+
+                    change = np.abs(new_slope - slope)[usable[:, r]]
+                    slope = new_slope
+                    if change.size == 0 or np.all(change <= tol):
+                        break
+            betas[lo:hi, r] = np.where(usable[:, r], slope, np.nan)
+    return betas
+
+
+def theil_sen_slope(x, y, start=0.0, tol=1e-6, max_iter=100):
+    """
+    Theil-Sen slope of y on x as the root of Kendall's tau(x, y - b x).
+
+    Args:
+        x, y (numpy.ndarray): Observations (finite)
+        start (float): Initial guess, e.g. an OLS or Huber slope
+        tol (float): Width of the final bracket around the median pairwise slope
+        max_iter (int): Maximum tau evaluations per stage
+
+    Returns:
+        float: Median pairwise slope (to within tol), NaN if undefined
+    """
+    if len(x) < 2 or np.ptp(x) == 0:
+        return np.nan
+
+    def tau(b):
+        return stats.kendalltau(x, y - b * x).statistic
+
+    # Expand a bracket lo < root < hi: tau decreases as b increases
+    step = 0.1 * (1.0 + abs(start))
+    lo, hi = start - step, start + step
+    f_lo, f_hi = tau(lo), tau(hi)
+    for _ in range(max_iter):
+        if f_lo > 0:
+            break
+        step *= 2.0
+        lo -= step
+        f_lo = tau(lo)
+    for _ in range(max_iter):
+        if f_hi < 0:
+            break
+        step *= 2.0
+        hi += step
+        f_hi = tau(hi)
+    if not (f_lo > 0 > f_hi):
+        return np.nan
+
+    # Illinois (modified regula falsi): halve the stale end's value so both ends move
+    side = 0
+    for _ in range(max_iter):
+        if hi - lo <= tol:
+            break
+        b = hi - f_hi * (hi - lo) / (f_hi - f_lo)
+        if not lo < b < hi:
+            b = 0.5 * (lo + hi)
+        f = tau(b)
+        if f == 0:
+            # An even number of slopes: tau is zero between the two middle
+            # ones and the median is the midpoint of that interval
+            return 0.5 * (_edge(tau, lo, b, tol, max_iter) + _edge(tau, b, hi, tol, max_iter))
+        if f > 0:
+            lo, f_lo = b, f
+            if side == 1:
+                f_hi *= 0.5
+            side = 1
+        else:
+            hi, f_hi = b, f
+            if side == -1:
+                f_lo *= 0.5
+            side = -1
+    return 0.5 * (lo + hi)
+
+
+def _edge(tau, lo, hi, tol, max_iter):
+    """Bisect for the point in [lo, hi] where tau changes between zero and non-zero."""
+    zero_at_hi = tau(hi) == 0
+    for _ in range(max_iter):
+        if hi - lo <= tol:
+            break
+        mid = 0.5 * (lo + hi)
+        if (tau(mid) == 0) == zero_at_hi:
+            hi = mid
+        else:
+            lo = mid
+    return 0.5 * (lo + hi)
+
+
+def _theil_sen_block(block, market, valid, regimes, usable, starts, tol):
+    """Theil-Sen betas of one block of symbols (symbols x 3); runs in a worker process."""
+    betas = np.full((block.shape[1], 3), np.nan)
+    for j in range(block.shape[1]):
+        for r in range(3):
+            if not usable[j, r]:
+                continue
+            rows = valid[:, j] & regimes[:, r]
+            start = starts[j, r] if np.isfinite(starts[j, r]) else 0.0
+            betas[j, r] = theil_sen_slope(market[rows], block[rows, j], start, tol)
+    return betas
+
+
+def theil_sen_betas(returns, market, mask=None, starts=None, tol=1e-6,
+                    min_observations=MIN_OBSERVATIONS, min_regime_days=MIN_REGIME_DAYS,
+                    workers=None):
+    """
+    Theil-Sen slopes of every column of returns, per sign regime.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        starts (numpy.ndarray, optional): symbols x 3 initial slopes (e.g. huber_betas)
+        tol (float): Width of the final bracket around each median slope
+        min_observations (int): Minimum common dates for any beta
+        min_regime_days (int): A regime beta needs more than this many days
+        workers (int, optional): Worker processes (default: one per CPU, 1 = in process)
+
+    Returns:
+        numpy.ndarray: symbols x 3 betas in SIGN_REGIMES order, NaN where undefined
+    """
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    regimes = sign_regimes(market)
+    n_symbols = returns.shape[1]
+    if starts is None:
+        starts = np.zeros((n_symbols, 3))
+
+    def task(lo, hi):
+        block, valid = _regime_masks(returns, market, mask, lo, hi)
+        usable = regime_usable(valid.T @ regimes.astype(np.float64), min_observations, min_regime_days)
+        return block, market, valid, regimes, usable, starts[lo:hi], tol
+
+    blocks = [output for _, _, output in map_symbol_chunks(_theil_sen_block, n_symbols, task, workers)]
+    return np.vstack(blocks) if blocks else np.full((0, 3), np.nan)
+
+
+def robust_betas(returns, market, mask=None, workers=None, **kwargs):
+    """
+    Huber and Theil-Sen betas as compute_betas-style arrays.
+
+    Args:
+        workers (int, optional): Worker processes for Theil-Sen
+        **kwargs: min_observations, min_regime_days
+
+    Returns:
+        dict: ROBUST_BETA_TYPES -> arrays of length n_symbols
+    """
+    huber = huber_betas(returns, market, mask, **kwargs)
+    theil_sen = theil_sen_betas(returns, market, mask, starts=huber, workers=workers, **kwargs)
+    arrays = [huber[:, 0], huber[:, 1], huber[:, 2],
+              theil_sen[:, 0], theil_sen[:, 1], theil_sen[:, 2]]
+    return dict(zip(ROBUST_BETA_TYPES, arrays))
+
+
+def robust_betas_from_matrix(matrix, symbols=None, workers=None, **kwargs):
+    """
+    Huber and Theil-Sen betas for the stocks of a ReturnsMatrix.
+
+    Returns:
+        dict: symbol -> {ROBUST_BETA_TYPES: value or None}
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    arrays = robust_betas(returns, market, mask, workers=workers, **kwargs)
+    return {symbol: {name: None if np.isnan(values[j]) else float(values[j])
+                     for name, values in arrays.items()}
+            for j, symbol in enumerate(symbols)}
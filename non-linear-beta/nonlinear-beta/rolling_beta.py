@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Rolling traditional / up-market / down-market betas for the whole universe.
+
+Instead of re-slicing a window and re-running np.cov at every step
+(O(n * window) per stock), the per-regime moment contributions
+(n, x, y, x^2, xy masked by regime and validity) are cumulated once along
+time. The sums over any window are then the difference of two cumulative
+rows, so each step costs O(1) per symbol whatever the window length, and
+all symbols are processed together as matrices.
+
+Betas use the same definition as beta_engine (cov ddof=1 / var ddof=0 by
+default, more than 20 days per regime) over the dates of the window.
+
+MomentPrefixSums keeps the cumulative moments themselves, so the betas of
+any date range, any list of ranges or the full sample minus a range (e.g.
+without the COVID crash) are answered in O(1) per symbol per range from
+data loaded once.
+"""
+
+import numpy as np
+import pandas as pd
+
+from beta_engine import (DDOF_POLICIES, MIN_OBSERVATIONS, MIN_REGIME_DAYS, SIGN_REGIMES,
+                         RegimeMoments, betas_from_moments, sign_regimes)
+from returns_matrix import _close_returns
+
+# Symbols per block; bounds the cumulative-sum buffers (5 x dates x block)
+ROLLING_BLOCK_SIZE = 512
+
+ROLLING_BETA_TYPES = ('traditional_beta', 'positive_beta', 'negative_beta')
+
+
+def _window_sums(values, window):
+    """Sums over trailing windows ending at each row (NaN-free input), O(1) per row."""
+    cumulative = np.cumsum(values, axis=0)
+    sums = cumulative.copy()
+    sums[window:] -= cumulative[:-window]
+    return sums
+
+
+def rolling_betas(returns, market, window=252, mask=None, min_periods=MIN_OBSERVATIONS,
+                  min_regime_days=MIN_REGIME_DAYS, ddof='legacy', block_size=ROLLING_BLOCK_SIZE):
+    """
+    Rolling betas for every column of a return matrix.
+
+    The window ending at row t covers rows t - window + 1 .. t of the date
+    axis; rows before the first full window are NaN.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        window (int): Window length in rows (252 = one trading year)
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        min_periods (int): Minimum valid days in a window for any beta
+        min_regime_days (int): A regime beta needs more than this many days in the window
+        ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES
+        block_size (int): Symbols processed per block
+
+    Returns:
+        dict: 'traditional_beta', 'positive_beta', 'negative_beta' -> dates x symbols arrays
+    """
+    cov_ddof, var_ddof = DDOF_POLICIES[ddof] if isinstance(ddof, str) else ddof
+    returns = returns[:, None] if np.ndim(returns) == 1 else returns
+    market = np.asarray(market, dtype=np.float64)
+    regimes = sign_regimes(market)
+
+    # Betas are shift-invariant; centering keeps the cumulative sums small
+    x = np.where(regimes[:, 0], market, 0.0)
+    if regimes[:, 0].any():
+        x = np.where(regimes[:, 0], x - x[regimes[:, 0]].mean(), 0.0)
+
+    n_dates, n_symbols = returns.shape
+    panels = {name: np.full((n_dates, n_symbols), np.nan) for name in ROLLING_BETA_TYPES}
+    if n_dates < window:
+        return panels
+
+    for lo in range(0, n_symbols, block_size):
+        hi = min(lo + block_size, n_symbols)
+        block = np.asarray(returns[:, lo:hi], dtype=np.float64)
+        valid = np.isfinite(block)
+        if mask is not None:
+            valid &= np.asarray(mask[:, lo:hi], dtype=bool)
+        with np.errstate(invalid='ignore'):
+            y = np.where(valid, block, 0.0)
+            column_means = y.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        y = np.where(valid, y - column_means, 0.0)
+        n_total = _window_sums((valid & regimes[:, :1]).astype(np.float64), window)
+
+        for r, name in enumerate(ROLLING_BETA_TYPES):
+            w = valid & regimes[:, r:r + 1]
+            xr = x[:, None] * w
+            n = _window_sums(w.astype(np.float64), window)
+            sx = _window_sums(xr, window)
+            sxx = _window_sums(xr * x[:, None], window)
+            yr = y * w
+            sy = _window_sums(yr, window)
+            sxy = _window_sums(yr * x[:, None], window)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                covariance = (sxy - sx * sy / n) / (n - cov_ddof)
+                variance = (sxx - sx * sx / n) / (n - var_ddof)
+                beta = covariance / variance
+            threshold = min_periods if r == 0 else min_regime_days + 1
+            usable = (variance > 0) & (n >= threshold) & (n_total >= min_periods)
+            beta = np.where(usable, beta, np.nan)
+            beta[:window - 1] = np.nan
+            panels[name][:, lo:hi] = beta
+
+    return panels
+
+
+def rolling_betas_from_matrix(matrix, window=252, symbols=None, **kwargs):
+    """
+    Rolling betas for the stocks of a ReturnsMatrix as time x symbol panels.
+
+    Args:
+        matrix (ReturnsMatrix): Returns matrix with a market column
+        window (int): Window length in trading days
+        symbols (list, optional): Stocks to include (default: all but the market)
+        **kwargs: Passed to rolling_betas
+
+    Returns:
+        dict: 'traditional_beta', 'positive_beta', 'negative_beta' -> DataFrame (dates x symbols)
+    """
+    symbols, returns, market, mask = matrix.stock_panel(symbols)
+
+    panels = rolling_betas(returns, market, window, mask=mask, **kwargs)
+    return {name: pd.DataFrame(panel, index=matrix.dates, columns=symbols)
+            for name, panel in panels.items()}
+
+
+class MomentPrefixSums:
+    """
+    Cumulative per-regime moments of every symbol against the market.
+
+    prefix[t] holds the RegimeMoments sums (n, Sx, Sy, Sxx, Sxy, Syy) of
+    rows 0 .. t-1, so the moments of rows lo .. hi-1 are prefix[hi] -
+    prefix[lo]: two row reads per query whatever the range length. Memory
+    is (dates + 1) x 6 x symbols x regimes float64 values, about 180 MB for
+    500 symbols over 10 years.
+
+    Args:
+        returns (numpy.ndarray): dates x symbols returns (NaN where missing)
+        market (numpy.ndarray): Market returns for the same dates (NaN where missing)
+        dates (pandas.DatetimeIndex): Row dates
+        symbols (list): Column names
+        mask (numpy.ndarray, optional): dates x symbols validity mask
+        regimes (numpy.ndarray, optional): dates x regimes masks (default: sign split)
+        regime_names (tuple, optional): Names of the regime columns
+    """
+
+    def __init__(self, returns, market, dates, symbols, mask=None, regimes=None, regime_names=None):
+        returns = returns[:, None] if np.ndim(returns) == 1 else returns
+        market = np.asarray(market, dtype=np.float64)
+        if regimes is None:
+            regimes = sign_regimes(market)
+            regime_names = regime_names or SIGN_REGIMES
+        regimes = np.asarray(regimes, dtype=np.float64)
+        regimes = regimes * np.isfinite(market)[:, None]
+
+        self.dates = pd.DatetimeIndex(dates)
+        self.symbols = list(symbols)
+        self.regimes = tuple(regime_names) if regime_names is not None else None
+
+        valid = np.isfinite(np.asarray(returns, dtype=np.float64))
+        if mask is not None:
+            valid &= np.asarray(mask, dtype=bool)
+        y = np.where(valid, returns, 0.0)
+        x = np.where(np.isfinite(market), market, 0.0)[:, None, None]
+        w = valid[:, :, None] * regimes[:, None, :]
+
+        n_dates, n_symbols = y.shape
+        prefix = np.zeros((n_dates + 1, 6, n_symbols, regimes.shape[1]))
+        yw = y[:, :, None] * w
+        prefix[1:, 0] = w
+        prefix[1:, 1] = w * x
+        prefix[1:, 2] = yw
+        prefix[1:, 3] = w * x * x
+        prefix[1:, 4] = yw * x
+        prefix[1:, 5] = yw * y[:, :, None]
+        np.cumsum(prefix, axis=0, out=prefix)
+        self.prefix = prefix
+
+    @classmethod
+    def from_matrix(cls, matrix, symbols=None, **kwargs):
+        """Prefix sums for the stocks of a ReturnsMatrix against its market column."""
+        symbols, returns, market, mask = matrix.stock_panel(symbols)
+        return cls(returns, market, matrix.dates, symbols, mask=mask, **kwargs)
+
+    @classmethod
+    def from_closes(cls, closes, market_close, **kwargs):
+        """
+        Prefix sums from close prices, e.g. bars loaded once for the full sample.
+
+        Args:
+            closes (dict): symbol -> close Series (or bars DataFrame with 'close')
+            market_close: Market close Series (or bars DataFrame)
+        """
+        def returns_of(close):
+            if isinstance(close, pd.DataFrame):
+                close = close['close'] if 'close' in close.columns else close.squeeze('columns')
+            return _close_returns(close)
+
+        market = returns_of(market_close)
+        stock_returns = {symbol: returns_of(close) for symbol, close in closes.items()}
+        stock_returns = {s: r for s, r in stock_returns.items() if r is not None}
+        frame = pd.DataFrame(stock_returns).reindex(market.index)
+        return cls(frame.to_numpy(dtype=np.float64), market.to_numpy(), market.index,
+                   list(frame.columns), **kwargs)
+
+    def rows(self, start_date=None, end_date=None):
+        """Row range [lo, hi) of the dates in [start_date, end_date)."""
+        lo = 0 if start_date is None else int(self.dates.searchsorted(pd.Timestamp(start_date), 'left'))
+        hi = len(self.dates) if end_date is None else int(self.dates.searchsorted(pd.Timestamp(end_date), 'left'))
+        return lo, max(lo, hi)
+
+    def moments(self, start_date=None, end_date=None):
+        """
+        Moments over [start_date, end_date) (end exclusive, like the downloads).
+
+        Returns:
+            RegimeMoments: Sums with shape (symbols, regimes)
+        """
+        lo, hi = self.rows(start_date, end_date)
+        return RegimeMoments.from_array(self.prefix[hi] - self.prefix[lo], self.regimes)
+
+    def moments_excluding(self, start_date, end_date):
+        """Moments of the full sample with [start_date, end_date) removed."""
+        return RegimeMoments.from_array(self.prefix[-1], self.regimes) - self.moments(start_date, end_date)
+
+    def betas(self, start_date=None, end_date=None, exclude=None, min_observations=MIN_OBSERVATIONS,
+              min_regime_days=MIN_REGIME_DAYS, ddof='legacy'):
+        """
+        Traditional / positive / negative betas over a range.
+
+        Args:
+            start_date (str, optional): Inclusive start (default: first date)
+            end_date (str, optional): Exclusive end (default: after the last date)
+            exclude (tuple, optional): (start, end) range removed from the full
+                sample instead; start_date / end_date are then ignored
+            ddof (str or tuple): Policy from beta_engine.DDOF_POLICIES
+
+        Returns:
+            pandas.DataFrame: One row per symbol, columns as compute_betas plus
+                'correlation' (NaN where calculate_beta_clean would give None)
+        """
+        if exclude is not None:
+            moments = self.moments_excluding(*exclude)
+        else:
+            moments = self.moments(start_date, end_date)
+        betas = betas_from_moments(moments, min_observations, min_regime_days, ddof)
+        betas['correlation'] = moments.correlation()[:, 0]
+        return pd.DataFrame(betas, index=self.symbols)
+
+    def betas_for_ranges(self, ranges, **kwargs):
+        """
+        Betas for several ranges at once.
+
+        Args:
+            ranges (list): (start, end) or (start, end, label) tuples
+
+        Returns:
+            dict: label (or (start, end)) -> DataFrame from betas()
+        """
+        results = {}
+        for entry in ranges:
+            start_date, end_date = entry[0], entry[1]
+            label = entry[2] if len(entry) > 2 else (start_date, end_date)
+            results[label] = self.betas(start_date, end_date, **kwargs)
+        return results
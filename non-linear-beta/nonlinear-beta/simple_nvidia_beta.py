@@ -4,14 +4,14 @@ Simple working NVIDIA beta calculation to show the correct result.
 """
 
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 
 print("NVIDIA BETA - SIMPLE WORKING CALCULATION")
 print("="*50)
 
 # Download data - keep it simple
-nvda = yf.download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
-spy = yf.download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+nvda = download('NVDA', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
+spy = download('SPY', start='2015-01-01', end='2025-01-01', progress=False, auto_adjust=False)
 
 # Get close prices as simple arrays
 nvda_prices = nvda['Close'].dropna().values
@@ -11,18 +11,45 @@ import numpy as np
 import pandas as pd
 
 from datetime import datetime, timedelta
-import time
 from scipy import stats
 import warnings
 import concurrent.futures
-import threading
 from queue import Queue
-import pickle
 import os
 warnings.filterwarnings('ignore')
 
-from getBars import getBars
+from getBars import getBars, getBarsMany, getBenchmarkBars
+from rate_limiter import TokenBucketRateLimiter, AdaptiveConcurrency, RequestScheduler
 from helperMethods import getTradingDays, calculateDrift
+from checkpoint import CheckpointLog
+from ewma_beta import EWMA_BETA_TYPES, EWMA_PATH_PATH, EWMA_STATE_PATH, EWMABetaState
+from hmm_regimes import hmm_betas_from_matrix
+from lagged_beta import lagged_betas_from_matrix
+from robust_beta import robust_betas_from_matrix
+from returns_matrix import DEFAULT_MATRIX_PATH, write_returns_matrix
+from beta_engine import (RegimeMoments, beta_cube_from_matrix, betas_from_matrix, betas_from_moments,
+                         path_frame, to_result_dicts)
+
+# Checkpoint log of the symbols fetched so far, next to this module
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sp500_progress')
+
+# Sector SPDR ETF for each GICS sector, for sector-relative betas
+SECTOR_ETFS = {
+    'Communication Services': 'XLC',
+    'Consumer Discretionary': 'XLY',
+    'Consumer Staples': 'XLP',
+    'Energy': 'XLE',
+    'Financials': 'XLF',
+    'Health Care': 'XLV',
+    'Industrials': 'XLI',
+    'Information Technology': 'XLK',
+    'Materials': 'XLB',
+    'Real Estate': 'XLRE',
+    'Utilities': 'XLU'
+}
+
+# Benchmarks stored next to SPY in the returns matrix
+BENCHMARK_SYMBOLS = ['QQQ'] + sorted(set(SECTOR_ETFS.values()))
 
 def get_sp500_from_wikipedia():
     """
@@ -73,233 +100,247 @@ def calculate_beta_clean(stock_data, market_data):
     stock_aligned = stock_returns.loc[common_dates].values
     market_aligned = market_returns.loc[common_dates].values
     
-    # Ensure we have valid data
-    if len(stock_aligned) != len(market_aligned) or np.any(np.isnan(stock_aligned)) or np.any(np.isnan(market_aligned)):
+    return calculate_beta_aligned(stock_aligned, market_aligned)
+
+def calculate_beta_aligned(stock_aligned, market_aligned):
+    """
+    Betas from stock and market returns already aligned on common dates
+    (e.g. ReturnsMatrix.aligned); same results as calculate_beta_clean.
+    """
+    if len(stock_aligned) < 50:
         return None
     
-    # Calculate traditional beta using numpy
-    covariance = np.cov(stock_aligned, market_aligned)[0, 1]
-    market_variance = np.var(market_aligned)
-    
-    if market_variance == 0:
+    # Ensure we have valid data
+    if len(stock_aligned) != len(market_aligned) or np.any(np.isnan(stock_aligned)) or np.any(np.isnan(market_aligned)):
         return None
     
-    traditional_beta = covariance / market_variance
-    
-    # Split by positive/negative market days
-    positive_mask = market_aligned > 0
-    negative_mask = market_aligned < 0
-    
-    positive_days_count = np.sum(positive_mask)
-    negative_days_count = np.sum(negative_mask)
-    
-    # Calculate positive beta
-    positive_beta = None
-    if positive_days_count > 20:
-        stock_pos = stock_aligned[positive_mask]
-        market_pos = market_aligned[positive_mask]
-        pos_covariance = np.cov(stock_pos, market_pos)[0, 1]
-        pos_market_variance = np.var(market_pos)
-        if pos_market_variance > 0:
-            positive_beta = pos_covariance / pos_market_variance
-    
-    # Calculate negative beta
-    negative_beta = None
-    if negative_days_count > 20:
-        stock_neg = stock_aligned[negative_mask]
-        market_neg = market_aligned[negative_mask]
-        neg_covariance = np.cov(stock_neg, market_neg)[0, 1]
-        neg_market_variance = np.var(market_neg)
-        if neg_market_variance > 0:
-            negative_beta = neg_covariance / neg_market_variance
-    
-    # Calculate beta ratio
-    if positive_beta is not None and negative_beta is not None and negative_beta != 0:
-        beta_ratio = positive_beta / negative_beta
-    else:
-        beta_ratio = None
-    
-    return {
-        'traditional_beta': traditional_beta,
-        'positive_beta': positive_beta,
-        'negative_beta': negative_beta,
-        'beta_ratio': beta_ratio,
-        'data_points': len(common_dates),
-        'positive_days': positive_days_count,
-        'negative_days': negative_days_count
-    }
-
-class OptimizedRateLimiter:
-    """Optimized rate limiter with better batching."""
-    def __init__(self, max_calls=200, time_window=60):
-        self.max_calls = max_calls
-        self.time_window = time_window
-        self.calls = []
-        self.lock = threading.Lock()
-        self.last_call_time = 0
-    
-    def wait_if_needed(self):
-        """Wait if we've hit the rate limit with better timing."""
-        with self.lock:
-            now = time.time()
-            
-            # Remove calls older than time window
-            self.calls = [call_time for call_time in self.calls if now - call_time < self.time_window]
-            
-            # If we're at the limit, wait
-            if len(self.calls) >= self.max_calls:
-                sleep_time = self.time_window - (now - self.calls[0]) + 0.1
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                    return self.wait_if_needed()
-            
-            # Add current call
-            self.calls.append(now)
-            self.last_call_time = now
-
-def fetch_single_stock(symbol, start_date, end_date, rate_limiter):
-    """Fetch data for a single stock with rate limiting."""
-    rate_limiter.wait_if_needed()
-    
-    try:
-        data = getBars(symbol, start_date, end_date)
-        if data is not None and len(data) > 0:
-            return symbol, data
-        else:
-            return symbol, None
-    except Exception as e:
-        print(f"Error fetching {symbol}: {e}")
-        return symbol, None
+    # One pass over the data accumulating n, Sx, Sy, Sxx, Sxy, Syy for all,
+    # positive and negative market days (see beta_engine.RegimeMoments); the
+    # legacy ddof policy keeps the np.cov (ddof=1) / np.var (ddof=0) betas
+    moments = RegimeMoments.from_returns(np.asarray(stock_aligned), np.asarray(market_aligned))
+    results = to_result_dicts(['stock'], betas_from_moments(moments))
+    return results.get('stock')
 
 class SP500OptimizedAnalyzer:
     def __init__(self):
         self.results = {}
         self.market_data = None
-        self.rate_limiter = OptimizedRateLimiter(max_calls=200, time_window=60)
-        self.progress_file = 'sp500_progress.pkl'
+        self.returns_matrix = None
+        self.ewma_state = None
+        self.ewma_path = None
+        self.rate_limiter = TokenBucketRateLimiter(max_calls=200, time_window=60)
+        self.scheduler = RequestScheduler(self.rate_limiter, AdaptiveConcurrency(initial=2, maximum=16))
+        self.checkpoint = CheckpointLog(CHECKPOINT_DIR)
         
     def load_progress(self):
-        """Load progress from file if it exists."""
-        if os.path.exists(self.progress_file):
+        """
+        Symbols completed by an interrupted run, from the checkpoint log.
+        
+        Returns:
+            set: Completed symbols (empty if there is no checkpoint)
+        """
+        if self.checkpoint.exists():
             try:
-                with open(self.progress_file, 'rb') as f:
-                    progress = pickle.load(f)
-                    self.results = progress.get('results', {})
-                    self.market_data = progress.get('market_data', None)
-                    print(f"Loaded progress: {len(self.results)} stocks already fetched")
-                    return True
+                done = set(self.checkpoint.index())
+                print(f"Loaded progress: {len(done)} stocks already fetched")
+                return done
             except Exception as e:
                 print(f"Error loading progress: {e}")
-        return False
+        return set()
     
-    def save_progress(self):
-        """Save progress to file."""
+    def save_progress(self, symbol, data):
+        """
+        Mark one symbol as fetched. Only a small marker is logged: the bars
+        themselves are already persisted by the bar store.
+        """
         try:
-            progress = {
-                'results': self.results,
-                'market_data': self.market_data
-            }
-            with open(self.progress_file, 'wb') as f:
-                pickle.dump(progress, f)
+            self.checkpoint.append(symbol, {'rows': len(data), 'last_date': data.index[-1]})
         except Exception as e:
             print(f"Error saving progress: {e}")
     
-    def fetch_data_optimized(self, symbols, start_date='2015-01-01', end_date=None, max_workers=3):
-        """Fetch data for all symbols with optimized rate limiting."""
+    def fetch_data_optimized(self, symbols, start_date='2015-01-01', end_date=None, max_workers=16):
+        """Fetch data for all symbols with adaptive rate limiting (max_workers caps concurrency)."""
         if end_date is None:
             end_date = datetime.now().strftime('%Y-%m-%d')
         
         # Load existing progress
-        self.load_progress()
+        done = self.load_progress() & set(symbols)
         
         # Filter out already fetched symbols
-        remaining_symbols = [s for s in symbols if s not in self.results]
+        remaining_symbols = [s for s in symbols if s not in done]
         
-        if not remaining_symbols:
+        # Market data (SPY); read back from the bar store on a resumed run
+        print("Fetching market data (SPY)...")
+        self.rate_limiter.wait_if_needed()
+        self.market_data = getBars('SPY', start_date, end_date)
+        if self.market_data is None:
+            print("Failed to fetch market data")
+            return False
+        print(f"✓ Market data: {len(self.market_data)} days")
+        
+        # Multi-ticker requests run concurrently under the scheduler: the
+        # token bucket caps the request rate and the AIMD limit (at most
+        # max_workers) backs off on throttling or empty responses
+        batch_size = 100
+        self.scheduler.concurrency.set_maximum(max_workers)
+        
+        if remaining_symbols:
+            print(f"Fetching data for {len(remaining_symbols)} remaining S&P 500 companies...")
+        else:
             print("All symbols already fetched!")
-            return True
-            
-        print(f"Fetching data for {len(remaining_symbols)} remaining S&P 500 companies...")
         
-        # Fetch market data (SPY) if not already loaded
-        if self.market_data is None:
-            print("Fetching market data (SPY)...")
-            self.rate_limiter.wait_if_needed()
-            self.market_data = getBars('SPY', start_date, end_date)
-            if self.market_data is None:
-                print("Failed to fetch market data")
-                return False
-            print(f"✓ Market data: {len(self.market_data)} days")
-        
-        # Process in smaller batches with 5-second delays
-        batch_size = 20  # Smaller batches
-        total_batches = (len(remaining_symbols) + batch_size - 1) // batch_size
-        
-        for batch_num in range(total_batches):
-            start_idx = batch_num * batch_size
-            end_idx = min(start_idx + batch_size, len(remaining_symbols))
-            batch_symbols = remaining_symbols[start_idx:end_idx]
-            
-            print(f"\nProcessing batch {batch_num + 1}/{total_batches} ({len(batch_symbols)} symbols)")
-            
-            # Fetch data for batch in parallel
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_symbol = {
-                    executor.submit(fetch_single_stock, symbol, start_date, end_date, self.rate_limiter): symbol
-                    for symbol in batch_symbols
-                }
-                
-                # Collect results as they complete
-                batch_completed = 0
-                for future in concurrent.futures.as_completed(future_to_symbol):
-                    symbol, data = future.result()
-                    if data is not None:
+        # One getBarsMany call per batch, all in flight together, so every
+        # batch is checkpointed as soon as it lands
+        def fetch(batch):
+            return getBarsMany(batch, start_date, end_date, batch_size=batch_size, scheduler=self.scheduler)
+        
+        batches = [remaining_symbols[i:i + batch_size] for i in range(0, len(remaining_symbols), batch_size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(batches), max_workers))) as executor:
+            futures = {executor.submit(fetch, batch): batch for batch in batches}
+            for future in concurrent.futures.as_completed(futures):
+                batch = futures[future]
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    print(f"Error fetching batch starting {batch[0]}: {e}")
+                    continue
+                for symbol, data in fetched.items():
+                    if data is not None and len(data) > 0:
                         self.results[symbol] = data
-                        batch_completed += 1
-                    
-                    # Save progress every 5 symbols
-                    if batch_completed % 5 == 0:
-                        self.save_progress()
-                        print(f"  ✓ Batch progress: {batch_completed}/{len(batch_symbols)}")
-            
-            print(f"  ✓ Batch {batch_num + 1} complete: {batch_completed}/{len(batch_symbols)} symbols fetched")
-            
-            # 1-second delay between batches
-            if batch_num < total_batches - 1:  # Don't delay after the last batch
-                print("  Waiting 1 second before next batch...")
-                time.sleep(1)
+                        self.save_progress(symbol, data)
+                print(f"  ✓ Fetched {len(fetched)}/{len(batch)} symbols "
+                      f"(concurrency limit {self.scheduler.concurrency.limit:.1f})")
+        
+        # Symbols finished by an interrupted run come back from the bar store
+        if done:
+            self.results.update(getBarsMany(sorted(done), start_date, end_date,
+                                            batch_size=batch_size, scheduler=self.scheduler))
         
         print(f"\nData collection complete. Market: {len(self.market_data)} days, Stocks: {len(self.results)}")
         
-        # Clean up progress file
-        if os.path.exists(self.progress_file):
-            os.remove(self.progress_file)
+        # Clean up checkpoint log
+        self.checkpoint.clear()
         
         return True
     
-    def calculate_betas(self):
-        """Calculate traditional and nonlinear betas for all stocks."""
+    def build_returns_matrix(self, path=DEFAULT_MATRIX_PATH, dtype='float64', benchmarks=BENCHMARK_SYMBOLS):
+        """
+        Write the fetched closes to an aligned, memory-mapped returns matrix
+        (see returns_matrix.py) and release the OHLCV frames.
+        
+        Args:
+            path (str): Output file
+            dtype (str): 'float64' or 'float32'
+            benchmarks (list): Benchmark ETFs stored next to SPY for
+                calculate_benchmark_betas
+        
+        Returns:
+            ReturnsMatrix: The matrix, also kept as self.returns_matrix
+        """
         if not self.results or self.market_data is None:
             print("No data available. Run fetch_data_optimized() first.")
-            return
-            
-        print("\nCalculating beta relationships...")
+            return None
         
-        beta_results = {}
+        closes = {symbol: data['close'] for symbol, data in self.results.items()}
         
-        for symbol, data in self.results.items():
-            if len(data) < 100:
+        start_date = self.market_data.index[0].strftime('%Y-%m-%d')
+        end_date = (self.market_data.index[-1] + timedelta(days=1)).strftime('%Y-%m-%d')
+        for benchmark in benchmarks:
+            benchmark_data = getBenchmarkBars(benchmark, start_date, end_date)
+            if benchmark_data is None:
+                print(f"✗ No data for benchmark {benchmark}")
                 continue
-                
-            # Calculate betas using clean approach
-            results = calculate_beta_clean(data, self.market_data)
+            closes[benchmark] = benchmark_data['close']
+        
+        closes['SPY'] = self.market_data['close']
+        self.returns_matrix = write_returns_matrix(closes, path, market_symbol='SPY', dtype=dtype,
+                                                   benchmark_symbols=benchmarks)
+        
+        # Only closes are ever used; drop the full frames
+        self.results = {}
+        self.market_data = None
+        return self.returns_matrix
+    
+    def calculate_betas(self):
+        """Calculate traditional and nonlinear betas for all stocks."""
+        if self.returns_matrix is None and self.build_returns_matrix() is None:
+            return
             
-            if results is not None:
-                beta_results[symbol] = results
-                print(f"{symbol}: Trad β={results['traditional_beta']:.3f}, Pos β={results['positive_beta']:.3f}, Neg β={results['negative_beta']:.3f}, Ratio={results['beta_ratio']:.3f}")
+        print("\nCalculating beta relationships...")
+        
+        # All symbols at once with masked matrix products (see beta_engine.py);
+        # same results as calculate_beta_clean, symbols with < 100 bars skipped
+        beta_results = betas_from_matrix(self.returns_matrix, min_bars=100)
+        
+        # Dimson / Scholes-Williams betas (one lead, one lag) against the
+        # non-synchronous trading bias, in the same pass over the matrix
+        lagged = lagged_betas_from_matrix(self.returns_matrix, symbols=list(beta_results))
+        # Huber / Theil-Sen betas, insensitive to single crash days
+        robust = robust_betas_from_matrix(self.returns_matrix, symbols=list(beta_results))
+        # Exponentially weighted betas; the filter state is kept for daily updates
+        self.ewma_state, self.ewma_path = EWMABetaState.from_matrix(
+            self.returns_matrix, symbols=list(beta_results), path=True)
+        ewma = self.ewma_state.to_frame()
+        # Betas weighted by the probabilities of a 2-state HMM fitted to the market
+        hmm, fit = hmm_betas_from_matrix(self.returns_matrix, n_states=2, symbols=list(beta_results))
+        hmm_columns = [f'{state}_beta' for state in fit['states']]
+        if not fit['converged']:
+            print(f"Warning: HMM fit did not converge in {fit['iterations']} EM iterations")
+        for state, mean, variance in zip(fit['states'], fit['means'], fit['variances']):
+            print(f"HMM {state} state: mean {mean:.5f}, daily vol {np.sqrt(variance):.4f}, "
+                  f"{fit['probabilities'][:, fit['states'].index(state)].sum():.0f} expected days")
+        for symbol, results in beta_results.items():
+            results.update(lagged[symbol])
+            results.update(robust[symbol])
+            results.update({name: None if pd.isna(ewma.at[symbol, name]) else float(ewma.at[symbol, name])
+                            for name in EWMA_BETA_TYPES})
+            results.update({f'hmm_{name}': None if pd.isna(hmm.at[symbol, name]) else float(hmm.at[symbol, name])
+                            for name in hmm_columns})
+        
+        for symbol, results in beta_results.items():
+            print(f"{symbol}: Trad β={results['traditional_beta']:.3f}, Pos β={results['positive_beta']:.3f}, Neg β={results['negative_beta']:.3f}, Ratio={results['beta_ratio']:.3f}")
         
         return beta_results
     
+    def calculate_benchmark_betas(self, sector_map):
+        """
+        Traditional, positive and negative betas of every stock against SPY,
+        QQQ and its own sector ETF.
+        
+        All benchmarks come out of one pass over the stock returns (see
+        beta_engine.compute_beta_cube); each one only adds columns to the
+        same matrix products.
+        
+        Returns:
+            pandas.DataFrame: One row per stock
+        """
+        if self.returns_matrix is None and self.build_returns_matrix() is None:
+            return None
+        
+        print("\nCalculating benchmark-relative betas...")
+        cube = beta_cube_from_matrix(self.returns_matrix, min_bars=100)
+        beta_types = ['traditional_beta', 'positive_beta', 'negative_beta']
+        wide = cube[beta_types].unstack('benchmark')
+        benchmarks = set(wide.columns.get_level_values('benchmark'))
+        
+        df = pd.DataFrame(index=wide.index)
+        df['sector'] = df.index.map(lambda s: sector_map.get(s, 'Unknown'))
+        for benchmark in ['SPY', 'QQQ']:
+            for beta_type in beta_types:
+                if benchmark in benchmarks:
+                    df[f'{benchmark.lower()}_{beta_type}'] = wide[(beta_type, benchmark)]
+        
+        df['sector_etf'] = df['sector'].map(SECTOR_ETFS)
+        for beta_type in beta_types:
+            df[f'sector_{beta_type}'] = [
+                wide.at[symbol, (beta_type, etf)] if etf in benchmarks else np.nan
+                for symbol, etf in zip(df.index, df['sector_etf'])
+            ]
+        
+        print(f"Benchmarks: {', '.join(sorted(benchmarks))}")
+        print(f"Stocks with sector-relative betas: {df['sector_traditional_beta'].notna().sum()}")
+        return df
+    
     def create_sector_beta_charts(self, beta_results, sector_map):
         """Create bar charts showing positive vs negative betas by sector."""
         if not beta_results:
@@ -531,7 +572,7 @@ def main():
         return
     
     # Fetch data with optimized approach
-    if not analyzer.fetch_data_optimized(symbols, max_workers=3):
+    if not analyzer.fetch_data_optimized(symbols):
         print("Failed to fetch data")
         return
     
@@ -555,6 +596,17 @@ def main():
     df_sorted.to_csv('sp500_optimized_results.csv')
     print(f"\nOptimized results saved to 'sp500_optimized_results.csv'")
     
+    # Full EWMA beta path and the state for incremental updates (ewma_beta.py)
+    path_frame(analyzer.ewma_path).to_parquet(EWMA_PATH_PATH)
+    analyzer.ewma_state.save(EWMA_STATE_PATH)
+    print(f"EWMA beta path saved to '{EWMA_PATH_PATH}'")
+    
+    # SPY-, QQQ- and sector-ETF-relative betas
+    benchmark_df = analyzer.calculate_benchmark_betas(sector_map)
+    if benchmark_df is not None:
+        benchmark_df.to_csv('sp500_benchmark_betas.csv')
+        print(f"Benchmark-relative betas saved to 'sp500_benchmark_betas.csv'")
+    
     return analyzer
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Parity checks for the vectorized beta engines on SyntheticProvider data.
+
+Every engine is compared with a per-symbol reference: the legacy np.cov /
+np.var calculate_beta_clean (copied below as it was before the engines
+replaced it), a direct slice of the window, a linregress or a least-squares
+fit. The data needs no network, so the checks run anywhere:
+
+    python -m pytest -q test_beta_engines.py
+    python test_beta_engines.py
+"""
+
+import functools
+import os
+import sys
+import tempfile
+
+import numpy as np
+from scipy import stats
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bar_providers import SyntheticProvider
+from beta_engine import RegimeMoments, betas_from_matrix, compute_betas
+from ewma_beta import EWMABetaState
+from lagged_beta import lagged_betas_from_matrix
+from period_returns import period_betas
+from regime_masks import RegimeMasks, regime_betas
+from returns_matrix import write_returns_matrix
+from rolling_beta import MomentPrefixSums, rolling_betas_from_matrix
+from sp500_optimized_analysis import calculate_beta_clean
+
+START_DATE = '2016-01-01'
+END_DATE = '2020-01-01'
+N_SYMBOLS = 30
+TOLERANCE = 1e-10
+
+
+def legacy_calculate_beta_clean(stock_data, market_data):
+    """calculate_beta_clean as it was before the vectorized engines (reference only)."""
+    if stock_data is None or market_data is None:
+        return None
+
+    stock_returns = stock_data['close'].pct_change().dropna().squeeze()
+    market_returns = market_data['close'].pct_change().dropna().squeeze()
+    common_dates = stock_returns.index.intersection(market_returns.index)
+    if len(common_dates) < 50:
+        return None
+
+    stock_aligned = stock_returns.loc[common_dates].values
+    market_aligned = market_returns.loc[common_dates].values
+    if len(stock_aligned) != len(market_aligned) or np.any(np.isnan(stock_aligned)) or np.any(np.isnan(market_aligned)):
+        return None
+
+    covariance = np.cov(stock_aligned, market_aligned)[0, 1]
+    market_variance = np.var(market_aligned)
+    if market_variance == 0:
+        return None
+    traditional_beta = covariance / market_variance
+
+    def regime_beta(regime):
+        if np.sum(regime) <= 20:
+            return None
+        regime_variance = np.var(market_aligned[regime])
+        if regime_variance <= 0:
+            return None
+        return np.cov(stock_aligned[regime], market_aligned[regime])[0, 1] / regime_variance
+
+    positive_beta = regime_beta(market_aligned > 0)
+    negative_beta = regime_beta(market_aligned < 0)
+    if positive_beta is not None and negative_beta is not None and negative_beta != 0:
+        beta_ratio = positive_beta / negative_beta
+    else:
+        beta_ratio = None
+
+    return {
+        'traditional_beta': traditional_beta,
+        'positive_beta': positive_beta,
+        'negative_beta': negative_beta,
+        'beta_ratio': beta_ratio,
+        'data_points': len(common_dates),
+        'positive_days': np.sum(market_aligned > 0),
+        'negative_days': np.sum(market_aligned < 0)
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_data():
+    """
+    Bars of N_SYMBOLS synthetic stocks plus SPY and their returns matrix.
+
+    Late listings and missing bars are more frequent than the defaults so
+    that the alignment paths are exercised; the last stock keeps only 40
+    bars, too few for any beta.
+
+    Returns:
+        tuple: (symbol -> bars dict, market bars, ReturnsMatrix)
+    """
+    provider = SyntheticProvider(seed=11, listing_rate=0.3, missing_rate=0.01)
+    symbols = [f"S{i:02d}" for i in range(N_SYMBOLS)]
+    bars = {symbol: provider.fetch(symbol, START_DATE, END_DATE) for symbol in symbols}
+    bars[symbols[-1]] = bars[symbols[-1]].tail(40)
+    market_bars = provider.fetch('SPY', START_DATE, END_DATE)
+
+    directory = tempfile.mkdtemp(prefix='beta_engines_')
+    closes = {symbol: df for symbol, df in bars.items() if df is not None and len(df)}
+    closes['SPY'] = market_bars
+    matrix = write_returns_matrix(closes, os.path.join(directory, 'returns_matrix.bin'), market_symbol='SPY')
+    return bars, market_bars, matrix
+
+
+def assert_result_close(result, expected, symbol):
+    """Compare two calculate_beta_clean dicts (None where a beta is undefined)."""
+    assert (result is None) == (expected is None), symbol
+    if expected is None:
+        return
+    for key, value in expected.items():
+        if value is None:
+            assert result[key] is None, (symbol, key)
+        else:
+            assert result[key] is not None, (symbol, key)
+            assert abs(result[key] - value) <= TOLERANCE * max(1.0, abs(value)), (symbol, key, result[key], value)
+
+
+def test_calculate_beta_clean_matches_legacy():
+    bars, market_bars, _ = synthetic_data()
+    for symbol, df in bars.items():
+        assert_result_close(calculate_beta_clean(df, market_bars),
+                            legacy_calculate_beta_clean(df, market_bars), symbol)
+
+
+def test_betas_from_matrix_matches_legacy():
+    bars, market_bars, matrix = synthetic_data()
+    results = betas_from_matrix(matrix, min_bars=0)
+    for symbol, df in bars.items():
+        assert_result_close(results.get(symbol), legacy_calculate_beta_clean(df, market_bars), symbol)
+
+
+def test_compute_betas_single_series_matches_legacy():
+    bars, market_bars, matrix = synthetic_data()
+    symbol = matrix.stock_symbols()[0]
+    stock, market = matrix.aligned(symbol)
+    betas = compute_betas(stock, market)
+    expected = legacy_calculate_beta_clean(bars[symbol], market_bars)
+    for key in ('traditional_beta', 'positive_beta', 'negative_beta'):
+        assert abs(betas[key][0] - expected[key]) <= TOLERANCE
+
+
+def test_regime_moments_merge_equals_full_sample():
+    _, _, matrix = synthetic_data()
+    _, returns, market, mask = matrix.stock_panel()
+    half = len(market) // 2
+    full = RegimeMoments.from_returns(returns, market, mask=mask)
+    first = RegimeMoments.from_returns(returns[:half], market[:half], mask=mask[:half])
+    second = RegimeMoments.from_returns(returns[half:], market[half:], mask=mask[half:])
+
+    merged = first + second
+    np.testing.assert_array_equal(merged.n, full.n)
+    np.testing.assert_allclose(merged.beta(), full.beta(), rtol=TOLERANCE, atol=TOLERANCE)
+    np.testing.assert_allclose((full - first).beta(), second.beta(), rtol=1e-8, atol=1e-8)
+
+
+def test_rolling_betas_match_window_slices():
+    _, _, matrix = synthetic_data()
+    window = 252
+    panels = rolling_betas_from_matrix(matrix, window=window)
+    market = matrix.market_returns()
+
+    for row in (window - 1, len(matrix.dates) // 2, len(matrix.dates) - 1):
+        _, returns, _, mask = matrix.stock_panel(rows=slice(row - window + 1, row + 1))
+        expected = compute_betas(returns, market[row - window + 1:row + 1], mask)
+        for name, panel in panels.items():
+            np.testing.assert_allclose(panel.iloc[row].to_numpy(), expected[name],
+                                       rtol=1e-8, atol=1e-8, err_msg=f"{name} row {row}")
+
+
+def test_moment_prefix_sums_match_date_ranges():
+    _, _, matrix = synthetic_data()
+    prefix = MomentPrefixSums.from_matrix(matrix)
+    start, end = matrix.dates[100], matrix.dates[700]
+    rows = (matrix.dates >= start) & (matrix.dates < end)
+    _, returns, market, mask = matrix.stock_panel(rows=rows)
+
+    expected = compute_betas(returns, market, mask)
+    frame = prefix.betas(start, end)
+    for name in ('traditional_beta', 'positive_beta', 'negative_beta'):
+        np.testing.assert_allclose(frame[name].to_numpy(), expected[name], rtol=1e-8, atol=1e-8, err_msg=name)
+
+
+def test_ewma_update_matches_full_rebuild():
+    _, _, matrix = synthetic_data()
+    full, _ = EWMABetaState.from_matrix(matrix)
+
+    symbols, returns, market, mask = matrix.stock_panel()
+    incremental = EWMABetaState(symbols)
+    split = len(market) - 40
+    incremental.update(returns[:split], market[:split], mask=mask[:split])
+    for row in range(split, len(market)):
+        incremental.update(returns[row], market[row], mask=mask[row:row + 1])
+
+    np.testing.assert_allclose(incremental.betas(), full.betas(), rtol=TOLERANCE, atol=TOLERANCE)
+
+
+def test_ewma_betas_match_weighted_regression():
+    _, _, matrix = synthetic_data()
+    state, _ = EWMABetaState.from_matrix(matrix)
+    symbol = matrix.stock_symbols()[0]
+    j = matrix.stock_symbols().index(symbol)
+
+    _, returns, market, mask = matrix.stock_panel([symbol])
+    valid = mask[:, 0] & np.isfinite(market)
+    age = np.arange(len(market))[::-1]
+    weights = np.where(valid, state.decay ** age, 0.0)
+    x, y = np.where(valid, market, 0.0), np.where(valid, returns[:, 0], 0.0)
+    mean_x, mean_y = np.average(x, weights=weights), np.average(y, weights=weights)
+    expected = (np.sum(weights * (x - mean_x) * (y - mean_y)) / np.sum(weights * (x - mean_x) ** 2))
+
+    assert abs(state.betas()[j, 0] - expected) <= 1e-8
+
+
+def test_period_betas_match_linregress_on_recent_periods():
+    _, _, matrix = synthetic_data()
+    frame = matrix.to_frame()
+    periods = 60
+    betas = period_betas(frame, 'SPY', periods=periods, min_periods=periods)
+
+    market = frame['SPY'].dropna()
+    for symbol in matrix.stock_symbols():
+        stock = frame[symbol].dropna()
+        common = stock.index.intersection(market.index)
+        if len(common) < periods:
+            assert np.isnan(betas.loc[symbol, 'traditional_beta']), symbol
+            continue
+        stock_aligned = stock.loc[common].tail(periods)
+        expected = stats.linregress(market.loc[stock_aligned.index], stock_aligned)
+        assert abs(betas.loc[symbol, 'traditional_beta'] - expected.slope) <= 1e-8, symbol
+        assert abs(betas.loc[symbol, 'correlation'] - expected.rvalue) <= 1e-8, symbol
+        assert betas.loc[symbol, 'start_date'] == stock_aligned.index[0], symbol
+
+
+def test_dimson_betas_match_least_squares():
+    _, _, matrix = synthetic_data()
+    lagged = lagged_betas_from_matrix(matrix)
+    market = matrix.market_returns()
+
+    for symbol in matrix.stock_symbols()[:5]:
+        _, returns, _, mask = matrix.stock_panel([symbol])
+        design = np.column_stack([np.ones(len(market) - 2), market[:-2], market[1:-1], market[2:]])
+        y = np.where(mask[1:-1, 0], returns[1:-1, 0], np.nan)
+        rows = np.isfinite(design).all(axis=1) & np.isfinite(y)
+        coef = np.linalg.lstsq(design[rows], y[rows], rcond=None)[0]
+        assert abs(lagged[symbol]['dimson_beta'] - coef[1:].sum()) <= 1e-8, symbol
+
+
+def test_sign_regime_masks_match_compute_betas():
+    _, _, matrix = synthetic_data()
+    _, returns, market, mask = matrix.stock_panel()
+    masks = RegimeMasks.from_market(market, definitions=('sign',))
+    betas, _ = regime_betas(returns, market, masks, mask=mask)
+    expected = compute_betas(returns, market, mask)
+
+    np.testing.assert_allclose(betas[:, 0], expected['traditional_beta'], rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(betas[:, 1:3], np.column_stack([expected['positive_beta'], expected['negative_beta']]),
+                               rtol=1e-12, atol=1e-12)
+
+
+def run_all():
+    """Run every test_ function of this module, printing one line per check."""
+    failures = 0
+    for name, test in sorted(globals().items()):
+        if not (name.startswith('test_') and callable(test)):
+            continue
+        try:
+            test()
+            print(f"PASS {name}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {name}: {e}")
+    print(f"{failures} failures")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run_all() else 0)
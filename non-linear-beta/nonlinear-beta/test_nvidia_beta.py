@@ -5,8 +5,9 @@ Test script to diagnose and fix NVIDIA beta calculation.
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from bar_providers import download
 from datetime import datetime
+from rolling_beta import MomentPrefixSums
 
 def calculate_beta_corrected(stock_symbol, market_symbol='SPY', start_date='2015-01-01', end_date='2025-01-01'):
     """
@@ -19,10 +20,10 @@ def calculate_beta_corrected(stock_symbol, market_symbol='SPY', start_date='2015
     try:
         # Download data with explicit column handling
         print("Downloading stock data...")
-        stock_data = yf.download(stock_symbol, start=start_date, end=end_date, progress=False)
+        stock_data = download(stock_symbol, start=start_date, end=end_date, progress=False)
         
         print("Downloading market data...")
-        market_data = yf.download(market_symbol, start=start_date, end=end_date, progress=False)
+        market_data = download(market_symbol, start=start_date, end=end_date, progress=False)
         
         # Check if data is empty
         if stock_data.empty or market_data.empty:
@@ -174,15 +175,26 @@ def test_multiple_periods():
     print("NVIDIA BETA ANALYSIS ACROSS TIME PERIODS")
     print("="*80)
     
-    for start, end, label in periods:
+    # Download the full span once; each period is a prefix-sum query
+    first_start = min(start for start, _, _ in periods)
+    last_end = max(end for _, end, _ in periods)
+    stock_data = download('NVDA', start=first_start, end=last_end, progress=False)
+    market_data = download('SPY', start=first_start, end=last_end, progress=False)
+    if stock_data.empty or market_data.empty:
+        print("ERROR: No data downloaded")
+        return
+    price_column = 'Adj Close' if 'Adj Close' in stock_data.columns else 'Close'
+    prefix = MomentPrefixSums.from_closes({'NVDA': stock_data[price_column]}, market_data[price_column])
+    
+    for (start, end, label), results in zip(periods, prefix.betas_for_ranges(periods).values()):
         print(f"\n{label} ({start} to {end}):")
         print("-" * 40)
-        results = calculate_beta_corrected('NVDA', start_date=start, end_date=end)
-        if results:
+        results = results.loc['NVDA']
+        if not np.isnan(results['traditional_beta']):
             print(f"Beta: {results['traditional_beta']:.3f} | "
                   f"Pos: {results['positive_beta']:.3f} | "
                   f"Neg: {results['negative_beta']:.3f} | "
-                  f"Days: {results['data_points']:,}")
+                  f"Days: {int(results['data_points']):,}")
 
 if __name__ == "__main__":
     # Test NVIDIA specifically
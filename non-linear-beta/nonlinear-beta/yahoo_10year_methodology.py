@@ -13,7 +13,7 @@ from datetime import datetime, timedelta
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from getBars import getBars
+from getBars import getBars, getBenchmarkBars
 
 def get_yahoo_style_beta_10y(symbol, market_symbol='^GSPC', years=10):
     """
@@ -32,7 +32,7 @@ def get_yahoo_style_beta_10y(symbol, market_symbol='^GSPC', years=10):
     print(f"Fetching {symbol} data...")
     stock_data = getBars(symbol, start_str, end_str)
     print(f"Fetching market data ({market_symbol})...")
-    market_data = getBars(market_symbol, start_str, end_str)
+    market_data = getBenchmarkBars(market_symbol, start_str, end_str)
     
     if stock_data is None or market_data is None:
         print("❌ Failed to get data")
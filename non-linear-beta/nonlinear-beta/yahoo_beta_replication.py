@@ -13,7 +13,9 @@ from datetime import datetime, timedelta
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from getBars import getBars
+from getBars import getBars, getBenchmarkBars
+from period_returns import period_returns
+from beta_engine import RegimeMoments
 
 def get_yahoo_style_beta(symbol, market_symbol='^GSPC', years=5):
     """
@@ -35,7 +37,7 @@ def get_yahoo_style_beta(symbol, market_symbol='^GSPC', years=5):
     print(f"Fetching {symbol} data...")
     stock_data = getBars(symbol, start_str, end_str)
     print(f"Fetching market data ({market_symbol})...")
-    market_data = getBars(market_symbol, start_str, end_str)
+    market_data = getBenchmarkBars(market_symbol, start_str, end_str)
     
     if stock_data is None or market_data is None:
         print("❌ Failed to get data")
@@ -44,32 +46,26 @@ def get_yahoo_style_beta(symbol, market_symbol='^GSPC', years=5):
     print(f"Stock data: {len(stock_data)} days")
     print(f"Market data: {len(market_data)} days")
     
-    # Method 1: Last trading day of each month (Yahoo style)
-    stock_monthly_eom = stock_data['close'].resample('M').last()
-    market_monthly_eom = market_data['close'].resample('M').last()
-    
-    # Method 2: Business month end
-    stock_monthly_bm = stock_data['close'].resample('BM').last()
-    market_monthly_bm = market_data['close'].resample('BM').last()
-    
-    # Method 3: Calendar month end with forward fill
-    stock_monthly_cal = stock_data['close'].resample('M').last().fillna(method='ffill')
-    market_monthly_cal = market_data['close'].resample('M').last().fillna(method='ffill')
+    # All three month-end conventions from one pass over the daily closes:
+    # last trading day of each month (Yahoo style), business month end and
+    # calendar month end with forward fill
+    monthly = period_returns({'stock': stock_data['close'], 'market': market_data['close']},
+                             ('monthly', 'business_month_end', 'calendar_month_end'))
     
     methods = [
-        ("End of Month", stock_monthly_eom, market_monthly_eom),
-        ("Business Month End", stock_monthly_bm, market_monthly_bm),
-        ("Calendar Month End", stock_monthly_cal, market_monthly_cal)
+        ("End of Month", monthly['monthly']),
+        ("Business Month End", monthly['business_month_end']),
+        ("Calendar Month End", monthly['calendar_month_end'])
     ]
     
     results = []
     
-    for method_name, stock_monthly, market_monthly in methods:
+    for method_name, monthly_returns in methods:
         print(f"\n📊 METHOD: {method_name}")
         
-        # Calculate monthly returns
-        stock_returns = stock_monthly.pct_change().dropna()
-        market_returns = market_monthly.pct_change().dropna()
+        # Monthly returns
+        stock_returns = monthly_returns['stock'].dropna()
+        market_returns = monthly_returns['market'].dropna()
         
         # Align data
         common_dates = stock_returns.index.intersection(market_returns.index)
@@ -142,30 +138,80 @@ def try_different_benchmarks(symbol='NVDA'):
     print(f"🧪 TESTING DIFFERENT BENCHMARKS FOR {symbol}")
     print("="*70)
     
-    all_results = []
+    # Load the stock once and every benchmark once
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=5*365 + 30)  # Add buffer
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    
+    stock_data = getBars(symbol, start_str, end_str)
+    if stock_data is None:
+        print(f"❌ Failed to get data for {symbol}")
+        return []
     
+    closes = {}
     for benchmark in benchmarks:
+        benchmark_data = getBenchmarkBars(benchmark, start_str, end_str)
+        if benchmark_data is None:
+            print(f"   ❌ Failed to get data for {benchmark}")
+            continue
+        closes[benchmark] = benchmark_data['close']
+    if not closes:
+        return []
+    loaded = list(closes)
+    closes[symbol] = stock_data['close']
+    
+    conventions = [
+        ("End of Month", 'monthly'),
+        ("Business Month End", 'business_month_end'),
+        ("Calendar Month End", 'calendar_month_end')
+    ]
+    monthly = period_returns(closes, [c for _, c in conventions])
+    
+    all_results = []
+    for method_name, convention in conventions:
+        returns = monthly[convention]
+        stock = returns[symbol].to_numpy()
+        market = returns[loaded].to_numpy()
+        
+        # Last 60 common months of each benchmark as its own regime weight,
+        # so all benchmarks come out of one pass over the stock returns
+        common = np.isfinite(stock)[:, None] & np.isfinite(market)
+        recent = common & (np.cumsum(common[::-1], axis=0)[::-1] <= 60)
+        moments = RegimeMoments.from_returns(stock, market, regimes=recent[:, :, None])
+        
+        betas = moments.beta('sample')[0, :, 0]
+        correlations = moments.correlation()[0, :, 0]
+        months = moments.n[0, :, 0].astype(int)
+        
+        for k, benchmark in enumerate(loaded):
+            if months[k] < 12:
+                print(f"   ❌ {benchmark} {method_name}: insufficient data ({months[k]} months)")
+                continue
+            dates = returns.index[recent[:, k]]
+            result = {
+                'Method': method_name,
+                # Cov/Var (ddof=1), regression slope and Corr*Vol are the same estimator
+                'Beta_CovVar': betas[k],
+                'Beta_Regression': betas[k],
+                'Beta_CorrVol': betas[k],
+                'R_Squared': correlations[k] ** 2,
+                'Correlation': correlations[k],
+                'Months': months[k],
+                'Start_Date': dates[0],
+                'End_Date': dates[-1],
+                'Benchmark': benchmark
+            }
+            all_results.append(result)
+    
+    for benchmark in loaded:
         print(f"\n📈 BENCHMARK: {benchmark}")
         print("-" * 40)
-        
-        try:
-            results = get_yahoo_style_beta(symbol, benchmark, years=5)
-            if results:
-                for result in results:
-                    result['Benchmark'] = benchmark
-                    all_results.append(result)
-                    
-                    # Find closest to Yahoo's 2.12
-                    betas = [result['Beta_CovVar'], result['Beta_Regression'], result['Beta_CorrVol']]
-                    closest_beta = min(betas, key=lambda x: abs(x - 2.12))
-                    diff = abs(closest_beta - 2.12)
-                    
-                    print(f"   {result['Method']}: Closest = {closest_beta:.3f} (diff: {diff:.3f})")
-            else:
-                print(f"   ❌ Failed to get data for {benchmark}")
-                
-        except Exception as e:
-            print(f"   ❌ Error with {benchmark}: {e}")
+        for result in all_results:
+            if result['Benchmark'] == benchmark:
+                # Distance from Yahoo's 2.12
+                diff = abs(result['Beta_Regression'] - 2.12)
+                print(f"   {result['Method']}: Beta = {result['Beta_Regression']:.3f} (diff: {diff:.3f})")
     
     return all_results
 